@@ -1,17 +1,54 @@
 import os
+import re
 import json
-import time
+import contextvars
 import requests
-from typing import Dict, List, Optional, Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
 # 导入日志系统
 from logger_config_ocr import get_logger
 
+try:
+    from app.utils.translation_memory import translation_memory
+except ImportError:
+    # 独立运行时不使用翻译记忆库
+    translation_memory = None
+
+try:
+    from app.utils.llm_gateway import llm_gateway
+except ImportError:
+    # 独立运行时使用自带的 requests 会话
+    llm_gateway = None
+
+try:
+    from app.utils.llm_rate_limiter import llm_rate_limiter
+except ImportError:
+    # 独立运行时不做服务商级限流
+    llm_rate_limiter = None
+
+# 调用计量与token估算（与限流、请求打包共用同一个估算）
+from app.utils.llm_usage import llm_usage, estimate_tokens
+
+try:
+    from app.utils.json_repair import repair_json
+except ImportError:
+    # 独立运行时只做标准JSON解析
+    repair_json = None
+
 # 获取日志记录器
 logger = get_logger("translator")
 
+# 批量翻译配置：多条OCR文本打包成一个请求，按token预算和条数分批，批次并发执行
+OCR_BATCH_ENABLED = os.getenv("OCR_BATCH_ENABLED", "true").lower() in ("true", "1", "yes", "on")
+OCR_BATCH_MAX_INPUT_TOKENS = int(os.getenv("OCR_BATCH_MAX_INPUT_TOKENS", "1500"))
+OCR_BATCH_MAX_ITEMS = int(os.getenv("OCR_BATCH_MAX_ITEMS", "40"))
+OCR_BATCH_CONCURRENCY = int(os.getenv("OCR_BATCH_CONCURRENCY", "4"))
+
+_CODE_FENCE_RE = re.compile(r'^\s*```(?:json|JSON)?\s*|\s*```\s*$')
+
 
 class QwenTranslator:
     """通义千问翻译器"""
@@ -29,11 +66,19 @@ class QwenTranslator:
             raise ValueError("未找到API密钥，请设置环境变量QWEN_API_KEY或传入api_key参数")
         
         self.target_language = target_language
+        self.model = "qwen2.5-72b-instruct"
         self.base_url = "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation"
-        self.session = self._create_session()
+        # 在app内运行时经大模型网关发送请求，与其他翻译调用共用连接池
+        self.session = self._create_session() if llm_gateway is None else None
         
         logger.info(f"✅ 翻译器初始化完成，目标语言: {target_language}")
     
+    def _post(self, headers, data):
+        """发送翻译请求"""
+        if llm_gateway is not None:
+            return llm_gateway.post(self.base_url, json=data, headers=headers, timeout=(30, 60), max_retries=3)
+        return self.session.post(self.base_url, headers=headers, json=data, timeout=(30, 60))
+    
     def _create_session(self):
         """创建带重试机制的会话"""
         session = requests.Session()
@@ -47,30 +92,21 @@ class QwenTranslator:
         session.mount("https://", adapter)
         return session
     
-    def translate_text(self, text: str, source_language: str = "中文") -> Optional[str]:
-        """
-        翻译单个文本
-        
-        Args:
-            text: 待翻译的文本
-            source_language: 源语言，默认为中文
-            
-        Returns:
-            翻译后的文本，失败返回None
-        """
-        if not text or not text.strip():
-            return ""
-        
-        # 构建翻译提示词
-        prompt = self._build_translation_prompt(text, source_language, self.target_language)
-        
-        headers = {
+    def _headers(self):
+        return {
             'Authorization': f'Bearer {self.api_key}',
             'Content-Type': 'application/json'
         }
+    
+    def _generate(self, prompt: str, max_tokens: int) -> Optional[str]:
+        """
+        调用文本生成接口（受服务商级限流约束）
         
+        Returns:
+            模型输出文本，请求失败或响应格式错误时返回None
+        """
         data = {
-            "model": "qwen2.5-72b-instruct",  # 使用qwen-turbo模型，更快更便宜
+            "model": self.model,
             "input": {
                 "messages": [
                     {
@@ -80,36 +116,70 @@ class QwenTranslator:
                 ]
             },
             "parameters": {
-                "max_tokens": 1000,
+                "max_tokens": max_tokens,
                 "temperature": 0.1,  # 较低的温度确保翻译准确性
                 "top_p": 0.8
             }
         }
         
+        if llm_rate_limiter is not None:
+            with llm_rate_limiter.limit("qwen", estimate_tokens(prompt) + max_tokens) as slot:
+                response = self._post(self._headers(), data)
+                slot.mark_status(response.status_code)
+                if response.status_code == 200:
+                    result = response.json()
+                    llm_usage.record_usage(self.model, result.get('usage'), prompt,
+                                           result.get('output', {}).get('text'))
+        else:
+            response = self._post(self._headers(), data)
+        
+        if response.status_code != 200:
+            logger.error(f"❌ API请求失败，状态码: {response.status_code}")
+            logger.error(f"响应内容: {response.text}")
+            return None
+        
+        result = response.json()
+        if 'output' in result and 'text' in result['output']:
+            return result['output']['text'].strip()
+        logger.error(f"❌ API响应格式错误: {result}")
+        return None
+    
+    def translate_text(self, text: str, source_language: str = "中文") -> Optional[str]:
+        """
+        翻译单个文本
+        
+        Args:
+            text: 待翻译的文本
+            source_language: 源语言，默认为中文
+            
+        Returns:
+            翻译后的文本，失败返回None
+        """
+        if not text or not text.strip():
+            return ""
+        
+        # 先查询翻译记忆库
+        if translation_memory is not None:
+            cached = translation_memory.get(text, source_language, self.target_language, self.model)
+            if cached is not None:
+                logger.info(f"✅ 翻译记忆命中: {cached[:50]}...")
+                return cached
+        
+        # 构建翻译提示词
+        prompt = self._build_translation_prompt(text, source_language, self.target_language)
+        
         try:
             logger.info(f"🔄 正在翻译文本: {text[:50]}...")
             
-            response = self.session.post(
-                self.base_url,
-                headers=headers,
-                json=data,
-                timeout=(30, 60)
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                
-                if 'output' in result and 'text' in result['output']:
-                    translated_text = result['output']['text'].strip()
-                    logger.info(f"✅ 翻译成功: {translated_text[:50]}...")
-                    return translated_text
-                else:
-                    logger.error(f"❌ API响应格式错误: {result}")
-                    return None
-            else:
-                logger.error(f"❌ API请求失败，状态码: {response.status_code}")
-                logger.error(f"响应内容: {response.text}")
+            translated_text = self._generate(prompt, max_tokens=1000)
+            if translated_text is None:
                 return None
+            
+            logger.info(f"✅ 翻译成功: {translated_text[:50]}...")
+            if translation_memory is not None:
+                translation_memory.put(text, translated_text, source_language,
+                                       self.target_language, self.model)
+            return translated_text
                 
         except Exception as e:
             logger.error(f"❌ 翻译请求异常: {str(e)}")
@@ -129,10 +199,87 @@ class QwenTranslator:
 翻译："""
         return prompt
     
+    def _build_batch_prompt(self, items: List[Tuple[int, str]], source_lang: str, target_lang: str) -> str:
+        """构建批量翻译提示词，每条文本带编号，要求按编号返回JSON数组"""
+        payload = json.dumps([{"id": item_id, "text": text} for item_id, text in items], ensure_ascii=False)
+        prompt = f"""请将下面JSON数组中每一项的text从{source_lang}翻译成{target_lang}，要求：
+1. 保持原文的意思和语气
+2. 翻译要自然流畅
+3. 如果是专业术语，请保持准确性
+4. 每一项单独翻译，不要合并或拆分
+5. 只返回JSON数组，格式为 [{{"id": 编号, "translation": "译文"}}]，id与输入一一对应，不要包含其他解释
+
+输入：
+{payload}
+
+输出："""
+        return prompt
+    
+    def _parse_batch_output(self, output: str) -> Dict[int, str]:
+        """解析批量翻译的输出，返回 {编号: 译文}"""
+        try:
+            data = json.loads(_CODE_FENCE_RE.sub('', output), strict=False)
+        except ValueError:
+            if repair_json is None:
+                raise
+            data = repair_json(output)
+        
+        translations = {}
+        for item in data if isinstance(data, list) else []:
+            if not isinstance(item, dict):
+                continue
+            try:
+                item_id = int(item.get("id"))
+            except (TypeError, ValueError):
+                continue
+            translation = item.get("translation")
+            if isinstance(translation, str) and translation.strip():
+                translations[item_id] = translation.strip()
+        return translations
+    
+    def _translate_batch(self, items: List[Tuple[int, str]], source_language: str) -> Dict[int, str]:
+        """
+        翻译一批带编号的文本
+        
+        Returns:
+            成功翻译的 {编号: 译文}，缺失的编号由调用方逐条补翻
+        """
+        prompt = self._build_batch_prompt(items, source_language, self.target_language)
+        # 输出包含编号和JSON结构，按输入的2倍加上每条的结构开销估算
+        max_tokens = min(8000, sum(estimate_tokens(text) * 2 + 15 for _, text in items) + 100)
+        try:
+            output = self._generate(prompt, max_tokens=max_tokens)
+            if output is None:
+                return {}
+            return self._parse_batch_output(output)
+        except Exception as e:
+            logger.error(f"❌ 批量翻译请求异常（{len(items)} 条）: {str(e)}")
+            return {}
+    
+    def _pack_batches(self, items: List[Tuple[int, str]]) -> List[List[Tuple[int, str]]]:
+        """按token预算和条数上限把文本分批"""
+        batches = []
+        current = []
+        current_tokens = 0
+        for item_id, text in items:
+            tokens = estimate_tokens(text)
+            if current and (current_tokens + tokens > OCR_BATCH_MAX_INPUT_TOKENS or len(current) >= OCR_BATCH_MAX_ITEMS):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append((item_id, text))
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+    
     def translate_batch_texts(self, texts: List[str], source_language: str = "中文") -> List[Optional[str]]:
         """
         批量翻译文本
         
+        相同文本只翻译一次，先查询翻译记忆库；其余文本带编号打包成若干请求并发翻译，
+        请求频率由服务商级限流控制。批量结果中缺失的文本再逐条翻译。
+        
         Args:
             texts: 待翻译的文本列表
             source_language: 源语言
@@ -140,21 +287,51 @@ class QwenTranslator:
         Returns:
             翻译结果列表，与输入列表一一对应
         """
-        results = []
         total = len(texts)
-        
         logger.info(f"📝 开始批量翻译，共 {total} 条文本")
         
-        for i, text in enumerate(texts, 1):
-            logger.info(f"🔄 翻译进度: {i}/{total}")
+        unique_texts = list(dict.fromkeys(text for text in texts if text and text.strip()))
+        translations: Dict[str, str] = {}
+        if translation_memory is not None and unique_texts:
+            translations.update(translation_memory.get_many(unique_texts, source_language,
+                                                            self.target_language, self.model))
+            if translations:
+                logger.info(f"✅ 翻译记忆命中 {len(translations)}/{len(unique_texts)} 条")
+        
+        pending = [text for text in unique_texts if text not in translations]
+        if pending and OCR_BATCH_ENABLED:
+            items = list(enumerate(pending, 1))
+            batches = self._pack_batches(items)
+            concurrency = max(1, min(OCR_BATCH_CONCURRENCY, len(batches)))
+            logger.info(f"🔄 {len(pending)} 条文本打包为 {len(batches)} 个批量请求，并发数 {concurrency}")
             
-            translated = self.translate_text(text, source_language)
-            results.append(translated)
+            with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ocr_translate") as executor:
+                futures = [executor.submit(contextvars.copy_context().run, self._translate_batch, batch, source_language)
+                           for batch in batches]
+                batch_results = [future.result() for future in futures]
             
-            # 避免API频率限制
-            if i < total:
-                time.sleep(0.5)
+            new_pairs = []
+            for batch_result in batch_results:
+                for item_id, translated in batch_result.items():
+                    if 1 <= item_id <= len(pending):
+                        translations[pending[item_id - 1]] = translated
+                        new_pairs.append((pending[item_id - 1], translated))
+            if translation_memory is not None and new_pairs:
+                translation_memory.put_many(new_pairs, source_language, self.target_language, self.model)
+            
+            missing = [text for text in pending if text not in translations]
+            if missing:
+                logger.warning(f"⚠️ 批量结果中缺少 {len(missing)} 条文本，逐条补翻")
+            pending = missing
+        
+        # 未启用批量模式，或批量结果缺失的文本逐条翻译
+        for i, text in enumerate(pending, 1):
+            logger.info(f"🔄 逐条翻译进度: {i}/{len(pending)}")
+            translated = self.translate_text(text, source_language)
+            if translated is not None:
+                translations[text] = translated
         
+        results = [translations.get(text) if text and text.strip() else "" for text in texts]
         success_count = sum(1 for r in results if r is not None)
         logger.info(f"✅ 批量翻译完成，成功: {success_count}/{total}")
         
@@ -178,38 +355,33 @@ class QwenTranslator:
             
             logger.info(f"📖 开始翻译映射文件: {mapping_file_path}")
             
-            total_texts = 0
-            translated_count = 0
-            
-            # 遍历所有幻灯片
+            # 收集所有图片的文本，编号即在列表中的位置，翻译后按编号写回
+            entries = []
             for slide_key, slide_data in mapping_data.items():
                 if 'images' not in slide_data:
                     continue
                 
-                # 遍历该页的所有图片
                 for image_info in slide_data['images']:
                     if 'all_text' not in image_info or not image_info['all_text']:
                         continue
                     
-                    # 翻译该图片的所有文本
-                    translated_texts = {}
-                    
                     for text_key, text_value in image_info['all_text'].items():
                         if text_value and text_value.strip():
-                            total_texts += 1
-                            
-                            translated = self.translate_text(text_value, source_language)
-                            if translated:
-                                translated_texts[text_key] = translated
-                                translated_count += 1
-                            else:
-                                # 翻译失败时保留原文
-                                translated_texts[text_key] = text_value
-                                logger.warning(f"⚠️ 翻译失败，保留原文: {text_value[:30]}...")
-                    
-                    # 将翻译结果添加到映射数据中
-                    if translated_texts:
-                        image_info['translated_text'] = translated_texts
+                            entries.append((image_info, text_key, text_value))
+            
+            total_texts = len(entries)
+            translated_count = 0
+            results = self.translate_batch_texts([text_value for _, _, text_value in entries], source_language)
+            
+            for (image_info, text_key, text_value), translated in zip(entries, results):
+                translated_texts = image_info.setdefault('translated_text', {})
+                if translated:
+                    translated_texts[text_key] = translated
+                    translated_count += 1
+                else:
+                    # 翻译失败时保留原文
+                    translated_texts[text_key] = text_value
+                    logger.warning(f"⚠️ 翻译失败，保留原文: {text_value[:30]}...")
             
             # 保存更新后的映射文件
             with open(mapping_file_path, 'w', encoding='utf-8') as f:
@@ -8,6 +8,7 @@ import logging
 import re
 import os
 import asyncio
+import contextvars
 from typing import Dict, Any, List, Optional, Union, Callable
 import time
 import socket
@@ -15,7 +16,6 @@ import httpx
 from urllib.parse import urlparse
 
 from dotenv import load_dotenv
-from openai import OpenAI
 from functools import lru_cache
 
 # 导入工具函数
@@ -24,6 +24,14 @@ from ..utils.translation_utils import (
     clean_translation_text
 )
 
+from ..utils.translation_memory import translation_memory, glossary_fingerprint
+from ..utils.llm_streaming import stream_chat_completion, LLM_STREAMING_ENABLED
+from ..utils.json_repair import repair_json, repair_json_with_strategy, JsonRepairError, json_repair_stats
+from ..utils.llm_rate_limiter import llm_rate_limiter
+from ..utils.llm_gateway import llm_gateway
+from ..utils.llm_usage import llm_usage
+from ..utils.glossary_matcher import get_glossary_matcher
+
 # from ..utils.async_http_client import AsyncHttpClient
 try:
     from ..utils.network_diagnostics import diagnose_network_issue, quick_connectivity_check
@@ -44,6 +52,11 @@ MODEL_NAME = "qwen2.5-72b-instruct"
 API_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
 API_KEY = os.environ.get("QWEN_API_KEY")
 
+# 领域检测：输入最多抽样的页数和字符数，检测失败时的默认领域
+FIELD_SAMPLE_MAX_PAGES = int(os.getenv("FIELD_SAMPLE_MAX_PAGES", "8"))
+FIELD_SAMPLE_MAX_CHARS = int(os.getenv("FIELD_SAMPLE_MAX_CHARS", "1000"))
+DEFAULT_FIELD = "其他"
+
 # 备用API配置
 BACKUP_API_URLS = [
     "https://dashscope.aliyuncs.com/compatible-mode/v1",
@@ -86,7 +99,7 @@ def check_network_connectivity(url: str, timeout: int = 10) -> bool:
 @lru_cache(maxsize=1)
 def get_openai_client():
     """
-    获取OpenAI客户端实例（使用缓存以避免重复创建）
+    获取OpenAI客户端实例（使用缓存以避免重复创建，底层连接池由大模型网关共享）
 
     Returns:
         OpenAI客户端实例
@@ -112,7 +125,8 @@ def get_openai_client():
     else:
         api_url = API_BASE_URL
 
-    return OpenAI(
+    # 经大模型网关创建，与其他翻译调用共用keep-alive连接池
+    return llm_gateway.get_openai_client(
         api_key=API_KEY,
         base_url=api_url,
         timeout=httpx.Timeout(
@@ -178,6 +192,64 @@ async def retry_with_backoff(func, max_retries: int = MAX_RETRIES, delay: float
     raise last_exception
 
 # 创建为字段分析的异步函数
+def sample_field_text(page_texts: List[str], max_pages: int = None, max_chars: int = None) -> str:
+    """
+    确定性地抽样领域检测的输入：在非空页面中均匀选取若干页（总是包含第一页），每页截取相同长度
+
+    Args:
+        page_texts: 各页文本
+        max_pages: 最多选取的页数
+        max_chars: 总字符数上限
+
+    Returns:
+        抽样后的文本
+    """
+    max_pages = max_pages or FIELD_SAMPLE_MAX_PAGES
+    max_chars = max_chars or FIELD_SAMPLE_MAX_CHARS
+    pages = [text.strip() for text in page_texts if text and text.strip()]
+    if not pages:
+        return ""
+    if len(pages) > max_pages:
+        step = len(pages) / max_pages
+        pages = [pages[int(i * step)] for i in range(max_pages)]
+    per_page = max(1, max_chars // len(pages))
+    return "\n".join(text[:per_page] for text in pages)[:max_chars]
+
+
+async def get_document_field_async(load_page_texts: Callable[[], List[str]],
+                                   document_hash: Optional[str] = None) -> str:
+    """
+    获取文档的领域，按文档内容哈希缓存
+
+    缓存命中时不读取文档也不调用大模型；未命中时抽样文本检测，检测失败返回默认领域且不写入缓存。
+
+    Args:
+        load_page_texts: 返回各页文本的函数（同步，在线程池中执行）
+        document_hash: 文档内容哈希，为None时不使用缓存
+
+    Returns:
+        领域名称
+    """
+    cached = translation_memory.get_document_field(document_hash) if document_hash else None
+    if cached:
+        logger.info(f"文档领域缓存命中: {cached}")
+        return cached
+
+    loop = asyncio.get_event_loop()
+    text = sample_field_text(await loop.run_in_executor(None, load_page_texts))
+    if not text:
+        logger.info(f"文档没有可用于领域检测的文本，使用默认领域: {DEFAULT_FIELD}")
+        return DEFAULT_FIELD
+
+    try:
+        field = await _request_field_async(text)
+    except Exception as e:
+        logger.error(f"无法获取领域信息，使用默认值: {str(e)}")
+        return DEFAULT_FIELD
+    translation_memory.put_document_field(document_hash, field)
+    return field
+
+
 async def get_field_async(text: str) -> str:
     """
     异步获取PPT可能属于的领域
@@ -188,16 +260,27 @@ async def get_field_async(text: str) -> str:
     Returns:
         领域分析结果
     """
+    try:
+        return await _request_field_async(text)
+    except Exception as e:
+        # 如果所有重试都失败，返回默认值
+        logger.error(f"无法获取领域信息，使用默认值: {str(e)}")
+        return DEFAULT_FIELD
+
+
+async def _request_field_async(text: str) -> str:
+    """调用大模型检测领域（带重试），失败时抛出异常"""
     # 在异步函数中使用同步客户端，使用线程池执行
     loop = asyncio.get_event_loop()
 
     def _get_field():
         try:
             client = get_openai_client()
-            response = client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=[
-                    {"role": "system", "content": """你是一个专业的文档分析专家。请根据给定的文本内容，判断这个PPT可能属于哪个专业领域。
+            with llm_rate_limiter.limit("qwen", len(text[:1000]) + 50):
+                response = client.chat.completions.create(
+                    model=MODEL_NAME,
+                    messages=[
+                        {"role": "system", "content": """你是一个专业的文档分析专家。请根据给定的文本内容，判断这个PPT可能属于哪个专业领域。
 
 请从以下领域中选择最合适的一个：
 - 医学
@@ -212,11 +295,12 @@ async def get_field_async(text: str) -> str:
 - 其他
 
 请只返回领域名称，不要添加任何解释。"""},
-                    {"role": "user", "content": f"请分析以下文本内容属于哪个领域：\n\n{text[:1000]}"}  # 限制文本长度
-                ],
-                temperature=0.1,
-                max_tokens=50
-            )
+                        {"role": "user", "content": f"请分析以下文本内容属于哪个领域：\n\n{text[:1000]}"}  # 限制文本长度
+                    ],
+                    temperature=0.1,
+                    max_tokens=50
+                )
+                llm_usage.record_usage(MODEL_NAME, response.usage, text[:1000], response.choices[0].message.content)
             result = response.choices[0].message.content.strip()
             logger.info(f"成功获取领域信息: {result}")
             return result
@@ -224,22 +308,27 @@ async def get_field_async(text: str) -> str:
             logger.error(f"获取领域信息失败: {str(e)}")
             raise
 
-    try:
-        # 使用重试机制执行API调用
-        async def _async_get_field():
-            return await loop.run_in_executor(None, _get_field)
+    # 使用重试机制执行API调用
+    async def _async_get_field():
+        return await loop.run_in_executor(None, contextvars.copy_context().run, _get_field)
 
-        result = await retry_with_backoff(_async_get_field)
-        return result
-    except Exception as e:
-        # 如果所有重试都失败，返回默认值
-        logger.error(f"无法获取领域信息，使用默认值: {str(e)}")
-        return "其他"  # 返回默认领域
+    return await retry_with_backoff(_async_get_field)
+
+# 可以写入翻译记忆的解析策略：输出本身完整，没有丢弃损坏或截断的对象
+_CACHEABLE_STRATEGIES = ('direct', 'extract', 'normalize')
+
+def _count_segments(text: str) -> int:
+    """
+    调用方未给出段数时的估计：调用方每行放一段（【】只是段落的包裹标记，
+    原文中本身含有的【注意】等不是分段），按非空行计数
+    """
+    return sum(1 for line in text.split('\n') if line.strip())
 
 # 创建翻译文本的异步函数
 async def translate_by_fields_async(field: str, text: str, stop_words: List[str],
                                 custom_translations: Dict[str, str],
-                                source_language: str, target_language: str) -> str:
+                                source_language: str, target_language: str,
+                                segment_count: Optional[int] = None) -> str:
     """
     异步根据领域翻译文本
 
@@ -250,22 +339,35 @@ async def translate_by_fields_async(field: str, text: str, stop_words: List[str]
         custom_translations: 自定义翻译字典
         source_language: 源语言
         target_language: 目标语言
+        segment_count: 调用方拼接的段数，用于判断输出是否完整；为None时按非空行计数
 
     Returns:
         翻译结果JSON字符串
     """
+    # 只保留文本中实际出现的术语，术语表很大时可显著缩短提示词
+    glossary_hits = get_glossary_matcher(stop_words, custom_translations).find(text)
+    stop_words = glossary_hits.stop_words
+    custom_translations = glossary_hits.custom_translations
+
+    # 先查询翻译记忆库，命中则跳过API调用
+    glossary_fp = glossary_fingerprint(stop_words, custom_translations, extra=field)
+    cached_result = translation_memory.get(text, source_language, target_language, MODEL_NAME, glossary_fp)
+    if cached_result is not None:
+        logger.info(f"翻译记忆命中，跳过API调用，结果长度: {len(cached_result)}")
+        return cached_result
+
     stop_words_str = ", ".join(f'"{word}"' for word in stop_words)
     custom_translations_str = ", ".join(f'"{k}": "{v}"' for k, v in custom_translations.items())
 
     # 在异步函数中使用同步客户端，使用线程池执行
     loop = asyncio.get_event_loop()
+    # 输出因长度限制被截断时只保留已完整的段落，结果不写入翻译记忆
+    truncated = [False]
 
     def _translate():
         try:
             client = get_openai_client()
-            response = client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=[
+            messages=[
                     {"role": "system", "content": f"""您是{field}领域的专家。
 接下来，您将获得一系列{source_language}文本（包括短语、句子和单词）。
 以下或单词短语**保留原样，不翻译**：
@@ -318,12 +420,48 @@ async def translate_by_fields_async(field: str, text: str, stop_words: List[str]
     现在，请按照上述规则翻译文本
     """},
                     {"role": "user", "content": text}
-                ],
-                temperature=0.7,
-                max_tokens=8000,
-                timeout=600
-            )
-            result = response.choices[0].message.content
+                ]
+
+            if LLM_STREAMING_ENABLED:
+                # 流式调用：停滞时按首token/token间隔超时提前中止，由重试机制接管
+                received = [0]
+
+                def _on_object(item):
+                    received[0] += 1
+                    logger.debug(f"已收到第 {received[0]} 段译文")
+
+                with llm_rate_limiter.limit("qwen", len(text) * 3):
+                    stream_result = stream_chat_completion(
+                        client, on_object=_on_object,
+                        model=MODEL_NAME, messages=messages, temperature=0.7, max_tokens=8000
+                    )
+                    llm_usage.record_usage(MODEL_NAME, stream_result.usage, messages, stream_result.text,
+                                           stream_result.time_to_first_token)
+                result = stream_result.text
+                if stream_result.finish_reason == "length":
+                    # 与 api_translate_uno._check_output_complete 相同按 finish_reason 判断截断；
+                    # 重试同样会被截断，直接使用已闭合的段落对象，未译出的段落保留原文
+                    truncated[0] = True
+                    logger.warning(f"翻译输出因长度限制被截断（finish_reason=length），"
+                                   f"保留已完整的 {len(stream_result.objects)} 段译文")
+                    result = json.dumps(stream_result.objects, ensure_ascii=False)
+                logger.info(f"流式翻译完成: 首token {stream_result.time_to_first_token or 0:.2f}s，"
+                            f"总耗时 {stream_result.elapsed:.2f}s，{received[0]} 段译文")
+            else:
+                with llm_rate_limiter.limit("qwen", len(text) * 3):
+                    response = client.chat.completions.create(
+                        model=MODEL_NAME,
+                        messages=messages,
+                        temperature=0.7,
+                        max_tokens=8000,
+                        timeout=600
+                    )
+                    llm_usage.record_usage(MODEL_NAME, response.usage, messages, response.choices[0].message.content)
+                result = response.choices[0].message.content
+                if response.choices[0].finish_reason == "length":
+                    # 截断的输出由JSON修复流程保留已完整的对象
+                    truncated[0] = True
+                    logger.warning("翻译输出因长度限制被截断（finish_reason=length）")
             logger.info(f"翻译成功，返回结果长度: {len(result)}")
             return result
         except Exception as e:
@@ -333,9 +471,24 @@ async def translate_by_fields_async(field: str, text: str, stop_words: List[str]
     try:
         # 使用重试机制执行API调用
         async def _async_translate():
-            return await loop.run_in_executor(None, _translate)
+            return await loop.run_in_executor(None, contextvars.copy_context().run, _translate)
 
         result = await retry_with_backoff(_async_translate)
+        # 只缓存完整的输出：未截断、无需丢弃损坏对象即可在本地解析，且段落数与输入一致；
+        # 否则之后每次命中都会缺少段落
+        if truncated[0]:
+            return result
+        try:
+            parsed, strategy = repair_json_with_strategy(clean_translation_text(result))
+        except JsonRepairError as e:
+            logger.warning(f"翻译结果无法在本地解析，不写入翻译记忆: {e}")
+            return result
+        parsed_count = len(parsed) if isinstance(parsed, list) else 1
+        expected_count = segment_count if segment_count is not None else _count_segments(text)
+        if strategy not in _CACHEABLE_STRATEGIES or parsed_count != expected_count:
+            logger.warning(f"翻译结果不完整（解析策略 {strategy}，{parsed_count}/{expected_count} 段），不写入翻译记忆")
+        else:
+            translation_memory.put(text, result, source_language, target_language, MODEL_NAME, glossary_fp)
         return result
     except Exception as e:
         # 如果所有重试都失败，返回错误信息
@@ -354,12 +507,19 @@ async def parse_formatted_text_async(text: str):
     Returns:
         解析结果
     """
+    # 先在本地修复（代码块、尾逗号、全角标点、未转义引号、截断等），全部失败才调用大模型
     try:
-        return json.loads(text, strict = False)
-    except json.JSONDecodeError as e:
-        logger.warning(f"初次解析 JSON 失败，尝试修复格式: {e}")
-        fixed_text = await re_parse_formatted_text_async(text)
-        return json.loads(fixed_text, strict = False)
+        return repair_json(text)
+    except JsonRepairError as e:
+        logger.warning(f"本地修复JSON失败，尝试大模型修复: {e}")
+    fixed_text = await re_parse_formatted_text_async(text)
+    try:
+        result = json.loads(fixed_text, strict = False)
+    except json.JSONDecodeError:
+        json_repair_stats.record('failed')
+        raise
+    json_repair_stats.record('llm')
+    return result
 
 async def re_parse_formatted_text_async(text: str):
     """
@@ -377,10 +537,11 @@ async def re_parse_formatted_text_async(text: str):
     def _re_parse():
         try:
             client = get_openai_client()
-            response = client.chat.completions.create(
-                model=MODEL_NAME,
-                messages=[
-                    {"role": "system", "content": """
+            with llm_rate_limiter.limit("qwen", len(text) * 2):
+                response = client.chat.completions.create(
+                    model=MODEL_NAME,
+                    messages=[
+                        {"role": "system", "content": """
                      你是一个 JSON 解析和修复专家。你的任务是修复一段 **可能存在格式错误的 JSON**，并输出一个 **严格符合 JSON 标准** 的 **格式正确的 JSON**。
 
 ### **规则要求：**
@@ -393,11 +554,12 @@ async def re_parse_formatted_text_async(text: str):
 4. **不输出额外文本**：
    - **仅输出修复后的 JSON**，不要添加解释、注释或额外的说明文本。
    """},
-                    {"role": "user", "content": text}
-                ],
-                temperature=0.3,
-                max_tokens=8000
-            )
+                        {"role": "user", "content": text}
+                    ],
+                    temperature=0.3,
+                    max_tokens=8000
+                )
+                llm_usage.record_usage(MODEL_NAME, response.usage, text, response.choices[0].message.content)
             result = response.choices[0].message.content
             logger.info(f"JSON修复成功")
             return result
@@ -408,7 +570,7 @@ async def re_parse_formatted_text_async(text: str):
     try:
         # 使用重试机制执行API调用
         async def _async_re_parse():
-            return await loop.run_in_executor(None, _re_parse)
+            return await loop.run_in_executor(None, contextvars.copy_context().run, _re_parse)
 
         result = await retry_with_backoff(_async_re_parse)
         return result
@@ -422,7 +584,8 @@ async def re_parse_formatted_text_async(text: str):
 # 主要翻译函数
 async def translate_async(text: str, field: str = None, stop_words: List[str] = None,
                        custom_translations: Dict[str, str] = None,
-                       source_language: str = "en", target_language: str = "zh"):
+                       source_language: str = "en", target_language: str = "zh",
+                       segment_count: Optional[int] = None):
     """
     异步翻译功能主函数
 
@@ -433,6 +596,7 @@ async def translate_async(text: str, field: str = None, stop_words: List[str] =
         custom_translations: 自定义翻译字典
         source_language: 源语言代码
         target_language: 目标语言代码
+        segment_count: 调用方拼接的段数（见 translate_by_fields_async）
 
     Returns:
         翻译映射字典（原文->译文）
@@ -449,7 +613,8 @@ async def translate_async(text: str, field: str = None, stop_words: List[str] =
 
         # 翻译文本
         translation_result = await translate_by_fields_async(
-            field, text, stop_words, custom_translations, source_language, target_language
+            field, text, stop_words, custom_translations, source_language, target_language,
+            segment_count=segment_count
         )
 
         # 清理特殊字符
@@ -329,7 +329,8 @@ class PageBasedTranslator:
                 stop_words=[],  # 空的停止词列表
                 custom_translations={},  # 空的自定义翻译
                 source_language=source_language,
-                target_language=target_language
+                target_language=target_language,
+                segment_count=sum(1 for para in paragraphs if para.is_translatable)
             )
 
             if not translation_result:
@@ -7,12 +7,14 @@ import os
 import sys
 import time
 import asyncio
+import contextvars
 import logging
 import re
 import json
 import platform
 from typing import Dict, List, Any, Optional, Union, Tuple
 import concurrent.futures
+from functools import partial
 from pptx import Presentation
 from pptx.enum.text import MSO_AUTO_SIZE
 from pptx.dml.color import RGBColor
@@ -20,9 +22,11 @@ from pptx.util import Pt, Inches
 import difflib
 
 # 导入异步API客户端
-from .local_qwen_async import translate_async, batch_translate_async, get_field_async
+from .local_qwen_async import translate_async, batch_translate_async, get_field_async, get_document_field_async
 from ..utils.thread_pool_executor import thread_pool, TaskType
 from ..utils.enhanced_task_queue import translation_queue
+from ..utils.glossary_matcher import get_glossary_matcher
+from ..utils.translation_memory import file_content_hash
 
 # 导入基于页面的翻译机制
 from .page_based_translation import translate_slide_by_page, get_translation_statistics
@@ -94,6 +98,37 @@ def is_page_number(text):
         return True
     return False
 
+def _slide_texts(prs) -> List[str]:
+    """各页文本框中的文本，每页一个字符串"""
+    return ["\n".join(shape.text_frame.text for shape in slide.shapes if shape.has_text_frame)
+            for slide in prs.slides]
+
+async def _document_hash_async(presentation_path: str) -> Optional[str]:
+    """计算文件内容哈希（在线程池中读取文件），失败时返回None"""
+    try:
+        return await asyncio.get_event_loop().run_in_executor(None, file_content_hash, presentation_path)
+    except OSError as e:
+        logger.warning(f"计算文档哈希失败，不使用文档级缓存: {str(e)}")
+        return None
+
+async def detect_presentation_field_async(presentation_path: str, prs=None, document_hash: str = None) -> str:
+    """
+    检测演示文稿所属领域，按文件内容哈希缓存，重新上传和任务重试时不再调用大模型
+
+    Args:
+        presentation_path: PPT文件路径
+        prs: 已加载的 Presentation；未提供时只在缓存未命中时读取文件
+        document_hash: 上传文件的原始内容哈希。布局调整会就地保存文件，之后再计算的哈希每次都不同，
+            调用方应传入修改前的哈希；未提供时按当前文件计算
+    """
+    if document_hash is None:
+        document_hash = await _document_hash_async(presentation_path)
+
+    def _load_page_texts():
+        return _slide_texts(prs if prs is not None else Presentation(presentation_path))
+
+    return await get_document_field_async(_load_page_texts, document_hash)
+
 async def _adjust_ppt_layout_async(presentation_path: str) -> bool:
     """
     异步调整PPT布局，使用现有的set_textbox_autofit函数
@@ -560,7 +595,8 @@ async def process_presentation_async(presentation_path: str,
                                    target_language: str,
                                    bilingual_translation: str,
                                    progress_callback,
-                                   model:str) -> bool:
+                                   model:str,
+                                   document_hash: str = None) -> bool:
     """
     异步处理演示文稿（基于页面的翻译机制）
     每页调用一次API，按段落匹配翻译结果
@@ -574,6 +610,7 @@ async def process_presentation_async(presentation_path: str,
         target_language: 目标语言代码
         bilingual_translation: 是否双语翻译
         progress_callback: 进度回调函数，接收两个参数(current_slide, total_slides)
+        document_hash: 上传文件的原始内容哈希（领域缓存和翻译断点的键），未提供时在布局调整前计算
 
     Returns:
         处理是否成功
@@ -586,6 +623,11 @@ async def process_presentation_async(presentation_path: str,
 
 
 
+    # 布局调整会就地保存文件，文档级缓存（领域、翻译断点）必须使用修改前的内容哈希；
+    # 任务队列在上传时已计算，直接调用时在这里补算
+    if document_hash is None:
+        document_hash = await _document_hash_async(presentation_path)
+
     '''
     进行布局调整
     '''
@@ -605,9 +647,14 @@ async def process_presentation_async(presentation_path: str,
     2. 翻译
     3. 再打开ppt，并渲染
     '''
+    # 领域检测与UNO翻译并行：UNO流程不使用领域，领域只在后续逐页翻译时才需要
+    field_task = asyncio.ensure_future(detect_presentation_field_async(presentation_path, document_hash=document_hash))
+
     try:
         from .pynuo_fuc.pyuno_controller import pyuno_controller
-        uno_pptx_path= pyuno_controller(presentation_path, 
+        uno_pptx_path = await asyncio.get_event_loop().run_in_executor(None, contextvars.copy_context().run, partial(
+                        pyuno_controller,
+                        presentation_path, 
                         stop_words_list, 
                         custom_translations, 
                         select_page, 
@@ -615,8 +662,9 @@ async def process_presentation_async(presentation_path: str,
                         target_language, 
                         bilingual_translation, 
                         progress_callback,
-                        model
-                        )
+                        model,
+                        document_hash
+                        ))
         logger.info(f"调用UNO接口翻译PPT文本框成功，翻译后的PPT文件地址: {uno_pptx_path}")
     except Exception as e:
         logger.error(f"使用pyuno接口功能时出错: {str(e)}")
@@ -646,15 +694,8 @@ async def process_presentation_async(presentation_path: str,
         else:
             logger.info(f" 将翻译指定页面: {select_page}")
 
-        # 获取领域（使用第一页的内容分析）
-        logger.info("正在分析文本领域...")
-        first_slide_text = ""
-        if prs.slides:
-            for shape in prs.slides[0].shapes:
-                if shape.has_text_frame:
-                    first_slide_text += shape.text_frame.text + "\n"
-
-        field = await get_field_async(first_slide_text[:500])  # 只用前500字符分析领域
+        # 领域检测在UNO翻译期间已经开始，这里通常可以直接拿到结果
+        field = await field_task
         logger.info(f"文本领域分析结果: {field}")
 
         # 初始化进度
@@ -753,6 +794,8 @@ async def process_presentation_async(presentation_path: str,
 
         return save_result
     except Exception as e:
+        if not field_task.done():
+            field_task.cancel()
         logger.error(f"处理演示文稿时出错: {str(e)}")
         import traceback
         logger.error(traceback.format_exc())
@@ -771,7 +814,8 @@ async def  process_presentation_add_annotations_async(presentation_path: str,
                                                  target_language: str,
                                                  bilingual_translation: str,
                                                  progress_callback=None,
-                                                 model:str='qwen') -> bool:
+                                                 model:str='qwen',
+                                                 document_hash: str = None) -> bool:
     """
     异步处理带注释的演示文稿
 
@@ -818,21 +862,8 @@ async def  process_presentation_add_annotations_async(presentation_path: str,
                     logger.error("演示文稿中没有幻灯片")
                     return False
 
-                # 收集所有注释文本进行翻译
-                logger.info("正在收集注释文本...")
-                all_text = ""
-                for slide in prs.slides:
-                    for shape in slide.shapes:
-                        if shape.has_text_frame:
-                            text_frame = shape.text_frame
-                            for paragraph in text_frame.paragraphs:
-                                text = paragraph.text.strip()
-                                if text:
-                                    all_text += text + "\n"
-
-                # 获取领域（使用新的阿里云异步API）
-                from .local_qwen_async import get_field_async
-                field = await get_field_async(all_text)
+                # 获取领域（按文档缓存，输入为各页抽样文本，不再把整份文稿发给模型）
+                field = await detect_presentation_field_async(presentation_path, prs, document_hash=document_hash)
                 logger.info(f"文本领域分析结果: {field}")
 
                 # 准备注释文本进行翻译
@@ -842,21 +873,17 @@ async def  process_presentation_add_annotations_async(presentation_path: str,
                     text = item["ocrResult"].replace("\n", " ")
                     tage_text += text + "\n"
 
-                # 处理停止词和自定义翻译
-                stop_words_filtered = []
-                custom_words = {}
-                for word in stop_words:
-                    if word in tage_text:
-                        stop_words_filtered.append(word)
-                for k, v in custom_translations.items():
-                    if k in tage_text:
-                        custom_words[k] = v
+                # 处理停止词和自定义翻译：只保留注释文本中出现的术语
+                glossary_hits = get_glossary_matcher(stop_words, custom_translations).find(tage_text)
+                stop_words_filtered = glossary_hits.stop_words
+                custom_words = glossary_hits.custom_translations
 
                 # 翻译注释文本（使用新的阿里云异步API）
                 logger.info("正在翻译注释文本...")
                 from .local_qwen_async import translate_async
                 from .ppt_translate import find_most_similar
-                data = await translate_async(tage_text, field, stop_words_filtered, custom_words, source_language, target_language)
+                data = await translate_async(tage_text, field, stop_words_filtered, custom_words, source_language, target_language,
+                                             segment_count=sum(1 for line in tage_text.split("\n") if line.strip()))
                 logger.info(f"翻译完成，共翻译 {len(data)} 个文本段")
 
                 # 处理每个注释，添加到对应页面右上角
@@ -986,7 +1013,7 @@ def run_async_in_thread(func, *args, **kwargs):
                 new_loop.close()
 
         with concurrent.futures.ThreadPoolExecutor() as executor:
-            future = executor.submit(run_in_new_thread)
+            future = executor.submit(contextvars.copy_context().run, run_in_new_thread)
             return future.result()
     except RuntimeError:
         # 没有运行中的循环，直接运行
@@ -1016,6 +1043,7 @@ def process_presentation(presentation_path: str,
                        # 兼容性参数
                        stop_words: List[str] = None,
                        model:str='qwen',
+                       document_hash: str = None,
                        **kwargs) -> bool:
     """
     处理PPT翻译（同步包装函数）
@@ -1032,6 +1060,7 @@ def process_presentation(presentation_path: str,
         progress_callback: 进度回调函数，接收两个参数(current_slide, total_slides)
         model: 模型类型
         stop_words: 停止词列表（兼容性参数）
+        document_hash: 上传文件的原始内容哈希，任务重试时保持不变
 
     Returns:
         处理是否成功
@@ -1063,7 +1092,8 @@ def process_presentation(presentation_path: str,
             target_language,
             bilingual_translation,
             progress_callback,
-            model
+            model,
+            document_hash
         )
 
         logger.info(f"演示文稿处理完成: {os.path.basename(presentation_path)}")
@@ -1082,7 +1112,8 @@ def process_presentation_add_annotations(presentation_path: str,
                                        target_language: str,
                                        bilingual_translation: str,
                                        progress_callback=None,
-                                       model:str='qwen') -> bool:
+                                       model:str='qwen',
+                                       document_hash: str = None) -> bool:
     """
     处理带注释的PPT翻译（同步包装函数）
 
@@ -1116,7 +1147,8 @@ def process_presentation_add_annotations(presentation_path: str,
             target_language,
             is_bilingual,
             progress_callback,
-            model
+            model,
+            document_hash
         )
         logger.info(f"带注释的演示文稿处理完成: {presentation_path}")
         return result
@@ -9,26 +9,170 @@ sys.path.insert(0, os.path.dirname(__file__))
 import json
 import re
 import requests  # 新增：用于调用后端API
+import httpx
 from logger_config import get_logger
 from openai import OpenAI
 import unicodedata
 import ast
+import threading
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from contextlib import nullcontext
+from request_packer import TranslationRequest, pack_translation_requests, format_reference_translations, format_page_glossary, estimate_tokens
+from segment_classifier import resolve_trivial_paragraphs
+from model_router import (ROUTE_FAST, ROUTE_PRIMARY, fast_model_for, route_box_paragraphs,
+                          fragments_acceptable, model_route_stats)
+from request_hedging import (UNO_HEDGE_ENABLED, secondary_model_for, model_latency_tracker, hedge_stats,
+                             run_hedged, timed_attempt)
+
+try:
+    from app.utils.llm_streaming import stream_chat_completion, LLM_STREAMING_ENABLED, JsonObjectStreamParser
+except ImportError:
+    # 独立运行（不在app包内）时使用非流式调用，只按 finish_reason 判断截断
+    stream_chat_completion = None
+    LLM_STREAMING_ENABLED = False
+    JsonObjectStreamParser = None
+
+try:
+    from app.utils.llm_gateway import llm_gateway
+except ImportError:
+    # 独立运行（不在app包内）时每次调用单独建立连接
+    llm_gateway = None
+
+try:
+    from app.utils.llm_rate_limiter import llm_rate_limiter
+except ImportError:
+    # 独立运行（不在app包内）时不做服务商级限流
+    llm_rate_limiter = None
+
+try:
+    from app.utils.llm_usage import llm_usage
+except ImportError:
+    # 独立运行（不在app包内）时不做调用计量
+    llm_usage = None
+
+try:
+    from app.utils.json_repair import repair_json, JsonRepairError, json_repair_stats
+except ImportError:
+    # 独立运行（不在app包内）时使用原有的解析流程
+    repair_json = None
+
+try:
+    from app.utils.glossary_matcher import get_glossary_matcher
+except ImportError:
+    # 独立运行（不在app包内）时不注入术语表
+    get_glossary_matcher = None
+
+try:
+    from app.utils.translation_memory import translation_memory, glossary_fingerprint
+    from app.utils.fuzzy_translation_memory import fuzzy_translation_memory
+except ImportError:
+    # 独立运行（不在app包内）时不使用翻译记忆库
+    translation_memory = None
+    fuzzy_translation_memory = None
+
+    def glossary_fingerprint(stop_words=None, custom_translations=None, extra=''):
+        return ""
 
 # 获取日志记录器
 logger = get_logger("pyuno")
 
 QWEN_API_KEY = os.getenv("QWEN_API_KEY")
+QWEN_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+# 千问系列的模型参数 -> 实际模型名；qwen-fast 供按段落长度路由时使用
+QWEN_MODELS = {
+    "qwen": "qwen2.5-72b-instruct",
+    "qwen-fast": os.getenv("UNO_QWEN_FAST_MODEL_NAME", "qwen2.5-7b-instruct"),
+}
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 
-def translate(text, model):
-    if model == "qwen":
-        logger.info("model参数设置为qwen,使用qwen2.5-72b-instruct模型")
-        client = OpenAI(api_key=QWEN_API_KEY, base_url="https://dashscope.aliyuncs.com/compatible-mode/v1")
-        used_model = "qwen2.5-72b-instruct"
-        response = client.chat.completions.create(
-            model = used_model,
-            messages=[
-                {"role": "system", "content": f"""您是翻译领域的专家。接下来，您将获得一系列文本（包括短语、句子和单词），他们是隶属于同一个PPT的同一页面下的文本框段落的所有文本。
+# 页面并发配置：单任务内同时在途的页面数，以及所有任务共享的全局上限
+UNO_PAGE_CONCURRENCY = int(os.getenv("UNO_PAGE_CONCURRENCY", "4"))
+UNO_GLOBAL_PAGE_CONCURRENCY = int(os.getenv("UNO_GLOBAL_PAGE_CONCURRENCY", "16"))
+_global_page_semaphore = threading.BoundedSemaphore(max(1, UNO_GLOBAL_PAGE_CONCURRENCY))
+
+# 单次翻译调用的最大输出token数；输出被截断时按段落二分拆分请求重新翻译
+UNO_TRANSLATE_MAX_TOKENS = int(os.getenv("UNO_TRANSLATE_MAX_TOKENS", "8000"))
+# 截断后最多连续二分的次数
+UNO_TRUNCATION_MAX_SPLIT_DEPTH = int(os.getenv("UNO_TRUNCATION_MAX_SPLIT_DEPTH", "4"))
+
+# [block]数量不一致的段落单独重新请求一次；上下文为前后各几个相邻段落
+UNO_BLOCK_REPAIR_ENABLED = os.getenv("UNO_BLOCK_REPAIR_ENABLED", "true").lower() in ("true", "1", "yes", "on")
+UNO_BLOCK_REPAIR_CONTEXT = int(os.getenv("UNO_BLOCK_REPAIR_CONTEXT", "1"))
+
+class TranslationTruncatedError(ValueError):
+    """翻译输出因长度限制被截断，partial_text 为已收到的部分输出"""
+
+    def __init__(self, message, partial_text=""):
+        super().__init__(message)
+        self.partial_text = partial_text or ""
+
+def _parse_partial_output(text):
+    """
+    逐个提取输出中已完整的段落对象
+
+    Returns:
+        tuple: (对象列表, 是否停在未闭合的数组/对象中)；独立运行时返回 ([], False)
+    """
+    if JsonObjectStreamParser is None or not text:
+        return [], False
+    parser = JsonObjectStreamParser()
+    parser.feed(clean_translation_text(text))
+    return parser.objects, parser.is_incomplete
+
+def _check_output_complete(text, finish_reason=None):
+    """finish_reason 为 length 或输出停在未闭合的JSON数组中时抛出 TranslationTruncatedError"""
+    if finish_reason == "length":
+        raise TranslationTruncatedError("翻译输出因长度限制被截断（finish_reason=length）", text)
+    # 字符串内未转义的引号也会让括号跟踪失准，输出以 ] 结尾时交给JSON修复流程处理
+    if _parse_partial_output(text)[1] and not (text or "").rstrip().rstrip('`').rstrip().endswith(']'):
+        raise TranslationTruncatedError("翻译输出的JSON数组未闭合，判断为被截断", text)
+    return text
+
+def _qwen_client():
+    """获取千问的OpenAI兼容客户端（经网关复用连接池）"""
+    if llm_gateway is None:
+        return OpenAI(api_key=QWEN_API_KEY, base_url=QWEN_BASE_URL)
+    return llm_gateway.get_openai_client(QWEN_API_KEY, QWEN_BASE_URL)
+
+def _llm_call_slot(provider, estimated_tokens=0):
+    """获取大模型调用的限流许可（独立运行时不限流）"""
+    if llm_rate_limiter is None:
+        return nullcontext()
+    return llm_rate_limiter.limit(provider, estimated_tokens)
+
+def _record_call_usage(model, usage=None, prompt_text=None, completion_text=None, time_to_first_byte=None):
+    """在限流许可内记录本次调用的模型和token用量（独立运行时忽略）"""
+    if llm_usage is not None:
+        llm_usage.record_usage(model, usage, prompt_text, completion_text, time_to_first_byte)
+
+def translate(text, model, on_paragraph=None, cancel_event=None):
+    """
+    调用翻译模型翻译格式化后的页面文本
+
+    Args:
+        text: 格式化后的待翻译文本
+        model: 模型类型 ("qwen"、"deepseek" 或 "gpt4o")
+        on_paragraph: 可选回调，流式模式下每解析出一个段落的翻译对象就调用一次
+        cancel_event: 可选，被设置时中止流式调用（对冲请求中落后的一方）
+
+    Returns:
+        str: 大模型返回的原始文本
+
+    Raises:
+        TranslationTruncatedError: 输出因长度限制被截断
+    """
+    # 输入加输出（原文回显+译文）的估算token数，用于服务商级限流
+    estimated_tokens = int(estimate_tokens(text) * 3.5)
+
+    if model in QWEN_MODELS:
+        used_model = QWEN_MODELS[model]
+        logger.info(f"model参数设置为{model},使用{used_model}模型")
+        client = _qwen_client()
+        messages=[
+                {"role": "system", "content": f"""您是翻译领域的专家。接下来，您将获得一系列文本（包括短语、句子和单词），他们是隶属于同一个PPT的一个或多个页面下的文本框段落的文本，文本框序号在整个输入内唯一。
                                                   请将每一段文本翻译成专业的中文。
                                                   1. 上传的将是一个格式化文本，结构如下：
                                                     第1页内容：
@@ -47,7 +191,8 @@ def translate(text, model):
                                                      你需要保证翻译后的内容中，[block]符的个数与原文相同，这也就代表着译前译后拥有相同数量的文本片段，这些文段有不同的字体格式，但一一对应。
                                                   3. 不要输出任何不可见字符、控制字符、特殊符号
                                                   4. 如果原文出现了中文甚至全文段都是中文，就将中文写在source_language中，且target_language中仍然保留。
-                                                  5. 输出格式应严格保持输入顺序，一段对应一段，使用如下 JSON 格式输出：
+                                                  5. 页面内容前可能附有【术语表】：其中要求保留原样的词语不要翻译，指定了译法的词语请使用给定译法。【术语表】和【参考译文】本身不需要翻译或输出。请求开头如有【格式修复】要求，请严格遵守其中列出的[block]数量；【上下文】只用于理解语境，不需要翻译或输出。
+                                                  6. 输出格式应严格保持输入顺序，一段对应一段，使用如下 JSON 格式输出：
                                                   [
                                                       {{
                                                           \"box_index\": 1,
@@ -82,18 +227,44 @@ def translate(text, model):
                                                       - box_index 和 paragraph_index 必须与输入中的【文本框X-段落Y】序号完全对应
                                                   现在，请按照上述规则翻译文本"""},
                 {"role": "user", "content": text}
-            ],
-            stream=False
-        )
-        return response.choices[0].message.content
+            ]
+
+        if stream_chat_completion is not None and LLM_STREAMING_ENABLED:
+            # 流式调用：逐段落回调，停滞时按首token/token间隔超时提前中止
+            with _llm_call_slot("qwen", estimated_tokens):
+                result = stream_chat_completion(client, on_object=on_paragraph, cancel_event=cancel_event,
+                                                model=used_model, messages=messages,
+                                                max_tokens=UNO_TRANSLATE_MAX_TOKENS)
+                _record_call_usage(used_model, result.usage, messages, result.text, result.time_to_first_token)
+            logger.info(f"流式翻译完成: 首token {result.time_to_first_token or 0:.2f}s，总耗时 {result.elapsed:.2f}s，"
+                        f"流式解析到 {len(result.objects)} 个段落")
+            return _check_output_complete(result.text, result.finish_reason)
+
+        with _llm_call_slot("qwen", estimated_tokens):
+            response = client.chat.completions.create(
+                model = used_model,
+                messages=messages,
+                max_tokens=UNO_TRANSLATE_MAX_TOKENS,
+                stream=False
+            )
+            _record_call_usage(used_model, response.usage, messages, response.choices[0].message.content)
+        return _check_output_complete(response.choices[0].message.content, response.choices[0].finish_reason)
     
     elif model == "deepseek":
         logger.info("model参数设置为deepseek,使用后端translate_ppt_page接口")
-        return call_backend_translate_ppt_page(text, "deepseek")
+        with _llm_call_slot("deepseek", estimated_tokens):
+            result = call_backend_translate_ppt_page(text, "deepseek")
+            # 后端接口不返回用量，按输入输出估算
+            _record_call_usage("deepseek", prompt_text=text, completion_text=result)
+        return _check_output_complete(result)
     
     elif model == "gpt4o":
         logger.info("model参数设置为gpt4o,使用后端translate_ppt_page接口")
-        return call_backend_translate_ppt_page(text, "gpt4o")
+        with _llm_call_slot("gpt4o", estimated_tokens):
+            result = call_backend_translate_ppt_page(text, "gpt4o")
+            # 后端接口不返回用量，按输入输出估算
+            _record_call_usage("gpt4o", prompt_text=text, completion_text=result)
+        return _check_output_complete(result)
     
     else:
         raise ValueError(f"不支持的模型: {model}")
@@ -141,7 +312,10 @@ def call_backend_translate_ppt_page(text, model, timeout=120):
         logger.info(f"正在调用后端API: {url}")
         logger.debug(f"请求载荷: {json.dumps(payload, ensure_ascii=False, indent=2)}")
         
-        response = requests.post(url, json=payload, headers=headers, timeout=timeout)
+        if llm_gateway is not None:
+            response = llm_gateway.post(url, json=payload, headers=headers, timeout=timeout)
+        else:
+            response = requests.post(url, json=payload, headers=headers, timeout=timeout)
         response.raise_for_status()
         
         result = response.json()
@@ -184,15 +358,15 @@ def call_backend_translate_ppt_page(text, model, timeout=120):
             logger.error(f"后端API调用失败: 状态码 {result.get('code')}, 错误信息: {error_msg}")
             raise ValueError(f"后端API调用失败: {error_msg}")
     
-    except requests.exceptions.Timeout:
+    except (requests.exceptions.Timeout, httpx.TimeoutException):
         logger.error(f"后端API调用超时 (超过 {timeout} 秒)")
         raise ValueError(f"后端API调用超时，请稍后重试")
     
-    except requests.exceptions.ConnectionError as e:
+    except (requests.exceptions.ConnectionError, httpx.TransportError) as e:
         logger.error(f"后端API连接错误: {e}")
         raise ValueError("无法连接到后端API服务器，请检查网络连接")
     
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, httpx.HTTPError) as e:
         logger.error(f"后端API请求异常: {e}")
         raise ValueError(f"后端API请求失败: {str(e)}")
     
@@ -249,6 +423,22 @@ def parse_formatted_text_async(text: str):
     cleaned_text = clean_translation_text(text)
     logger.debug(f"清理后待解析文本: {repr(cleaned_text)}")
     
+    if repair_json is not None:
+        # 本地修复（代码块、尾逗号、全角标点、未转义引号、截断等），全部失败才调用大模型
+        try:
+            return repair_json(cleaned_text)
+        except JsonRepairError as e:
+            logger.warning(f"本地修复JSON失败，尝试大模型修复: {e}")
+        fixed_text = clean_translation_text(re_parse_formatted_text_async(extract_json_block(cleaned_text)))
+        logger.debug(f"修复后待解析文本: {repr(fixed_text)}")
+        try:
+            result = json.loads(fixed_text, strict=False)
+        except json.JSONDecodeError:
+            json_repair_stats.record('failed')
+            raise
+        json_repair_stats.record('llm')
+        return result
+    
     # 先尝试直接用json解析
     try:
         return json.loads(cleaned_text)
@@ -280,11 +470,12 @@ def re_parse_formatted_text_async(text: str):
         修复后的文本
     """
     try:
-        client = OpenAI(api_key=QWEN_API_KEY, base_url="https://dashscope.aliyuncs.com/compatible-mode/v1")
-        response = client.chat.completions.create(
-            model="qwen2.5-72b-instruct",
-            messages=[
-                {"role": "system", "content": """
+        client = _qwen_client()
+        with _llm_call_slot("qwen", estimate_tokens(text) * 2):
+            response = client.chat.completions.create(
+                model="qwen2.5-72b-instruct",
+                messages=[
+                    {"role": "system", "content": """
                  你是一个 JSON 解析和修复专家。你的任务是修复一段 **可能存在格式错误的 JSON**，并输出一个 **严格符合 JSON 标准** 的 **格式正确的 JSON**。
 
 ### **规则要求：**
@@ -297,11 +488,12 @@ def re_parse_formatted_text_async(text: str):
 4. **不输出额外文本**：
    - **仅输出修复后的 JSON**，不要添加解释、注释或额外的说明文本。
    """},
-                {"role": "user", "content": text}
-            ],
-            temperature=0.3,
-            max_tokens=8000
-        )
+                    {"role": "user", "content": text}
+                ],
+                temperature=0.3,
+                max_tokens=8000
+            )
+            _record_call_usage("qwen2.5-72b-instruct", response.usage, text, response.choices[0].message.content)
         result = response.choices[0].message.content
         logger.info(f"JSON修复成功")
         return result
@@ -309,6 +501,12 @@ def re_parse_formatted_text_async(text: str):
         logger.error(f"修复JSON格式失败，返回原文: {str(e)}")
         return text
 
+def split_translation_fragments(target_text):
+    """
+    将一个段落的译文按[block]分割成片段列表
+    """
+    return [seg.strip() for seg in (target_text or '').split('[block]') if seg.strip()]
+
 def separate_translate_text(text_translate):
     """
     解析翻译后的JSON文本，提取所有target_language字段，并按文本框段落索引组织
@@ -373,7 +571,7 @@ def separate_translate_text(text_translate):
             key = f"{box_index}_{paragraph_index}"
             
             # 将翻译文本按[block]分割成片段
-            fragments = [seg.strip() for seg in target_language.split('[block]') if seg.strip()]
+            fragments = split_translation_fragments(target_language)
             box_paragraph_translations[key] = fragments
             
             logger.debug(f"解析文本框 {box_index} 段落 {paragraph_index}: {len(fragments)} 个片段")
@@ -422,7 +620,7 @@ def validate_page_indices(text_boxes_data):
     return page_indices
 
 
-def format_page_text_for_translation(text_boxes_data, page_index):
+def format_page_text_for_translation(text_boxes_data, page_index, references=None):
     """
     格式化指定页面的文本用于翻译API调用（支持段落层级）
     ✅ 修复版本：增强页面索引验证和日志
@@ -430,6 +628,7 @@ def format_page_text_for_translation(text_boxes_data, page_index):
     Args:
         text_boxes_data: 文本框段落数据列表
         page_index: 要处理的页面索引（PPT中的真实页面索引）
+        references: 可选的参考译文 [(原文, 译文)]，来自模糊翻译记忆
         
     Returns:
         str: 格式化后的页面文本内容
@@ -443,6 +642,7 @@ def format_page_text_for_translation(text_boxes_data, page_index):
     
     # ✅ 更清晰的页面标识，明确显示这是PPT中的真实页面索引
     formatted_text = f"第{page_index + 1}页内容（PPT原始页面索引：{page_index}）：\n\n"
+    formatted_text += format_reference_translations(references)
     
     # 按文本框和段落组织数据
     box_paragraphs_dict = {}
@@ -470,10 +670,479 @@ def format_page_text_for_translation(text_boxes_data, page_index):
     logger.debug(f"PPT第 {page_index + 1} 页（原始索引{page_index}）格式化了 {len(page_box_paragraphs)} 个文本框段落")
     return formatted_text.strip()
 
-def translate_pages_by_page(text_boxes_data, progress_callback, source_language, target_language, model):
+def _build_page_result(text_boxes_data, page_index, page_content, processing_sequence,
+                       translated_result=None, translated_fragments=None, error=None):
+    """
+    构造单页翻译结果字典（成功与失败共用同一结构）
+    """
+    page_box_paragraphs = [bp for bp in text_boxes_data if bp['page_index'] == page_index]
+    result = {
+        'original_content': page_content,
+        'translated_fragments': translated_fragments or {},
+        'box_paragraph_count': len(page_box_paragraphs),
+        'box_count': len(set(bp['box_index'] for bp in page_box_paragraphs)),
+        'ppt_page_number': page_index + 1,  # PPT中的显示页码
+        'processing_sequence': processing_sequence,  # 处理序号
+        'original_page_index': page_index  # 原始页面索引
+    }
+    if error is not None:
+        result['error'] = error
+    else:
+        result['translated_json'] = translated_result
+    return result
+
+def _box_paragraph_key(box_para):
+    """文本框段落在翻译结果中的键（1-based，与API返回格式一致）"""
+    return f"{box_para['box_index'] + 1}_{box_para['paragraph_index'] + 1}"
+
+def _lookup_translation_memory(page_box_paragraphs, source_language, target_language, model, glossary_fp):
+    """
+    在翻译记忆库中查找页面内各段落的译文
+
+    精确未命中的段落再查询模糊翻译记忆：模糊键相同（仅数字取值/句中标点不同）的命中直接复用，
+    其余命中只作为参考译文放入提示词。
+
+    Returns:
+        tuple: (cached_fragments, missing_box_paragraphs, references, fuzzy_hits)
+            - cached_fragments: {box_paragraph_key: fragments}，仅包含片段数与原文一致的命中
+            - missing_box_paragraphs: 仍需调用API翻译的文本框段落
+            - references: [(原文, 译文)]，供提示词参考的相似句
+            - fuzzy_hits: 通过模糊匹配直接复用的段落数
+    """
+    if translation_memory is None:
+        return {}, list(page_box_paragraphs), [], 0
+
+    cached = translation_memory.get_many(
+        [bp['combined_text'] for bp in page_box_paragraphs],
+        source_language, target_language, model, glossary_fp
+    )
+
+    cached_fragments = {}
+    missing_box_paragraphs = []
+    references = []
+    fuzzy_hits = 0
+    for bp in page_box_paragraphs:
+        target_text = cached.get(bp['combined_text'])
+        fragments = split_translation_fragments(target_text) if target_text else []
+        if fragments and len(fragments) == len(bp['texts']):
+            cached_fragments[_box_paragraph_key(bp)] = fragments
+            continue
+
+        match = fuzzy_translation_memory.lookup(bp['combined_text'], source_language, target_language,
+                                                model, glossary_fp)
+        if match is not None and match.reusable:
+            fragments = split_translation_fragments(match.adapted_target)
+            if len(fragments) == len(bp['texts']):
+                cached_fragments[_box_paragraph_key(bp)] = fragments
+                fuzzy_hits += 1
+                continue
+        if match is not None:
+            references.append((match.source, match.target))
+        missing_box_paragraphs.append(bp)
+    return cached_fragments, missing_box_paragraphs, references, fuzzy_hits
+
+def _store_translation_memory(box_paragraphs, translated_fragments, source_language, target_language,
+                              model, glossary_fp):
+    """
+    将API译文写入翻译记忆库，只缓存[block]片段数与原文一致的段落
+    """
+    if translation_memory is None:
+        return
+    pairs = []
+    for bp in box_paragraphs:
+        fragments = translated_fragments.get(_box_paragraph_key(bp))
+        if fragments and len(fragments) == len(bp['texts']):
+            pairs.append((bp['combined_text'], '[block]'.join(fragments)))
+    translation_memory.put_many(pairs, source_language, target_language, model, glossary_fp)
+    fuzzy_translation_memory.add_many(pairs, source_language, target_language, model, glossary_fp)
+
+def _prepare_page(text_boxes_data, page_index, processing_sequence, total_pages,
+                  source_language=None, target_language=None, model=None, glossary_fp="", glossary_matcher=None,
+                  restored_fragments=None):
+    """
+    准备单个页面：先取断点中已完成的段落，再在本地解决无需大模型的段落（数字、日期、编号、术语精确命中等），
+    再查询翻译记忆库，得到仍需调用API翻译的段落，并从术语表中找出这些段落里实际出现的术语
+
+    Returns:
+        dict: 页面准备结果；页面没有文本内容时返回None
+    """
+    logger.info("=" * 60)
+    logger.info(f"正在处理第 {processing_sequence}/{total_pages} 页")
+    logger.info(f"对应PPT第 {page_index + 1} 页（原始页面索引：{page_index}）")
+    logger.info("=" * 60)
+
+    # 生成该页的格式化文本
+    page_content = format_page_text_for_translation(text_boxes_data, page_index)
+
+    if not page_content:
+        logger.warning(f"PPT第 {page_index + 1} 页（原始索引{page_index}）没有文本内容，跳过")
+        return None
+
+    logger.info(f"PPT第 {page_index + 1} 页格式化完成:")
+    logger.info(f"  格式化文本长度: {len(page_content)} 字符")
+
+    page_box_paragraphs = [bp for bp in text_boxes_data if bp['page_index'] == page_index]
+    # 上次运行已完成的段落（片段数与原文一致才复用）
+    checkpoint_fragments = {}
+    if restored_fragments:
+        for bp in page_box_paragraphs:
+            fragments = restored_fragments.get(_box_paragraph_key(bp))
+            if fragments_acceptable(bp, fragments):
+                checkpoint_fragments[_box_paragraph_key(bp)] = fragments
+        if checkpoint_fragments:
+            logger.info(f"PPT第 {page_index + 1} 页从断点恢复 {len(checkpoint_fragments)}/{len(page_box_paragraphs)} 个段落")
+
+    local_fragments, remaining_box_paragraphs, local_stats = resolve_trivial_paragraphs(
+        [bp for bp in page_box_paragraphs if _box_paragraph_key(bp) not in checkpoint_fragments],
+        source_language, target_language, glossary_matcher
+    )
+    if local_fragments:
+        logger.info(f"PPT第 {page_index + 1} 页本地直接处理 {len(local_fragments)}/{len(page_box_paragraphs)} 个段落"
+                    f"（{local_stats['categories']}）")
+
+    cached_fragments, missing_box_paragraphs, references, fuzzy_hits = _lookup_translation_memory(
+        remaining_box_paragraphs, source_language, target_language, model, glossary_fp
+    )
+    if cached_fragments:
+        logger.info(f"PPT第 {page_index + 1} 页翻译记忆命中 {len(cached_fragments)}/{len(page_box_paragraphs)} 个段落"
+                    f"（其中模糊匹配 {fuzzy_hits} 个）")
+    cached_fragments.update(local_fragments)
+    cached_fragments.update(checkpoint_fragments)
+    if references:
+        logger.info(f"PPT第 {page_index + 1} 页附带 {len(references)} 条相似句参考译文")
+    if not missing_box_paragraphs:
+        logger.info(f"PPT第 {page_index + 1} 页所有段落均命中翻译记忆，跳过API调用")
+
+    glossary = ""
+    if glossary_matcher is not None and missing_box_paragraphs:
+        # 片段按字体格式切分，拼接后匹配，避免术语被[block]截断
+        page_text = "\n".join("".join(bp['texts']) for bp in missing_box_paragraphs)
+        hits = glossary_matcher.find(page_text)
+        glossary = format_page_glossary(hits.stop_words, hits.custom_translations)
+        if hits:
+            logger.info(f"PPT第 {page_index + 1} 页出现术语: 停翻词 {len(hits.stop_words)} 个，"
+                        f"自定义翻译 {len(hits.custom_translations)} 个（术语表共 {len(glossary_matcher)} 条）")
+
+    return {
+        'page_content': page_content,
+        'processing_sequence': processing_sequence,
+        'cached_fragments': cached_fragments,
+        'missing_box_paragraphs': missing_box_paragraphs,
+        'references': references,
+        'fuzzy_hits': fuzzy_hits,
+        'local_stats': local_stats,
+        'checkpoint_hits': len(checkpoint_fragments),
+        'glossary': glossary
+    }
+
+def _once_per_paragraph(on_paragraph):
+    """对冲时两个模型都会回调同一段落，每个段落只上报一次"""
+    reported = set()
+    lock = threading.Lock()
+
+    def callback(item):
+        key = (item.get('box_index'), item.get('paragraph_index'))
+        with lock:
+            if key in reported:
+                return
+            reported.add(key)
+        on_paragraph(item)
+    return callback
+
+def _translate_request(request, request_number, total_requests, model,
+                       source_language=None, target_language=None, glossary_fp="", on_paragraph=None,
+                       split_depth=0, memory_model=None):
+    """
+    执行一个打包后的翻译请求，供并发调度使用
+    流式模式下每收到一个段落的翻译就调用 on_paragraph（文本框序号为请求内编号）
+    输出被截断时保留已完整的段落，其余段落二分拆分后重新翻译，拆分次数记录在 request.truncation_splits
+    译文写入翻译记忆库时使用 memory_model（默认为 model），与查询时的任务主模型保持一致，
+    快速模型或备用模型产出的译文因此也能在下次上传时命中
+
+    Returns:
+        tuple: ({page_index: {"文本框_段落": fragments}}, 原始翻译结果)
+    """
+    memory_model = memory_model or model
+    request_content = request.format_text()
+    description = f"请求 {request_number}/{total_requests}" + (f"（截断拆分第{split_depth}层）" if split_depth else "")
+    paragraph_callback = on_paragraph
+
+    # 对冲：超过主模型近期延迟分位数仍未返回时向备用模型发起相同请求，主模型失败时直接转移
+    secondary_model = secondary_model_for(model) if UNO_HEDGE_ENABLED else None
+    if on_paragraph is not None and secondary_model:
+        on_paragraph = _once_per_paragraph(on_paragraph)
+
+    def attempt(attempt_model, cancel_event):
+        try:
+            translated_result = translate(request_content, attempt_model, on_paragraph=on_paragraph,
+                                          cancel_event=cancel_event)
+        except TranslationTruncatedError as e:
+            # 截断是请求过大而不是模型故障，不转向备用模型，由下面拆分请求
+            logger.warning(f"{description} {e}")
+            return attempt_model, e.partial_text, None
+        api_fragments = separate_translate_text(translated_result)
+        if not api_fragments and secondary_model:
+            raise ValueError(f"{attempt_model} 的翻译结果中没有解析出任何段落")
+        return attempt_model, translated_result, api_fragments
+
+    primary = timed_attempt(partial(attempt, model), model, request.output_tokens)
+    secondary = None
+    hedge_delay = None
+    if secondary_model:
+        secondary = timed_attempt(partial(attempt, secondary_model), secondary_model, request.output_tokens)
+        hedge_delay = model_latency_tracker.hedge_delay(model, request.output_tokens)
+
+    # 全局并发上限：所有任务共享，避免多任务同时压垮模型服务
+    with _global_page_semaphore:
+        logger.info(f"正在调用翻译API，{description}：{request.describe()}")
+        used_secondary, (used_model, translated_result, api_fragments) = run_hedged(
+            primary, secondary, hedge_delay, description)
+    if used_secondary:
+        logger.info(f"{description} 采用备用模型 {used_model} 的翻译结果")
+    if api_fragments is None:
+        return _split_truncated_request(request, request_number, total_requests, model, memory_model,
+                                        translated_result, source_language, target_language, glossary_fp,
+                                        paragraph_callback, split_depth)
+    logger.info(f"{description} 翻译完成")
+
+    logger.info("翻译结果:")
+    logger.info(f"  翻译结果长度: {len(translated_result)} 字符")
+    logger.info("-" * 40)
+    logger.info(translated_result)
+    logger.info("-" * 40)
+
+    # 把请求内的文本框编号映射回各页面
+    page_fragments = request.remap_fragments(api_fragments)
+    for page_index, fragments in page_fragments.items():
+        page_box_paragraphs = [bp for bp in request.box_paragraphs if bp['page_index'] == page_index]
+        _store_translation_memory(page_box_paragraphs, fragments,
+                                  source_language, target_language, memory_model, glossary_fp)
+    return page_fragments, translated_result
+
+def _split_truncated_request(request, request_number, total_requests, model, memory_model, partial_text,
+                             source_language, target_language, glossary_fp, on_paragraph, split_depth):
+    """
+    处理输出被截断的请求：保留截断前已完整输出的段落，其余段落二分成两个请求分别翻译后合并
+
+    不再用同样大小的请求重试，也不调用大模型修复被截断的JSON。
+
+    Returns:
+        tuple: 同 _translate_request
+    """
+    objects, _ = _parse_partial_output(partial_text)
+    salvaged = {}
+    for item in objects:
+        if item.get("box_index") is not None and item.get("paragraph_index") is not None:
+            salvaged[f"{item['box_index']}_{item['paragraph_index']}"] = \
+                split_translation_fragments(item.get("target_language", ""))
+
+    page_fragments = request.remap_fragments(salvaged)
+    remaining = []
+    for bp in request.box_paragraphs:
+        page = page_fragments[bp['page_index']]
+        key = _box_paragraph_key(bp)
+        if fragments_acceptable(bp, page.get(key)):
+            continue
+        page.pop(key, None)
+        remaining.append(bp)
+    for page_index, fragments in page_fragments.items():
+        if fragments:
+            page_box_paragraphs = [bp for bp in request.box_paragraphs if bp['page_index'] == page_index]
+            _store_translation_memory(page_box_paragraphs, fragments,
+                                      source_language, target_language, memory_model, glossary_fp)
+
+    logger.warning(f"请求 {request_number}/{total_requests} 输出被截断（{request.describe()}），"
+                   f"保留 {len(request) - len(remaining)} 个完整段落，剩余 {len(remaining)} 个段落拆分重译")
+    if not remaining:
+        return page_fragments, partial_text
+    if len(remaining) == 1 or split_depth >= UNO_TRUNCATION_MAX_SPLIT_DEPTH:
+        raise ValueError(f"翻译输出被截断且无法继续拆分（剩余 {len(remaining)} 个段落，已拆分 {split_depth} 层）")
+
+    for page_index in {bp['page_index'] for bp in remaining}:
+        request.truncation_splits[page_index] = request.truncation_splits.get(page_index, 0) + 1
+
+    raw_results = [partial_text]
+    for half in request.bisect(remaining):
+        half_fragments, half_result = _translate_request(
+            half, request_number, total_requests, model, source_language, target_language, glossary_fp,
+            on_paragraph, split_depth + 1, memory_model)
+        for page_index, fragments in half_fragments.items():
+            page_fragments.setdefault(page_index, {}).update(fragments)
+        for page_index, count in half.truncation_splits.items():
+            request.truncation_splits[page_index] = request.truncation_splits.get(page_index, 0) + count
+        raw_results.append(half_result)
+    return page_fragments, "\n".join(r for r in raw_results if r)
+
+def _translate_routed_request(request, request_number, total_requests, model,
+                              source_language=None, target_language=None, glossary_fp="", on_paragraph=None):
+    """
+    执行一个翻译请求；请求被路由到快速模型时逐段校验结果，
+    不合格的段落（或整个请求失败时的全部段落）回退到主模型重新翻译
+
+    Returns:
+        tuple: 同 _translate_request
+    """
+    request_model = request.model or model
+    route = ROUTE_FAST if request_model != model else ROUTE_PRIMARY
+    start = time.monotonic()
+    try:
+        page_fragments, translated_result = _translate_request(
+            request, request_number, total_requests, request_model,
+            source_language, target_language, glossary_fp, on_paragraph, memory_model=model)
+    except Exception as e:
+        model_route_stats.record(route, len(request), time.monotonic() - start, failed=True)
+        if route == ROUTE_PRIMARY:
+            raise
+        logger.warning(f"快速模型 {request_model} 请求失败，{len(request)} 个段落回退到 {model}: {e}")
+        page_fragments, translated_result = {page_index: {} for page_index in request.page_indices}, ""
+        rejected = list(request.box_paragraphs)
+        fast_failed = True
+    else:
+        model_route_stats.record(route, len(request), time.monotonic() - start)
+        if route == ROUTE_PRIMARY:
+            return page_fragments, translated_result
+        rejected = [
+            bp for bp in request.box_paragraphs
+            if not fragments_acceptable(bp, page_fragments.get(bp['page_index'], {}).get(_box_paragraph_key(bp)))
+        ]
+        if not rejected:
+            return page_fragments, translated_result
+        logger.warning(f"快速模型 {request_model} 有 {len(rejected)}/{len(request)} 个段落结果不合格，回退到 {model}")
+        for bp in rejected:
+            page_fragments.get(bp['page_index'], {}).pop(_box_paragraph_key(bp), None)
+        fast_failed = False
+
+    model_route_stats.record_fallback(ROUTE_FAST, len(rejected))
+    fallback = TranslationRequest()
+    for bp in rejected:
+        fallback.add_page_glossary(bp['page_index'], request.glossaries.get(bp['page_index']))
+        fallback.add(bp)
+
+    start = time.monotonic()
+    try:
+        # 流式进度已经由快速模型上报过，回退请求不再重复计数
+        fallback_fragments, fallback_result = _translate_request(
+            fallback, request_number, total_requests, model, source_language, target_language, glossary_fp)
+    except Exception as e:
+        model_route_stats.record(ROUTE_PRIMARY, len(fallback), time.monotonic() - start, failed=True)
+        if fast_failed:
+            raise
+        logger.error(f"回退到 {model} 的请求失败，{len(rejected)} 个段落保留原文: {e}")
+        return page_fragments, translated_result
+    model_route_stats.record(ROUTE_PRIMARY, len(fallback), time.monotonic() - start)
+
+    for page_index, fragments in fallback_fragments.items():
+        page_fragments.setdefault(page_index, {}).update(fragments)
+    for page_index, count in fallback.truncation_splits.items():
+        request.truncation_splits[page_index] = request.truncation_splits.get(page_index, 0) + count
+    return page_fragments, "\n".join(r for r in (translated_result, fallback_result) if r)
+
+def _format_block_repair_preamble(request, contexts):
+    """
+    生成[block]格式修复请求的说明：逐段列出必须保持的片段数，并附上相邻段落的原文和已有译文
+
+    Args:
+        request: 修复请求
+        contexts: {page_index: [(原文, 译文或None)]}
+    """
+    text = "【格式修复】以下段落上一次翻译时[block]分隔符数量与原文不一致，请重新翻译。\n"
+    text += "每个段落译文中的[block]数量必须与原文完全相同，并放在与原文相同词义的位置；只输出下列段落：\n"
+    for box_para in request.box_paragraphs:
+        count = len(box_para['texts'])
+        text += f"- 第{box_para['page_index'] + 1}页 {request.paragraph_label(box_para)}：{count} 个片段（{count - 1} 个[block]）\n"
+    context_lines = [(source, target) for page_index in request.page_indices for source, target in contexts.get(page_index, [])]
+    if context_lines:
+        text += "\n【上下文】（相邻段落及其译文，仅用于理解语境，不需要翻译或输出）\n"
+        for source, target in context_lines:
+            text += f"原文：{source.replace('[block]', ' ')}\n"
+            if target:
+                text += f"译文：{target}\n"
+    return text + "\n"
+
+def _repair_fragment_mismatches(text_boxes_data, page_fragments, candidates, model, source_language=None,
+                                target_language=None, glossary_fp="", glossaries=None):
+    """
+    只重新请求[block]片段数与原文不一致的段落，修复结果合格时替换原译文
+
+    比整页重试便宜得多：请求只包含不一致的段落，相邻段落作为上下文放在说明中，不要求输出。
+
+    Args:
+        text_boxes_data: 全部文本框段落数据（用于取相邻段落）
+        page_fragments: {page_index: {"文本框_段落": fragments}}，就地更新
+        candidates: 本次调用API翻译的段落（翻译记忆和本地快速通道的结果不参与修复）
+        glossaries: {page_index: 术语表文本}
+
+    Returns:
+        dict: {'attempted': 重新请求的段落数, 'repaired': 修复成功的段落数, 'requests': 请求数}
+    """
+    stats = {'attempted': 0, 'repaired': 0, 'requests': 0}
+    mismatched = [
+        bp for bp in candidates
+        if bp['page_index'] in page_fragments and _box_paragraph_key(bp) in page_fragments[bp['page_index']]
+        and not fragments_acceptable(bp, page_fragments[bp['page_index']][_box_paragraph_key(bp)])
+    ]
+    if not mismatched:
+        return stats
+
+    # 相邻段落：同一页内按文本框、段落顺序排列后取前后各 UNO_BLOCK_REPAIR_CONTEXT 个
+    mismatched_ids = {id(bp) for bp in mismatched}
+    contexts = {}
+    for page_index in sorted({bp['page_index'] for bp in mismatched}):
+        ordered = sorted((bp for bp in text_boxes_data if bp['page_index'] == page_index),
+                         key=lambda bp: (bp['box_index'], bp['paragraph_index']))
+        positions = {id(bp): position for position, bp in enumerate(ordered)}
+        neighbours = set()
+        for bp in mismatched:
+            if bp['page_index'] != page_index:
+                continue
+            position = positions[id(bp)]
+            for offset in range(1, UNO_BLOCK_REPAIR_CONTEXT + 1):
+                neighbours.update(p for p in (position - offset, position + offset) if 0 <= p < len(ordered))
+        lines = []
+        for position in sorted(neighbours):
+            neighbour = ordered[position]
+            if id(neighbour) in mismatched_ids:
+                continue
+            fragments = page_fragments[page_index].get(_box_paragraph_key(neighbour))
+            lines.append((neighbour['combined_text'], " ".join(fragments) if fragments else None))
+        contexts[page_index] = lines
+
+    repair_requests = pack_translation_requests([
+        (page_index, [bp for bp in mismatched if bp['page_index'] == page_index], None)
+        for page_index in sorted(contexts)
+    ], glossaries=glossaries)
+    stats['attempted'] = len(mismatched)
+    stats['requests'] = len(repair_requests)
+    logger.info(f"[block]格式修复: {len(mismatched)} 个段落片段数与原文不一致，重新请求（{len(repair_requests)} 个请求）")
+
+    for request_number, request in enumerate(repair_requests, 1):
+        request.preamble = _format_block_repair_preamble(request, contexts)
+        try:
+            repaired_fragments, _ = _translate_request(request, request_number, len(repair_requests), model,
+                                                       source_language, target_language, glossary_fp)
+        except Exception as e:
+            logger.warning(f"[block]格式修复请求 {request_number}/{len(repair_requests)} 失败，保留原译文: {e}")
+            continue
+        for bp in request.box_paragraphs:
+            key = _box_paragraph_key(bp)
+            fragments = repaired_fragments.get(bp['page_index'], {}).get(key)
+            if fragments_acceptable(bp, fragments):
+                page_fragments[bp['page_index']][key] = fragments
+                stats['repaired'] += 1
+            else:
+                logger.warning(f"PPT第 {bp['page_index'] + 1} 页段落 {key} 修复后片段数仍不一致，保留原译文")
+
+    logger.info(f"[block]格式修复完成: {stats['repaired']}/{stats['attempted']} 个段落修复成功")
+    return stats
+
+def translate_pages_by_page(text_boxes_data, progress_callback, source_language, target_language, model,
+                            max_concurrency=None, glossary_fp="",
+                            stop_words_list=None, custom_translations=None, checkpoint=None):
     """
-    按页翻译文本内容，每页调用一次翻译API（支持段落层级）
+    按页翻译文本内容（支持段落层级）
     ✅ 修复版本：正确处理页面索引和进度回调
+    ✅ 并发版本：同一任务内最多 max_concurrency 个请求同时在途，并受全局并发上限约束
+    ✅ 打包版本：按token预算合并稀疏页面、拆分超长页面，详见 request_packer
     
     Args:
         text_boxes_data: 文本框段落数据列表
@@ -481,9 +1150,14 @@ def translate_pages_by_page(text_boxes_data, progress_callback, source_language,
         source_language: 源语言
         target_language: 目标语言
         model: 使用的翻译模型
+        max_concurrency: 单任务并发请求数，默认取 UNO_PAGE_CONCURRENCY
+        glossary_fp: 术语表指纹，参与翻译记忆库缓存键
+        stop_words_list: 停翻词列表，每页只注入该页出现的部分
+        custom_translations: 自定义翻译字典，每页只注入该页出现的部分
+        checkpoint: 可选的 TranslationCheckpoint，已完成的页面从断点恢复，每页完成后立即写入断点
         
     Returns:
-        dict: 翻译结果，格式为 {page_index: translated_content}
+        dict: 翻译结果，格式为 {page_index: translated_content}，按页面索引升序
     """
     logger.info(f"开始按页翻译（段落层级），共 {len(text_boxes_data)} 个文本框段落")
     
@@ -514,86 +1188,168 @@ def translate_pages_by_page(text_boxes_data, progress_callback, source_language,
             logger.info(f"    文本框 {box_idx + 1}: {box_para_dist[box_idx]} 个段落")
     logger.info("=" * 50)
     
-    translation_results = {}
+    page_results = {}
     
     # 初始化进度回调
     if progress_callback:
         progress_callback(0, total_pages)
     
-    # ✅ 修复：使用枚举来获取正确的进度序号，同时保持真实的页面索引
+    # 术语表编译结果按术语表缓存，同一用户的后续任务直接复用
+    glossary_matcher = None
+    if get_glossary_matcher is not None and (stop_words_list or custom_translations):
+        glossary_matcher = get_glossary_matcher(stop_words_list, custom_translations)
+    
+    # 上次运行（同一文件、同样参数）已完成的页面
+    restored_pages = checkpoint.load() if checkpoint is not None else {}
+    
+    # 先查询翻译记忆库，再把各页未命中的段落按token预算打包成请求
+    prepared_pages = {}
     for current_page_number, page_index in enumerate(page_indices_sorted, 1):
-        logger.info("=" * 60)
-        logger.info(f"正在处理第 {current_page_number}/{total_pages} 页")
-        logger.info(f"对应PPT第 {page_index + 1} 页（原始页面索引：{page_index}）")
-        logger.info("=" * 60)
-        
-        # ✅ 修复：使用正确的当前页面数进行进度回调
-        if progress_callback:
-            progress_callback(current_page_number - 1, total_pages)
-        
-        # 生成该页的格式化文本
-        page_content = format_page_text_for_translation(text_boxes_data, page_index)
-        
-        if not page_content:
-            logger.warning(f"PPT第 {page_index + 1} 页（原始索引{page_index}）没有文本内容，跳过")
-            continue
-        
-        logger.info(f"PPT第 {page_index + 1} 页格式化完成:")
-        logger.info(f"  格式化文本长度: {len(page_content)} 字符")
-        logger.info("-" * 40)
-        # logger.info(page_content)  # 可以取消注释查看详细内容
-        logger.info("-" * 40)
+        prepared = _prepare_page(text_boxes_data, page_index, current_page_number, total_pages,
+                                 source_language, target_language, model, glossary_fp, glossary_matcher,
+                                 restored_pages.get(page_index))
+        if prepared is not None:
+            prepared_pages[page_index] = prepared
+    
+    glossaries = {page_index: prepared['glossary'] for page_index, prepared in prepared_pages.items()}
+    fast_model = fast_model_for(model)
+    if fast_model:
+        # 短而简单的段落单独打包交给快速模型，长段落仍由主模型翻译；主模型请求先提交，缩短整体耗时
+        routed = {page_index: route_box_paragraphs(prepared['missing_box_paragraphs'])
+                  for page_index, prepared in prepared_pages.items()}
+        translation_requests = pack_translation_requests([
+            (page_index, routed[page_index][1], prepared['references'])
+            for page_index, prepared in prepared_pages.items()
+        ], glossaries=glossaries)
+        fast_requests = pack_translation_requests([
+            (page_index, routed[page_index][0], None) for page_index in prepared_pages
+        ], glossaries=glossaries)
+        for request in fast_requests:
+            request.model = fast_model
+        logger.info(f"按段落路由: {sum(len(r) for r in fast_requests)} 个短段落交给快速模型 {fast_model}"
+                    f"（{len(fast_requests)} 个请求），其余由 {model} 翻译")
+        translation_requests.extend(fast_requests)
+    else:
+        translation_requests = pack_translation_requests([
+            (page_index, prepared['missing_box_paragraphs'], prepared['references'])
+            for page_index, prepared in prepared_pages.items()
+        ], glossaries=glossaries)
+    pages_to_translate = sum(1 for prepared in prepared_pages.values() if prepared['missing_box_paragraphs'])
+    logger.info(f"请求打包完成: {pages_to_translate} 页需要调用API，合并/拆分为 {len(translation_requests)} 个请求")
+    
+    # 每页需要等待的请求数；为0的页面（无文本或全部命中翻译记忆）直接视为完成
+    pending_requests = {page_index: 0 for page_index in page_indices_sorted}
+    for request in translation_requests:
+        for page_index in request.page_indices:
+            pending_requests[page_index] += 1
+    page_fragments = {page_index: dict(prepared['cached_fragments'])
+                      for page_index, prepared in prepared_pages.items()}
+    page_raw_results = {page_index: [] for page_index in prepared_pages}
+    page_errors = {}
+    # 输出被截断后各页的二分拆分次数
+    page_truncation_splits = {}
+    
+    # 段落级进度：流式输出中每闭合一个段落对象计数一次
+    total_api_paragraphs = sum(len(request) for request in translation_requests)
+    received_paragraphs = [0]
+    paragraph_lock = threading.Lock()
+
+    def _on_paragraph_received(request_number, item):
+        with paragraph_lock:
+            received_paragraphs[0] += 1
+            received = received_paragraphs[0]
+        logger.info(f"请求 {request_number} 收到段落译文（请求内文本框{item.get('box_index')}-段落{item.get('paragraph_index')}），"
+                    f"累计 {received}/{total_api_paragraphs}")
+
+    completed_pages = sum(1 for count in pending_requests.values() if count == 0)
+    if progress_callback and completed_pages:
+        progress_callback(completed_pages, total_pages)
+    
+    if translation_requests:
+        concurrency = max(1, min(max_concurrency or UNO_PAGE_CONCURRENCY, len(translation_requests)))
+        logger.info(f"请求并发数: {concurrency}（全局上限 {UNO_GLOBAL_PAGE_CONCURRENCY}）")
         
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="uno_page")
+        futures = {}
         try:
-            # 调用翻译API
-            logger.info(f"正在调用翻译API翻译PPT第 {page_index + 1} 页...")
-            translated_result = translate(page_content, model)          
-            logger.info(f"PPT第 {page_index + 1} 页翻译完成")
-            
-            logger.info("翻译结果:")
-            logger.info(f"  翻译结果长度: {len(translated_result)} 字符")
-            logger.info("-" * 40)
-            logger.info(translated_result)  # 可以取消注释查看详细内容
-            logger.info("-" * 40)
-            
-            # 解析翻译结果
-            translated_fragments = separate_translate_text(translated_result)
-            
-            # 存储翻译结果 - 使用真实的页面索引作为键
-            page_box_paragraphs = [bp for bp in text_boxes_data if bp['page_index'] == page_index]
-            
-            translation_results[page_index] = {  # ✅ 使用真实的页面索引作为键
-                'original_content': page_content,
-                'translated_json': translated_result,
-                'translated_fragments': translated_fragments,
-                'box_paragraph_count': len(page_box_paragraphs),
-                'box_count': len(set(bp['box_index'] for bp in page_box_paragraphs)),
-                'ppt_page_number': page_index + 1,  # PPT中的显示页码
-                'processing_sequence': current_page_number,  # 处理序号
-                'original_page_index': page_index  # 原始页面索引
+            # 每个请求携带提交时的上下文，调用计量归属到当前任务
+            futures = {
+                executor.submit(contextvars.copy_context().run,
+                                _translate_routed_request, request, request_number, len(translation_requests), model,
+                                source_language, target_language, glossary_fp,
+                                partial(_on_paragraph_received, request_number)): request
+                for request_number, request in enumerate(translation_requests, 1)
             }
             
-            logger.info(f"PPT第 {page_index + 1} 页翻译完成，得到 {len(translated_fragments)} 个文本框段落的翻译")
-            
+            for future in as_completed(futures):
+                request = futures[future]
+                try:
+                    request_fragments, translated_result = future.result()
+                except Exception as e:
+                    logger.error(f"翻译请求失败（{request.describe()}）: {e}", exc_info=True)
+                    # 如果翻译失败，记录错误信息；拆分页面的任一部分失败，整页视为失败
+                    for page_index in request.page_indices:
+                        page_errors.setdefault(page_index, str(e))
+                else:
+                    for page_index, fragments in request_fragments.items():
+                        page_fragments[page_index].update(fragments)
+                        page_raw_results[page_index].append(translated_result)
+                for page_index, count in request.truncation_splits.items():
+                    page_truncation_splits[page_index] = page_truncation_splits.get(page_index, 0) + count
+                
+                # 页面的所有请求都完成后才计入进度；进度回调只在调度线程中触发，保证单调递增
+                for page_index in request.page_indices:
+                    pending_requests[page_index] -= 1
+                    if pending_requests[page_index] == 0:
+                        if checkpoint is not None and page_index not in page_errors:
+                            checkpoint.save_page(page_index, {
+                                key: fragments for key, fragments in page_fragments[page_index].items()
+                                if fragments})
+                        completed_pages += 1
+                        if progress_callback:
+                            progress_callback(completed_pages, total_pages)
+        except BaseException:
+            # 任务被取消或回调异常时，放弃尚未开始的请求
+            for future in futures:
+                future.cancel()
+            raise
+        finally:
+            executor.shutdown(wait=False)
+    
+    # 只重新请求[block]片段数不一致的段落，而不是整页重试
+    block_repair_stats = None
+    if UNO_BLOCK_REPAIR_ENABLED and translation_requests:
+        block_repair_stats = _repair_fragment_mismatches(
+            text_boxes_data,
+            {page_index: fragments for page_index, fragments in page_fragments.items() if page_index not in page_errors},
+            [bp for request in translation_requests for bp in request.box_paragraphs],
+            model, source_language, target_language, glossary_fp, glossaries)
+    
+    # ✅ 使用真实的页面索引构造结果，并按页面顺序排列
+    for page_index, prepared in prepared_pages.items():
+        if page_index in page_errors:
+            page_result = _build_page_result(text_boxes_data, page_index, prepared['page_content'],
+                                             prepared['processing_sequence'], error=page_errors[page_index])
+        else:
+            fragments = page_fragments[page_index]
+            logger.info(f"PPT第 {page_index + 1} 页翻译完成，得到 {len(fragments)} 个文本框段落的翻译")
             # 显示翻译结果的键值对应关系
             logger.info("翻译结果键值映射:")
-            for key, fragments in translated_fragments.items():
-                logger.info(f"    {key}: {len(fragments)} 个片段")
-            
-        except Exception as e:
-            logger.error(f"翻译PPT第 {page_index + 1} 页时出错: {e}", exc_info=True)
-            # 如果翻译失败，记录错误信息
-            page_box_paragraphs = [bp for bp in text_boxes_data if bp['page_index'] == page_index]
-            translation_results[page_index] = {
-                'original_content': page_content,
-                'error': str(e),
-                'translated_fragments': {},
-                'box_paragraph_count': len(page_box_paragraphs),
-                'box_count': len(set(bp['box_index'] for bp in page_box_paragraphs)),
-                'ppt_page_number': page_index + 1,
-                'processing_sequence': current_page_number,
-                'original_page_index': page_index
-            }
+            for key, key_fragments in fragments.items():
+                logger.info(f"    {key}: {len(key_fragments)} 个片段")
+            page_result = _build_page_result(text_boxes_data, page_index, prepared['page_content'],
+                                             prepared['processing_sequence'],
+                                             translated_result="\n".join(page_raw_results[page_index]) or None,
+                                             translated_fragments=fragments)
+        page_result['local_hits'] = prepared['local_stats']['segments']
+        page_result['checkpoint_hits'] = prepared['checkpoint_hits']
+        page_result['tm_hits'] = len(prepared['cached_fragments']) - page_result['local_hits'] - prepared['checkpoint_hits']
+        page_result['tm_fuzzy_hits'] = prepared['fuzzy_hits']
+        page_result['truncation_splits'] = page_truncation_splits.get(page_index, 0)
+        page_results[page_index] = page_result
+    
+    translation_results = {page_index: page_results[page_index]
+                           for page_index in page_indices_sorted if page_index in page_results}
     
     # 完成进度回调
     if progress_callback:
@@ -608,12 +1364,46 @@ def translate_pages_by_page(text_boxes_data, progress_callback, source_language,
     failed_pages = len([r for r in translation_results.values() if 'error' in r])
     total_box_paragraphs_translated = sum(len(r.get('translated_fragments', {})) for r in translation_results.values())
     total_boxes_translated = sum(r.get('box_count', 0) for r in translation_results.values())
+    total_tm_hits = sum(r.get('tm_hits', 0) for r in translation_results.values())
+    total_fuzzy_hits = sum(r.get('tm_fuzzy_hits', 0) for r in translation_results.values())
     
     logger.info("翻译统计:")
     logger.info(f"  - 成功翻译页数: {successful_pages}")
     logger.info(f"  - 翻译失败页数: {failed_pages}")
     logger.info(f"  - 总翻译文本框数: {total_boxes_translated}")
     logger.info(f"  - 总翻译文本框段落数: {total_box_paragraphs_translated}")
+    local_segments = sum(prepared['local_stats']['segments'] for prepared in prepared_pages.values())
+    local_tokens = sum(prepared['local_stats']['input_tokens'] + prepared['local_stats']['output_tokens']
+                       for prepared in prepared_pages.values())
+    logger.info(f"  - 本地快速通道段落数: {local_segments}（节省约 {local_tokens} 输入+输出token）")
+    checkpoint_hits = sum(prepared['checkpoint_hits'] for prepared in prepared_pages.values())
+    if checkpoint_hits:
+        logger.info(f"  - 从断点恢复段落数: {checkpoint_hits}")
+    logger.info(f"  - 翻译记忆命中段落数: {total_tm_hits}（其中模糊匹配 {total_fuzzy_hits}）")
+    logger.info(f"  - 翻译API请求数: {len(translation_requests)}")
+    if block_repair_stats and block_repair_stats['attempted']:
+        logger.info(f"  - [block]格式修复: 重新请求 {block_repair_stats['attempted']} 个段落，"
+                    f"修复成功 {block_repair_stats['repaired']} 个（{block_repair_stats['requests']} 个请求）")
+    if page_truncation_splits:
+        split_pages = "、".join(f"第{page_index + 1}页×{count}" for page_index, count in sorted(page_truncation_splits.items()))
+        logger.info(f"  - 输出截断拆分: 共 {sum(page_truncation_splits.values())} 次（{split_pages}）")
+    if translation_memory is not None:
+        tm_stats = translation_memory.get_stats()
+        logger.info(f"  - 翻译记忆库累计命中率: {tm_stats['hit_rate']:.2f}%（命中 {tm_stats['hits']}，未命中 {tm_stats['misses']}）")
+    if fast_model:
+        for route, stats in model_route_stats.get_stats().items():
+            logger.info(f"  - 路由[{route}]累计: {stats['requests']} 个请求，{stats['paragraphs']} 个段落，"
+                        f"平均延迟 {stats['avg_latency']:.2f}s，失败 {stats['failures']} 次，"
+                        f"质量回退 {stats['fallback_paragraphs']} 个段落")
+    if UNO_HEDGE_ENABLED:
+        stats = hedge_stats.get_stats()
+        logger.info(f"  - 请求对冲累计: {stats['calls']} 次请求，对冲 {stats['hedged']} 次，"
+                    f"故障转移 {stats['failovers']} 次，备用模型胜出 {stats['secondary_wins']} 次")
+    if repair_json is not None:
+        repair_stats = json_repair_stats.get_stats()
+        repaired = ", ".join(f"{k}={repair_stats[k]}" for k in ('extract', 'literal_eval', 'normalize',
+                                                                'truncated', 'salvaged', 'llm', 'failed'))
+        logger.info(f"  - JSON解析累计 {repair_stats['total']} 次，需修复比例 {repair_stats['repair_rate']:.2f}%（{repaired}）")
     
     # ✅ 增强：显示详细的页面处理信息，验证页面索引映射正确性
     logger.info("详细页面处理验证:")
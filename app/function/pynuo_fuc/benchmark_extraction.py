@@ -0,0 +1,154 @@
+'''
+benchmark_extraction.py
+对比文本框内容提取的两种读取方式：逐字符移动游标 vs 按段落/portion枚举
+两种方式对同一文本框的输出必须完全一致，脚本同时校验一致性并输出耗时与加速比
+
+用法（需要先启动soffice监听服务，端口2002）:
+    python benchmark_extraction.py 文件.pptx [--pages 1,2,3] [--repeat 3]
+    python benchmark_extraction.py --synthetic [--boxes 6] [--chars 2000]   # 生成文字密集的测试页
+'''
+import uno  # type: ignore
+import sys, os
+sys.path.insert(0, os.path.dirname(__file__))
+import time
+import argparse
+from read_ppt_page_uno import (connect_to_libreoffice, iter_text_portions, iter_text_characters,
+                               _split_runs_into_fragments)
+
+
+def _property(name, value):
+    prop = uno.createUnoStruct('com.sun.star.beans.PropertyValue')
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+def open_presentation(context, ppt_path):
+    desktop = context.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", context)
+    file_url = uno.systemPathToFileUrl(os.path.abspath(ppt_path))
+    return desktop.loadComponentFromURL(file_url, "_blank", 0,
+                                        (_property("Hidden", True), _property("ReadOnly", True)))
+
+
+def create_synthetic_presentation(context, boxes, chars, run_length=24, paragraph_length=240):
+    """新建一页包含 boxes 个文本框的演示文稿，每个文本框约 chars 个字符，加粗/颜色每 run_length 个字符交替一次"""
+    desktop = context.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", context)
+    presentation = desktop.loadComponentFromURL("private:factory/simpress", "_blank", 0, (_property("Hidden", True),))
+    slide = presentation.getDrawPages().getByIndex(0)
+    paragraph_break = uno.getConstantByName("com.sun.star.text.ControlCharacter.PARAGRAPH_BREAK")
+    sample = "Quarterly revenue grew in every region while operating costs stayed flat. "
+
+    for box_index in range(boxes):
+        shape = presentation.createInstance("com.sun.star.drawing.TextShape")
+        slide.add(shape)
+        size = uno.createUnoStruct('com.sun.star.awt.Size')
+        size.Width, size.Height = 12000, 4000
+        position = uno.createUnoStruct('com.sun.star.awt.Point')
+        position.X, position.Y = 1000, 1000 + box_index * 500
+        shape.setSize(size)
+        shape.setPosition(position)
+
+        text = shape.getText()
+        cursor = text.createTextCursor()
+        written = 0
+        run_index = 0
+        while written < chars:
+            run = (sample * 2)[written % len(sample):][:run_length]
+            text.insertString(cursor, run, False)
+            cursor.goLeft(len(run), True)
+            cursor.setPropertyValue("CharWeight", 150.0 if run_index % 2 else 100.0)
+            cursor.setPropertyValue("CharColor", 0xC00000 if run_index % 3 == 0 else 0x000000)
+            cursor.collapseToEnd()
+            written += len(run)
+            run_index += 1
+            if written % paragraph_length < run_length and written < chars:
+                text.insertControlCharacter(cursor, paragraph_break, False)
+    return presentation
+
+
+def extract_with(shape, use_portions):
+    text = shape.getText()
+    text_str = text.getString()
+    runs = iter_text_portions(text) if use_portions else iter_text_characters(text, text_str)
+    return _split_runs_into_fragments(runs)
+
+
+def benchmark_presentation(presentation, page_indices, repeat):
+    slides = presentation.getDrawPages()
+    if page_indices is None:
+        page_indices = list(range(slides.getCount()))
+
+    total_chars = 0
+    total_cursor = 0.0
+    total_portion = 0.0
+    mismatches = 0
+    print(f"{'页':<4} {'文本框':<6} {'字符数':<8} {'逐字符(s)':<12} {'portion(s)':<12} {'加速比':<8}")
+    for page_index in page_indices:
+        slide = slides.getByIndex(page_index)
+        page_chars = 0
+        page_cursor = 0.0
+        page_portion = 0.0
+        page_boxes = 0
+        for shape_index in range(slide.getCount()):
+            shape = slide.getByIndex(shape_index)
+            if not hasattr(shape, 'getString') or not shape.getString().strip():
+                continue
+            page_boxes += 1
+            page_chars += len(shape.getString())
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                cursor_result = extract_with(shape, use_portions=False)
+            page_cursor += (time.perf_counter() - start) / repeat
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                portion_result = extract_with(shape, use_portions=True)
+            page_portion += (time.perf_counter() - start) / repeat
+
+            if cursor_result != portion_result:
+                mismatches += 1
+                print(f"  ⚠️ 第 {page_index + 1} 页形状 {shape_index} 两种方式结果不一致")
+
+        speedup = page_cursor / page_portion if page_portion else 0.0
+        print(f"{page_index + 1:<4} {page_boxes:<6} {page_chars:<8} {page_cursor:<12.3f} {page_portion:<12.3f} {speedup:<8.1f}")
+        total_chars += page_chars
+        total_cursor += page_cursor
+        total_portion += page_portion
+
+    speedup = total_cursor / total_portion if total_portion else 0.0
+    print("-" * 56)
+    print(f"合计: {total_chars} 字符，逐字符 {total_cursor:.3f}s，portion {total_portion:.3f}s，加速 {speedup:.1f} 倍")
+    print("结果一致" if not mismatches else f"有 {mismatches} 个文本框结果不一致")
+    return mismatches == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比文本框提取的逐字符读取与portion枚举")
+    parser.add_argument("ppt_path", nargs="?", help="PPTX/ODP文件路径")
+    parser.add_argument("--pages", help="要测试的页码（1-based，逗号分隔），默认全部")
+    parser.add_argument("--repeat", type=int, default=1, help="每个文本框重复次数")
+    parser.add_argument("--synthetic", action="store_true", help="生成文字密集的测试页代替输入文件")
+    parser.add_argument("--boxes", type=int, default=6, help="测试页文本框数（--synthetic）")
+    parser.add_argument("--chars", type=int, default=2000, help="每个文本框的字符数（--synthetic）")
+    args = parser.parse_args()
+
+    if not args.ppt_path and not args.synthetic:
+        parser.error("需要指定PPT文件路径或 --synthetic")
+
+    context = connect_to_libreoffice()
+    if args.synthetic:
+        presentation = create_synthetic_presentation(context, args.boxes, args.chars)
+    else:
+        presentation = open_presentation(context, args.ppt_path)
+    page_indices = [int(page) - 1 for page in args.pages.split(",")] if args.pages else None
+
+    try:
+        ok = benchmark_presentation(presentation, page_indices, max(1, args.repeat))
+    finally:
+        presentation.close(True)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
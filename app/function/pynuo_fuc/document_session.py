@@ -0,0 +1,155 @@
+'''
+document_session.py
+单文档会话：原始PPTX在soffice中只加载一次，读取、写入都在这个已加载的文档上进行，最后直接导出为PPTX
+
+原流程每个任务要经过 PPTX->ODP（加载+保存）、读取时加载ODP、写入时加载ODP并保存、ODP->PPTX（加载+保存）
+四次完整的导入导出；会话模式只有一次导入（load）和一次导出（export），大文件上节省的时间最明显。
+读取线程和写入线程共用同一个文档时，每读/写一页持有会话锁，避免两个线程交错修改文档。
+'''
+import uno  # type: ignore
+import sys, os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import threading
+from logger_config import get_logger, PhaseTimer
+from read_ppt_page_uno import connect_to_libreoffice
+from load_ppt_functions import iter_presentation_pages
+from edit_ppt_functions import write_pages_to_presentation
+
+logger = get_logger("pyuno.main")
+
+# 是否使用单文档会话（关闭时回退到 PPTX->ODP->操作->PPTX 的转换流程）
+UNO_SESSION_MODE = os.getenv("UNO_SESSION_MODE", "true").lower() in ("true", "1", "yes", "on")
+
+# 按扩展名选择导入/导出过滤器，未列出的格式交给LibreOffice自动识别
+_FILTERS = {
+    ".pptx": "Impress MS PowerPoint 2007 XML",
+    ".odp": "impress8",
+}
+
+_END = object()
+
+
+def _property(name, value):
+    prop = uno.createUnoStruct('com.sun.star.beans.PropertyValue')
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+class DocumentSession:
+    """
+    在一个已加载的文档上完成读取、写入和导出
+
+    用法:
+        with DocumentSession(pptx_path, timer) as session:
+            pages = list(session.iter_pages(page_indices))
+            ...
+            session.write_pages(translated_pages, mode)
+            session.export(output_pptx_path)
+    """
+
+    def __init__(self, ppt_path, timer=None):
+        self.ppt_path = os.path.abspath(ppt_path)
+        self.timer = timer if timer is not None else PhaseTimer()
+        self.context = None
+        self.presentation = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def open(self):
+        """连接soffice并加载文档（不设置只读，写入直接修改内存中的文档，原文件不会被改动）"""
+        if not os.path.exists(self.ppt_path):
+            raise FileNotFoundError(f"PPT文件不存在: {self.ppt_path}")
+
+        with self.timer.phase("load"):
+            self.context = connect_to_libreoffice()
+            desktop = self.context.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", self.context)
+            properties = [_property("Hidden", True)]
+            filter_name = _FILTERS.get(os.path.splitext(self.ppt_path)[1].lower())
+            if filter_name:
+                properties.append(_property("FilterName", filter_name))
+            logger.info(f"会话模式: 加载文档 {self.ppt_path}")
+            self.presentation = desktop.loadComponentFromURL(uno.systemPathToFileUrl(self.ppt_path),
+                                                             "_blank", 0, tuple(properties))
+        if not self.presentation:
+            raise RuntimeError(f"无法加载文档: {self.ppt_path}")
+        logger.info(f"会话模式: 文档加载完成，共 {self.presentation.getDrawPages().getCount()} 页")
+        return self
+
+    def close(self):
+        if self.presentation is None:
+            return
+        try:
+            self.presentation.close(True)
+        except Exception as e:
+            logger.warning(f"关闭会话文档失败: {e}")
+        finally:
+            self.presentation = None
+
+    def iter_pages(self, page_indices=None, on_open=None):
+        """
+        逐页读取文档内容（参数与 iter_ppt_pages_direct 相同），每读一页持有一次会话锁
+
+        Yields:
+            dict: 单页数据结构
+        """
+        pages = iter_presentation_pages(self.context, self.presentation, page_indices, on_open=on_open)
+        try:
+            while True:
+                with self._lock, self.timer.phase("read"):
+                    page_data = next(pages, _END)
+                if page_data is _END:
+                    return
+                yield page_data
+        finally:
+            pages.close()
+
+    def write_pages(self, pages, mode='paragraph_up'):
+        """
+        把翻译后的页面写入文档（pages 可以是边翻译边产出页面的迭代器），每写一页持有一次会话锁
+
+        Returns:
+            bool: 是否有页面写入成功
+        """
+        slides = self.presentation.getDrawPages()
+        total_pages = processed_pages = error_pages = 0
+        for page in pages:
+            with self._lock, self.timer.phase("write"):
+                total, processed, errors = write_pages_to_presentation(self.context, slides, [page], mode, logger)
+            total_pages += total
+            processed_pages += processed
+            error_pages += errors
+
+        logger.info(f"会话模式写入完成: 共 {total_pages} 页，成功 {processed_pages} 页，失败 {error_pages} 页")
+        return processed_pages > 0
+
+    def export(self, output_path):
+        """
+        把当前文档导出到 output_path，格式按扩展名决定（通常为PPTX）
+
+        Returns:
+            str: 导出文件路径，失败时返回None
+        """
+        abs_output_path = os.path.abspath(output_path)
+        os.makedirs(os.path.dirname(abs_output_path), exist_ok=True)
+        properties = [_property("Overwrite", True)]
+        filter_name = _FILTERS.get(os.path.splitext(abs_output_path)[1].lower())
+        if filter_name:
+            properties.append(_property("FilterName", filter_name))
+
+        logger.info(f"会话模式: 导出文档到 {abs_output_path}")
+        with self._lock, self.timer.phase("export"):
+            self.presentation.storeToURL(uno.systemPathToFileUrl(abs_output_path), tuple(properties))
+
+        if not os.path.exists(abs_output_path):
+            logger.error(f"导出后文件不存在: {abs_output_path}")
+            return None
+        return abs_output_path
@@ -7,6 +7,7 @@ import sys, os
 sys.path.insert(0, os.path.dirname(__file__))
 from logger_config import get_logger, log_function_call, log_execution_time
 from write_ppt_page_uno import write_from_presentation, validate_paragraph_structure
+from read_ppt_page_uno import libreoffice_url
 from datetime import datetime
 
 def connect_to_libreoffice():
@@ -15,8 +16,7 @@ def connect_to_libreoffice():
         localContext = uno.getComponentContext()
         resolver = localContext.ServiceManager.createInstanceWithContext(
             "com.sun.star.bridge.UnoUrlResolver", localContext)
-        context = resolver.resolve(
-            "uno:socket,host=localhost,port=2002;urp;StarOffice.ComponentContext")
+        context = resolver.resolve(libreoffice_url())
         return context
     except Exception as e:
         raise ConnectionError(f"无法连接到LibreOffice服务: {e}")
@@ -135,6 +135,111 @@ def write_entire_ppt_direct(input_ppt, output_ppt, translated_data, mode='paragr
     
     logger.info(f"开始直接写入PPT（段落层级支持）: {input_ppt} -> {output_ppt}，模式: {mode}")
     
+    # 验证翻译数据结构
+    logger.info(f"验证翻译数据结构...")
+    is_valid, structure_type, stats = validate_translated_json_structure(translated_data, logger)
+    
+    if not is_valid:
+        logger.error("翻译数据结构验证失败，无法继续处理")
+        return False
+    
+    if structure_type == "legacy_only":
+        logger.warning("检测到旧格式数据结构，建议升级到段落层级格式")
+    elif structure_type == "mixed":
+        logger.warning("检测到混合格式数据结构，将尽力兼容处理")
+    
+    logger.info(f"翻译数据包含 {len(translated_data.get('pages', []))} 页数据")
+    
+    result = write_ppt_pages_direct(input_ppt, output_ppt, translated_data.get("pages", []), mode)
+    log_execution_time(logger, "write_entire_ppt_direct", start_time)
+    return result
+
+def write_pages_to_presentation(context, slides, pages, mode, logger):
+    """
+    把翻译后的页面逐页写入已打开的演示文稿，不负责打开、保存和关闭文档
+    （单文档会话模式下写入读取时打开的同一个文档）
+    
+    Args:
+        context: LibreOffice组件上下文
+        slides: 演示文稿的页面集合（getDrawPages()）
+        pages: 翻译后的页面数据（可迭代）
+        mode: 写入模式
+        logger: 日志记录器
+        
+    Returns:
+        tuple: (总页数, 成功页数, 错误页数)
+    """
+    total_pages = 0
+    processed_pages = 0
+    error_pages = 0
+    
+    for page in pages:
+        total_pages += 1
+        page_idx = page.get("page_index", -1)
+        
+        if page_idx < 0 or page_idx >= slides.getCount():
+            logger.warning(f"页面索引 {page_idx} 无效，跳过")
+            error_pages += 1
+            continue
+        
+        logger.info(f"开始处理第 {page_idx+1} 页...")
+        
+        try:
+            # 显示页面统计信息
+            text_boxes = page.get("text_boxes", [])
+            if text_boxes:
+                total_paragraphs = 0
+                total_fragments = 0
+                
+                for box in text_boxes:
+                    if "paragraphs" in box:
+                        paragraphs = box.get("paragraphs", [])
+                        total_paragraphs += len(paragraphs)
+                        for paragraph in paragraphs:
+                            total_fragments += len(paragraph.get("text_fragments", []))
+                    else:
+                        total_fragments += len(box.get("text_fragments", []))
+                
+                logger.info(f"  第 {page_idx+1} 页包含 {len(text_boxes)} 个文本框，{total_paragraphs} 个段落，{total_fragments} 个文本片段")
+            else:
+                logger.info(f"  第 {page_idx+1} 页没有文本框")
+            
+            # 调用写入函数
+            write_from_presentation(
+                context=context,
+                slides=slides,
+                page_index=page_idx,
+                page_data=page,
+                mode=mode,
+                logger=logger
+            )
+            
+            processed_pages += 1
+            logger.info(f"第 {page_idx+1} 页处理完成")
+            
+        except Exception as e:
+            logger.error(f"处理第 {page_idx+1} 页时出错: {e}", exc_info=True)
+            error_pages += 1
+    
+    return total_pages, processed_pages, error_pages
+
+def write_ppt_pages_direct(input_ppt, output_ppt, pages, mode='paragraph_up'):
+    """
+    打开PPT后逐页写入译文并保存，pages 可以是列表，也可以是边翻译边产出页面的迭代器
+    （流水线模式下页面翻译完成后立即写入，迭代结束时才保存文件）
+    
+    Args:
+        input_ppt: 输入PPT文件路径（ODP）
+        output_ppt: 输出PPT文件路径
+        pages: 翻译后的页面数据（可迭代）
+        mode: 写入模式
+        
+    Returns:
+        bool: 写入是否成功
+    """
+    start_time = datetime.now()
+    logger = get_logger("pyuno.main")
+    
     try:
         # 1. 连接LibreOffice服务
         logger.info("连接LibreOffice服务...")
@@ -144,12 +249,11 @@ def write_entire_ppt_direct(input_ppt, output_ppt, translated_data, mode='paragr
         # 2. 打开PPT文件
         desktop = context.ServiceManager.createInstanceWithContext(
             "com.sun.star.frame.Desktop", context)
-        file_url = uno.systemPathToFileUrl(input_ppt)
-        logger.info(f"打开PPT文件: {file_url}")
         
-                # 设置加载属性（添加过滤器）
+        # 设置加载属性（添加过滤器）
         abs_input_ppt = os.path.abspath(input_ppt)
         file_url = uno.systemPathToFileUrl(abs_input_ppt)
+        logger.info(f"打开PPT文件: {file_url}")
 
         load_props = []
 
@@ -168,117 +272,54 @@ def write_entire_ppt_direct(input_ppt, output_ppt, translated_data, mode='paragr
         slides = presentation.getDrawPages()
         logger.info(f"PPT总页数: {slides.getCount()}")
         
-        # 3. 验证翻译数据结构
-        logger.info(f"验证翻译数据结构...")
-        is_valid, structure_type, stats = validate_translated_json_structure(translated_data, logger)
-        
-        if not is_valid:
-            logger.error("翻译数据结构验证失败，无法继续处理")
-            presentation.close(True)
-            return False
-        
-        if structure_type == "legacy_only":
-            logger.warning("检测到旧格式数据结构，建议升级到段落层级格式")
-        elif structure_type == "mixed":
-            logger.warning("检测到混合格式数据结构，将尽力兼容处理")
-        
-        logger.info(f"翻译数据包含 {len(translated_data.get('pages', []))} 页数据")
-        
-        # 4. 逐页处理
-        pages = translated_data.get("pages", [])
-        processed_pages = 0
-        error_pages = 0
-        
-        for page in pages:
-            page_idx = page.get("page_index", -1)
-            
-            if page_idx < 0 or page_idx >= slides.getCount():
-                logger.warning(f"页面索引 {page_idx} 无效，跳过")
-                error_pages += 1
-                continue
+        try:
+            # 3. 逐页处理
+            total_pages, processed_pages, error_pages = write_pages_to_presentation(context, slides, pages, mode, logger)
             
-            logger.info(f"开始处理第 {page_idx+1} 页...")
-            
-            try:
-                # 显示页面统计信息
-                text_boxes = page.get("text_boxes", [])
-                if text_boxes:
-                    total_paragraphs = 0
-                    total_fragments = 0
-                    
-                    for box in text_boxes:
-                        if "paragraphs" in box:
-                            paragraphs = box.get("paragraphs", [])
-                            total_paragraphs += len(paragraphs)
-                            for paragraph in paragraphs:
-                                total_fragments += len(paragraph.get("text_fragments", []))
-                        else:
-                            total_fragments += len(box.get("text_fragments", []))
-                    
-                    logger.info(f"  第 {page_idx+1} 页包含 {len(text_boxes)} 个文本框，{total_paragraphs} 个段落，{total_fragments} 个文本片段")
-                else:
-                    logger.info(f"  第 {page_idx+1} 页没有文本框")
-                
-                # 调用写入函数
-                write_from_presentation(
-                    context=context,
-                    slides=slides,
-                    page_index=page_idx,
-                    page_data=page,
-                    mode=mode,
-                    logger=logger
-                )
-                
-                processed_pages += 1
-                logger.info(f"第 {page_idx+1} 页处理完成")
-                
-            except Exception as e:
-                logger.error(f"处理第 {page_idx+1} 页时出错: {e}", exc_info=True)
-                error_pages += 1
-        
-        # 5. 保存文件
-        # 确保使用绝对路径
-        abs_output_ppt = os.path.abspath(output_ppt)
+            # 4. 保存文件
+            # 确保使用绝对路径
+            abs_output_ppt = os.path.abspath(output_ppt)
 
-        # 确保输出目录存在
-        output_dir = os.path.dirname(abs_output_ppt)
-        os.makedirs(output_dir, exist_ok=True)
+            # 确保输出目录存在
+            output_dir = os.path.dirname(abs_output_ppt)
+            os.makedirs(output_dir, exist_ok=True)
 
-        file_url_save = uno.systemPathToFileUrl(abs_output_ppt)
-        logger.info(f"保存PPT到: {file_url_save}")
+            file_url_save = uno.systemPathToFileUrl(abs_output_ppt)
+            logger.info(f"保存PPT到: {file_url_save}")
 
-        # 设置保存属性（关键修复）
-        save_props = []
+            # 设置保存属性（关键修复）
+            save_props = []
 
-        # 指定ODP格式过滤器
-        filter_prop = uno.createUnoStruct('com.sun.star.beans.PropertyValue')
-        filter_prop.Name = "FilterName"
-        filter_prop.Value = "impress8"  # ODP格式
-        save_props.append(filter_prop)
+            # 指定ODP格式过滤器
+            filter_prop = uno.createUnoStruct('com.sun.star.beans.PropertyValue')
+            filter_prop.Name = "FilterName"
+            filter_prop.Value = "impress8"  # ODP格式
+            save_props.append(filter_prop)
 
-        # 允许覆盖现有文件
-        overwrite_prop = uno.createUnoStruct('com.sun.star.beans.PropertyValue')
-        overwrite_prop.Name = "Overwrite"
-        overwrite_prop.Value = True
-        save_props.append(overwrite_prop)
+            # 允许覆盖现有文件
+            overwrite_prop = uno.createUnoStruct('com.sun.star.beans.PropertyValue')
+            overwrite_prop.Name = "Overwrite"
+            overwrite_prop.Value = True
+            save_props.append(overwrite_prop)
 
-        # 保存文件（使用正确的参数）
-        presentation.storeToURL(file_url_save, tuple(save_props))
-        logger.info(f"已保存到 {abs_output_ppt}")
-        
-        # 6. 关闭文件
-        presentation.close(True)
+            # 保存文件（使用正确的参数）
+            presentation.storeToURL(file_url_save, tuple(save_props))
+            logger.info(f"已保存到 {abs_output_ppt}")
+        finally:
+            # 5. 关闭文件（页面迭代器抛出异常时也要关闭，避免文档残留在soffice中）
+            presentation.close(True)
         
-        # 7. 显示处理统计
+        # 6. 显示处理统计
         logger.info("PPT写入完成统计:")
         logger.info(f"  - 成功处理页数: {processed_pages}")
         logger.info(f"  - 错误页数: {error_pages}")
-        logger.info(f"  - 处理成功率: {(processed_pages / len(pages) * 100):.1f}%")
+        if total_pages:
+            logger.info(f"  - 处理成功率: {(processed_pages / total_pages * 100):.1f}%")
         
         if error_pages > 0:
             logger.warning(f"有 {error_pages} 页处理失败，请检查日志")
         
-        log_execution_time(logger, "write_entire_ppt_direct", start_time)
+        log_execution_time(logger, "write_ppt_pages_direct", start_time)
         
         return processed_pages > 0  # 只要有页面成功处理就算成功
         
@@ -292,4 +333,4 @@ def write_entire_ppt_direct(input_ppt, output_ppt, translated_data, mode='paragr
         return False
     except Exception as e:
         logger.error(f"直接写入PPT流程发生异常: {e}", exc_info=True)
-        return False
\ No newline at end of file
+        return False
@@ -29,87 +29,21 @@ def load_entire_ppt_direct(ppt_path, page_indices=None):
     
     logger.info(f"开始直接加载PPT文件: {ppt_path}")
     
+    # 确保使用绝对路径
+    abs_ppt_path = os.path.abspath(ppt_path)
+    if not os.path.exists(abs_ppt_path):
+        logger.error(f"PPT文件不存在: {abs_ppt_path}")
+        return None
+    
     try:
-        logger.debug("连接到LibreOffice...")
-        context = connect_to_libreoffice()
-        logger.info("成功连接到LibreOffice")
-        
-        # 打开PPT文件
-        desktop = context.ServiceManager.createInstanceWithContext(
-            "com.sun.star.frame.Desktop", context)
-
-        # 确保使用绝对路径
-        abs_ppt_path = os.path.abspath(ppt_path)
-        if not os.path.exists(abs_ppt_path):
-            logger.error(f"PPT文件不存在: {abs_ppt_path}")
-            return None
-
-        file_url = uno.systemPathToFileUrl(abs_ppt_path)
-
-        # 设置加载属性（关键修复）
-        properties = []
-
-        # 隐藏窗口
-        hidden_prop = uno.createUnoStruct('com.sun.star.beans.PropertyValue')
-        hidden_prop.Name = "Hidden"
-        hidden_prop.Value = True
-        properties.append(hidden_prop)
-
-        # 只读模式
-        readonly_prop = uno.createUnoStruct('com.sun.star.beans.PropertyValue')
-        readonly_prop.Name = "ReadOnly"
-        readonly_prop.Value = True
-        properties.append(readonly_prop)
-
-        # 关键：指定文件格式过滤器
-        filter_prop = uno.createUnoStruct('com.sun.star.beans.PropertyValue')
-        filter_prop.Name = "FilterName"
-        file_ext = os.path.splitext(abs_ppt_path.lower())[1]
-        if file_ext == ".odp":
-            filter_prop.Value = "impress8"
-            logger.info("设置ODP文件过滤器: impress8")
-        elif file_ext == ".pptx":
-            filter_prop.Value = "Impress MS PowerPoint 2007 XML"
-            logger.info("设置PPTX文件过滤器: Impress MS PowerPoint 2007 XML")
-        else:
-            filter_prop.Value = "impress8"
-            logger.warning(f"未知文件格式{file_ext}，使用默认过滤器: impress8")
-        properties.append(filter_prop)
-
-        logger.debug(f"打开PPT文件: {file_url}")
-        presentation = desktop.loadComponentFromURL(file_url, "_blank", 0, tuple(properties))
-        slides = presentation.getDrawPages()
-        
-        # 获取总页数
-        total_slides = slides.getCount()
-        logger.info(f"PPT总页数: {total_slides}")
-        
-        # 确定要处理的页面
-        if page_indices is None:
-            # 处理所有页面
-            page_indices = list(range(total_slides))
-            logger.info(f"将处理所有 {total_slides} 页")
-        else:
-            # 验证页面索引
-            valid_indices = [i for i in page_indices if 0 <= i < total_slides]
-            if len(valid_indices) != len(page_indices):
-                invalid_indices = [i for i in page_indices if i < 0 or i >= total_slides]
-                logger.warning(f"无效的页面索引 {invalid_indices} 将被忽略")
-            page_indices = valid_indices
-            logger.info(f"将处理指定页面: {page_indices}")
-        
         # 存储指定页面的内容
         pages_data = []
         total_boxes = 0
         total_paragraphs = 0
         
         # 遍历指定页面
-        for page_index in page_indices:
-            logger.info(f"正在处理第 {page_index + 1} 页...")
-            page_start_time = datetime.now()
-            
-            # 使用现有的读取函数
-            page_data = read_slide_from_presentation(context, slides, page_index=page_index)
+        for page_data in iter_ppt_pages_direct(abs_ppt_path, page_indices):
+            page_index = page_data["page_index"]
             pages_data.append(page_data)
             
             # 统计信息
@@ -127,9 +61,6 @@ def load_entire_ppt_direct(ppt_path, page_indices=None):
             
             logger.info(f"第 {page_index + 1} 页包含 {page_boxes} 个文本框，{page_paragraphs} 个段落，{total_fragments_in_page} 个文本片段")
             
-            # 记录页面处理时间
-            log_execution_time(logger, f"处理第{page_index + 1}页", page_start_time)
-            
             # 可选：显示当前页的详细内容
             if page_data["text_boxes"]:
                 logger.debug(f"{'文本框':<10} | {'段落数':<6} | {'片段数':<6} | {'内容预览'}")
@@ -162,9 +93,6 @@ def load_entire_ppt_direct(ppt_path, page_indices=None):
         logger.info(f"处理完成：共 {len(pages_data)} 页，{total_boxes} 个文本框，{total_paragraphs} 个段落，{total_fragments} 个文本片段")
         log_execution_time(logger, "load_entire_ppt_direct", start_time)
         
-        # 关闭文档
-        presentation.close(True)
-        
         # 构建返回数据结构
         result = {
             'presentation_path': ppt_path,
@@ -186,6 +114,127 @@ def load_entire_ppt_direct(ppt_path, page_indices=None):
         logger.error("soffice --headless --accept=\"socket,host=localhost,port=2002;urp;StarOffice.ComponentContext\"")
         return None
 
+def iter_ppt_pages_direct(ppt_path, page_indices=None, on_open=None):
+    """
+    打开PPT文件并逐页读取，每读完一页立即产出该页数据（包含段落层级），
+    供流水线在读取后续页面的同时开始翻译已读出的页面
+    
+    Args:
+        ppt_path: PPT文件路径（支持PPTX和ODP）
+        page_indices: 要处理的页面索引列表（0-based），None表示处理所有页面
+        on_open: 可选回调 on_open(page_indices)，打开文件并确定要处理的页面后调用
+        
+    Yields:
+        dict: 单页数据结构
+        
+    Raises:
+        连接LibreOffice或打开文件失败时抛出异常
+    """
+    logger = get_logger("pyuno.main")
+    
+    logger.debug("连接到LibreOffice...")
+    context = connect_to_libreoffice()
+    logger.info("成功连接到LibreOffice")
+    
+    # 打开PPT文件
+    desktop = context.ServiceManager.createInstanceWithContext(
+        "com.sun.star.frame.Desktop", context)
+
+    # 确保使用绝对路径
+    abs_ppt_path = os.path.abspath(ppt_path)
+    if not os.path.exists(abs_ppt_path):
+        raise FileNotFoundError(f"PPT文件不存在: {abs_ppt_path}")
+
+    file_url = uno.systemPathToFileUrl(abs_ppt_path)
+
+    # 设置加载属性（关键修复）
+    properties = []
+
+    # 隐藏窗口
+    hidden_prop = uno.createUnoStruct('com.sun.star.beans.PropertyValue')
+    hidden_prop.Name = "Hidden"
+    hidden_prop.Value = True
+    properties.append(hidden_prop)
+
+    # 只读模式
+    readonly_prop = uno.createUnoStruct('com.sun.star.beans.PropertyValue')
+    readonly_prop.Name = "ReadOnly"
+    readonly_prop.Value = True
+    properties.append(readonly_prop)
+
+    # 关键：指定文件格式过滤器
+    filter_prop = uno.createUnoStruct('com.sun.star.beans.PropertyValue')
+    filter_prop.Name = "FilterName"
+    file_ext = os.path.splitext(abs_ppt_path.lower())[1]
+    if file_ext == ".odp":
+        filter_prop.Value = "impress8"
+        logger.info("设置ODP文件过滤器: impress8")
+    elif file_ext == ".pptx":
+        filter_prop.Value = "Impress MS PowerPoint 2007 XML"
+        logger.info("设置PPTX文件过滤器: Impress MS PowerPoint 2007 XML")
+    else:
+        filter_prop.Value = "impress8"
+        logger.warning(f"未知文件格式{file_ext}，使用默认过滤器: impress8")
+    properties.append(filter_prop)
+
+    logger.debug(f"打开PPT文件: {file_url}")
+    presentation = desktop.loadComponentFromURL(file_url, "_blank", 0, tuple(properties))
+    try:
+        yield from iter_presentation_pages(context, presentation, page_indices, on_open=on_open)
+    finally:
+        # 关闭文档（迭代提前结束时也会执行）
+        presentation.close(True)
+
+def iter_presentation_pages(context, presentation, page_indices=None, on_open=None):
+    """
+    从已打开的演示文稿逐页读取内容，不负责打开和关闭文档
+    （单文档会话模式下读取与写入共用同一个已加载的文档）
+    
+    Args:
+        context: LibreOffice组件上下文
+        presentation: 已加载的演示文稿组件
+        page_indices: 要处理的页面索引列表（0-based），None表示处理所有页面
+        on_open: 可选回调 on_open(page_indices)，确定要处理的页面后调用
+        
+    Yields:
+        dict: 单页数据结构
+    """
+    logger = get_logger("pyuno.main")
+    slides = presentation.getDrawPages()
+    
+    # 获取总页数
+    total_slides = slides.getCount()
+    logger.info(f"PPT总页数: {total_slides}")
+    
+    # 确定要处理的页面
+    if page_indices is None:
+        # 处理所有页面
+        page_indices = list(range(total_slides))
+        logger.info(f"将处理所有 {total_slides} 页")
+    else:
+        # 验证页面索引
+        valid_indices = [i for i in page_indices if 0 <= i < total_slides]
+        if len(valid_indices) != len(page_indices):
+            invalid_indices = [i for i in page_indices if i < 0 or i >= total_slides]
+            logger.warning(f"无效的页面索引 {invalid_indices} 将被忽略")
+        page_indices = valid_indices
+        logger.info(f"将处理指定页面: {page_indices}")
+    
+    if on_open is not None:
+        on_open(list(page_indices))
+    
+    for page_index in page_indices:
+        logger.info(f"正在处理第 {page_index + 1} 页...")
+        page_start_time = datetime.now()
+        
+        # 使用现有的读取函数
+        page_data = read_slide_from_presentation(context, slides, page_index=page_index)
+        
+        # 记录页面处理时间
+        log_execution_time(logger, f"处理第{page_index + 1}页", page_start_time)
+        
+        yield page_data
+
 def get_all_text_fragments(pages_data):
     """
     从所有页面数据中提取所有文本片段（包含段落层级）
@@ -9,6 +9,9 @@ import os
 from datetime import datetime, timedelta
 import inspect
 import functools
+import contextlib
+import threading
+import time
 
 # 全局日志记录器字典
 _loggers = {}
@@ -263,6 +266,51 @@ def timing_decorator(logger_name="pyuno.main"):
         return wrapper
     return decorator
 
+class PhaseTimer:
+    """
+    按阶段累计耗时（线程安全），用于汇总一个任务在加载、读取、翻译、写入、导出等阶段各花了多少时间
+
+    用法:
+        timer = PhaseTimer()
+        with timer.phase("load"):
+            ...
+        timer.add("translate", seconds)
+        timer.log_summary(logger, "pyuno_controller")
+    """
+
+    def __init__(self):
+        self._phases = {}
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    def add(self, name, seconds):
+        """累加阶段耗时（同一阶段可多次累加，例如多个批次的翻译）"""
+        with self._lock:
+            self._phases[name] = self._phases.get(name, 0.0) + seconds
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def as_dict(self):
+        with self._lock:
+            return dict(self._phases)
+
+    def log_summary(self, logger, operation_name, note=None):
+        """输出各阶段耗时及总耗时；阶段并行执行时各项之和可能超过总耗时"""
+        if not logger:
+            return
+        phases = self.as_dict()
+        total = time.perf_counter() - self._start
+        details = "，".join(f"{name} {seconds:.2f}s" for name, seconds in phases.items())
+        logger.info(f"{operation_name} 各阶段耗时: {details or '无'}；总耗时 {total:.2f}s")
+        if note:
+            logger.info(f"  {note}")
+
 def log_memory_usage(logger, operation_name="内存使用"):
     """
     记录当前内存使用情况（如果psutil可用）
@@ -348,7 +396,6 @@ if __name__ == "__main__":
     log_function_call(logger, "test_function", param1="value1", param2=123)
     
     # 使用执行时间记录
-    import time
     start = datetime.now()
     time.sleep(0.1)  # 模拟耗时操作
     log_execution_time(logger, "模拟操作", start)
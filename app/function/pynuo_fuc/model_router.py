@@ -0,0 +1,98 @@
+'''
+model_router.py
+按段落长度/复杂度选择翻译模型
+
+短标签、简短要点等简单段落交给配置的快速模型，长段落和格式复杂（[block]片段多）的段落仍由用户选择的模型翻译。
+快速模型的结果逐段校验，不合格的段落回退到主模型重新翻译。各路由的延迟和回退次数计入统计。
+'''
+import sys, os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import threading
+from logger_config import get_logger
+from request_packer import estimate_tokens
+
+logger = get_logger("pyuno")
+
+# 快速模型（translate 支持的模型名，如 qwen-fast）；为空时不做路由
+UNO_FAST_MODEL = os.getenv("UNO_FAST_MODEL", "").strip()
+# 段落估算token数不超过该值时视为短段落
+UNO_ROUTE_MAX_TOKENS = int(os.getenv("UNO_ROUTE_MAX_TOKENS", "16"))
+# [block]片段数超过该值的段落格式复杂，不走快速模型
+UNO_ROUTE_MAX_FRAGMENTS = int(os.getenv("UNO_ROUTE_MAX_FRAGMENTS", "2"))
+
+ROUTE_FAST = 'fast'
+ROUTE_PRIMARY = 'primary'
+
+
+def fast_model_for(model):
+    """返回主模型对应的快速模型，未配置或与主模型相同时返回None"""
+    if not UNO_FAST_MODEL or UNO_FAST_MODEL == model:
+        return None
+    return UNO_FAST_MODEL
+
+
+def is_simple_paragraph(box_para, max_tokens=None, max_fragments=None):
+    """段落是否足够短、格式足够简单，可以交给快速模型"""
+    max_tokens = max_tokens or UNO_ROUTE_MAX_TOKENS
+    max_fragments = max_fragments or UNO_ROUTE_MAX_FRAGMENTS
+    return (len(box_para['texts']) <= max_fragments and
+            estimate_tokens(box_para['combined_text']) <= max_tokens)
+
+
+def route_box_paragraphs(box_paragraphs):
+    """
+    将段落分为快速模型和主模型两组
+
+    Returns:
+        tuple: (快速模型段落列表, 主模型段落列表)
+    """
+    fast, primary = [], []
+    for box_para in box_paragraphs:
+        (fast if is_simple_paragraph(box_para) else primary).append(box_para)
+    return fast, primary
+
+
+def fragments_acceptable(box_para, fragments):
+    """快速模型的结果是否可用：片段数与原文一致且译文不为空"""
+    return bool(fragments) and len(fragments) == len(box_para['texts']) and any(f.strip() for f in fragments)
+
+
+class RouteStats:
+    """按路由统计请求数、段落数、延迟和质量回退（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def _route(self, route):
+        return self._routes.setdefault(route, {
+            'requests': 0, 'paragraphs': 0, 'failures': 0, 'fallback_paragraphs': 0, 'total_latency': 0.0
+        })
+
+    def record(self, route, paragraphs, latency, failed=False):
+        with self._lock:
+            stats = self._route(route)
+            stats['requests'] += 1
+            stats['paragraphs'] += paragraphs
+            stats['total_latency'] += latency
+            if failed:
+                stats['failures'] += 1
+
+    def record_fallback(self, route, paragraphs):
+        with self._lock:
+            self._route(route)['fallback_paragraphs'] += paragraphs
+
+    def get_stats(self):
+        with self._lock:
+            result = {}
+            for route, stats in self._routes.items():
+                result[route] = dict(stats)
+                result[route]['avg_latency'] = stats['total_latency'] / stats['requests'] if stats['requests'] else 0.0
+                result[route]['fallback_rate'] = (stats['fallback_paragraphs'] / stats['paragraphs'] * 100
+                                                  if stats['paragraphs'] else 0.0)
+            return result
+
+
+# 全局路由统计
+model_route_stats = RouteStats()
@@ -1,6 +1,8 @@
 import sys, os
 sys.path.insert(0, os.path.dirname(__file__))
+import re
 import json
+import unicodedata
 from datetime import datetime
 from logger_config import get_logger, log_execution_time
 
@@ -113,6 +115,83 @@ def extract_texts_for_translation(ppt_data):
         logger.error(f"提取文本片段时出错: {e}", exc_info=True)
         raise
 
+def _normalize_paragraph_text(text):
+    """去重用的文本规范化：Unicode NFC，合并连续空白并去除首尾空白"""
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', text or '')).strip()
+
+def deduplicate_text_boxes_data(text_boxes_data, representatives=None):
+    """
+    跨页面合并内容相同的文本框段落（页脚、保密声明、议程标题、表头等），每个唯一段落只翻译一次
+    按片段逐个规范化后比较，片段划分不同的段落不会合并，保证译文片段能一一对应。
+    Args:
+        text_boxes_data: extract_texts_for_translation 返回的文本框段落数据列表
+        representatives: 可选的代表段落表 {规范化文本: "页_文本框_段落"}，分批去重时跨批次共用（会被更新），
+                         此时重复段落可能指向之前批次的代表段落
+    Returns:
+        tuple: (需要翻译的唯一段落列表, 去重信息)
+            去重信息中 duplicates 为 {"页_文本框_段落": "代表段落的页_文本框_段落"}（均为0-based），
+            供 map_translation_results_back 将代表段落的译文分发给重复段落
+    """
+    logger = get_logger("pyuno.subprocess")
+
+    unique_text_boxes_data = []
+    if representatives is None:
+        representatives = {}
+    duplicates = {}
+
+    for box_para in text_boxes_data:
+        dedup_key = tuple(_normalize_paragraph_text(text) for text in box_para['texts'])
+        box_para_key = f"{box_para['page_index']}_{box_para['box_index']}_{box_para['paragraph_index']}"
+        representative = representatives.get(dedup_key)
+        if representative is None:
+            representatives[dedup_key] = box_para_key
+            unique_text_boxes_data.append(box_para)
+        else:
+            duplicates[box_para_key] = representative
+
+    total = len(text_boxes_data)
+    dedup_info = {
+        'duplicates': duplicates,
+        'total_paragraphs': total,
+        'unique_paragraphs': len(unique_text_boxes_data),
+        'duplicate_paragraphs': len(duplicates),
+        'dedup_ratio': len(duplicates) / total * 100 if total else 0.0
+    }
+
+    logger.info(f"段落去重: 共 {total} 个文本框段落，唯一 {len(unique_text_boxes_data)} 个，"
+                f"重复 {len(duplicates)} 个，去重率 {dedup_info['dedup_ratio']:.2f}%")
+    return unique_text_boxes_data, dedup_info
+
+def _expand_deduplicated_results(translation_results, duplicates, logger):
+    """将代表段落的译文复制给重复段落，返回新的翻译结果（不修改原结果）"""
+    expanded = {
+        page_index: dict(page_result, translated_fragments=dict(page_result.get('translated_fragments', {})))
+        for page_index, page_result in translation_results.items()
+    }
+    filled = 0
+    for duplicate_key, representative_key in duplicates.items():
+        rep_page, rep_box, rep_para = (int(part) for part in representative_key.split('_'))
+        rep_result = translation_results.get(rep_page, {})
+        if 'error' in rep_result:
+            continue
+        fragments = rep_result.get('translated_fragments', {}).get(f"{rep_box + 1}_{rep_para + 1}")
+        if fragments is None:
+            continue
+
+        page_index, box_index, paragraph_index = (int(part) for part in duplicate_key.split('_'))
+        # 整页都是重复段落时，这一页没有参与翻译，需要补上页面结果
+        page_result = expanded.setdefault(page_index, {
+            'translated_fragments': {},
+            'ppt_page_number': page_index + 1,
+            'original_page_index': page_index,
+            'deduplicated': True
+        })
+        page_result['translated_fragments'][f"{box_index + 1}_{paragraph_index + 1}"] = list(fragments)
+        filled += 1
+
+    logger.info(f"去重分发: {filled}/{len(duplicates)} 个重复段落复用了代表段落的译文")
+    return expanded
+
 def call_translation_api(text_fragments, source_language='en', target_language='zh'):
     """
     调用翻译API翻译文本片段（保持向后兼容）
@@ -161,13 +240,14 @@ def call_translation_api(text_fragments, source_language='en', target_language='
         logger.error(f"调用翻译API时出错: {e}", exc_info=True)
         raise
 
-def map_translation_results_back(ppt_data, translation_results, text_boxes_data):
+def map_translation_results_back(ppt_data, translation_results, text_boxes_data, dedup_info=None):
     """
     将翻译结果映射回原PPT数据结构（支持段落层级）
     Args:
         ppt_data: 原始PPT数据
         translation_results: 翻译结果，格式为 {page_index: {box_paragraph_key: fragments}}
-        text_boxes_data: 文本框段落数据列表
+        text_boxes_data: 文本框段落数据列表（去重前的完整列表）
+        dedup_info: deduplicate_text_boxes_data 返回的去重信息，提供时将代表段落的译文分发给重复段落
     Returns:
         dict: 更新后的PPT数据，包含翻译后的文本
     """
@@ -180,6 +260,9 @@ def map_translation_results_back(ppt_data, translation_results, text_boxes_data)
         pages = translated_ppt_data.get('pages', [])
         updated_fragments = 0
         
+        if dedup_info and dedup_info.get('duplicates'):
+            translation_results = _expand_deduplicated_results(translation_results, dedup_info['duplicates'], logger)
+        
         # 创建文本框段落数据的快速查找字典
         box_para_lookup = {}
         for box_para in text_boxes_data:
@@ -244,6 +327,10 @@ def map_translation_results_back(ppt_data, translation_results, text_boxes_data)
             'failed_pages': len([r for r in translation_results.values() if 'error' in r]),
             'total_fragments_updated': updated_fragments,
             'total_box_paragraphs_processed': len(text_boxes_data),
+            'unique_box_paragraphs_translated': dedup_info['unique_paragraphs'] if dedup_info else len(text_boxes_data),
+            'dedup_ratio': dedup_info['dedup_ratio'] if dedup_info else 0.0,
+            'truncation_splits': {page_index: r['truncation_splits'] for page_index, r in translation_results.items()
+                                  if r.get('truncation_splits')},
             'translation_timestamp': datetime.now().isoformat(),
             'structure_version': 'with_paragraphs'
         }
@@ -1,22 +1,35 @@
 '''
 pyuno_controller.py (重构版)
-pyuno的总控制器，采用PPTX->ODP->操作->PPTX的流程，移除子进程调用
-使用PyUNO接口进行格式转换，确保操作的一致性和可控性
+pyuno的总控制器，移除子进程调用
+默认使用单文档会话：原始PPTX只加载一次，读取、写入都在同一个文档上进行，最后直接导出PPTX；
+UNO_SESSION_MODE 关闭时采用PPTX->ODP->操作->PPTX的流程，使用PyUNO接口进行格式转换
 '''
 import uno
 import json
 import os   
 import tempfile
 from typing import List, Dict
+from contextlib import ExitStack
 from datetime import datetime
 import sys, os
 sys.path.insert(0, os.path.dirname(__file__))
-from logger_config import setup_default_logging, get_logger, log_function_call, log_execution_time
-from ppt_data_utils import extract_texts_for_translation, call_translation_api, map_translation_results_back, save_translated_ppt_data
+from logger_config import setup_default_logging, get_logger, log_function_call, log_execution_time, PhaseTimer
+from ppt_data_utils import extract_texts_for_translation, deduplicate_text_boxes_data, call_translation_api, map_translation_results_back, save_translated_ppt_data
+from translation_checkpoint import TranslationCheckpoint
 
 # 直接导入处理函数
-from load_ppt_functions import load_entire_ppt_direct
+from load_ppt_functions import load_entire_ppt_direct, calculate_statistics
 from edit_ppt_functions import write_entire_ppt_direct
+from translation_pipeline import UNO_PIPELINE_ENABLED, run_translation_pipeline
+from document_session import UNO_SESSION_MODE, DocumentSession
+from read_ppt_page_uno import libreoffice_url
+
+try:
+    from app.utils.soffice_pool import soffice_pool, SOFFICE_POOL_ENABLED
+except ImportError:
+    # 独立运行（不在app包内）时使用端口2002上的单个soffice服务
+    soffice_pool = None
+    SOFFICE_POOL_ENABLED = False
 
 import subprocess  # 仍需要用于启动soffice服务
 import psutil
@@ -183,8 +196,7 @@ def convert_pptx_to_odp_pyuno(pptx_path, output_dir=None):
         localContext = uno.getComponentContext()
         resolver = localContext.ServiceManager.createInstanceWithContext(
             "com.sun.star.bridge.UnoUrlResolver", localContext)
-        context = resolver.resolve(
-            "uno:socket,host=localhost,port=2002;urp;StarOffice.ComponentContext")
+        context = resolver.resolve(libreoffice_url())
         
         # 获取桌面服务
         desktop = context.ServiceManager.createInstanceWithContext(
@@ -276,8 +288,7 @@ def convert_odp_to_pptx_pyuno(odp_path, output_dir=None):
         localContext = uno.getComponentContext()
         resolver = localContext.ServiceManager.createInstanceWithContext(
             "com.sun.star.bridge.UnoUrlResolver", localContext)
-        context = resolver.resolve(
-            "uno:socket,host=localhost,port=2002;urp;StarOffice.ComponentContext")
+        context = resolver.resolve(libreoffice_url())
         
         # 获取桌面服务
         desktop = context.ServiceManager.createInstanceWithContext(
@@ -386,93 +397,35 @@ def _validate_and_normalize_page_indices(page_indices):
 # 设置日志记录器
 logger = setup_default_logging()
 
-def pyuno_controller(presentation_path: str,
-                     stop_words_list: List[str],
-                     custom_translations: Dict[str, str],
-                     select_page: List[int],
-                     source_language: str,
-                     target_language: str,
-                     bilingual_translation: str,
-                     progress_callback,
-                     model: str):
+def _translate_odp_phased(odp_working_path, translated_odp_path, validated_page_indices, select_page,
+                          source_language, target_language, bilingual_translation, progress_callback, model,
+                          stop_words_list, custom_translations, glossary_fp, checkpoint, session=None, timer=None):
     """
-    主控制器函数（重构版：PPTX->ODP->操作->PPTX流程）
-    """
-    start_time = datetime.now()
-    
-    # 确保soffice服务存活
-    ensure_soffice_running()
-
-    log_function_call(logger, "pyuno_controller", 
-                     presentation_path=presentation_path,
-                     stop_words_list=stop_words_list,
-                     custom_translations=custom_translations,
-                     select_page=select_page,
-                     source_language=source_language,
-                     target_language=target_language,
-                     bilingual_translation=bilingual_translation,
-                     model=model)
-    
-    logger.info(f"开始处理PPT（重构版 - PPTX->ODP->操作->PPTX，使用PyUNO格式转换）: {presentation_path}")
-    logger.info(f"翻译模式: {bilingual_translation}")
-    logger.info(f"指定页面: {select_page if select_page else '所有页面'}")
-    
-    # 检查PPT文件是否存在
-    if not os.path.exists(presentation_path):
-        logger.error(f"PPT文件不存在: {presentation_path}")
-        return None
-    
-    file_size = os.path.getsize(presentation_path)
-    logger.info(f"PPT文件大小: {file_size / (1024*1024):.2f} MB")
-    
-    # ===== 新增步骤：使用PyUNO接口将PPTX转换为ODP =====
-    logger.info("=" * 60)
-    logger.info("第0步：使用PyUNO接口将PPTX转换为ODP格式")
-    logger.info("=" * 60)
-    
-    try:
-        # 生成ODP文件路径
-        input_dir = os.path.dirname(presentation_path)
-        input_filename = os.path.splitext(os.path.basename(presentation_path))[0]
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        odp_filename = f"{input_filename}_working_{timestamp}.odp"
-        odp_working_path = os.path.join(input_dir, odp_filename)
-        
-        # 转换PPTX到ODP
-        converted_odp_path = convert_pptx_to_odp_pyuno(presentation_path, input_dir)
-        
-        if not converted_odp_path:
-            logger.error("PPTX转ODP失败，无法继续处理")
-            return None
-        
-        # 重命名为工作文件
-        if converted_odp_path != odp_working_path:
-            os.rename(converted_odp_path, odp_working_path)
-            logger.info(f"重命名工作文件: {odp_working_path}")
-        
-        logger.info(f"✅ PPTX转ODP成功: {odp_working_path}")
-        
-    except Exception as e:
-        logger.error(f"PPTX转ODP过程失败: {e}", exc_info=True)
-        return None
+    分阶段处理ODP：整体加载 -> 整体翻译 -> 映射 -> 整体写入（UNO_PIPELINE_ENABLED 关闭时使用）
+    传入 session 时从会话文档读取并写回会话文档，不再打开 odp_working_path、也不保存 translated_odp_path
     
+    Returns:
+        dict: {'ppt_data', 'translation_results', 'text_boxes_data', 'dedup_info'}，失败时返回None
+    """
     # ===== 第一步：从ODP加载内容 =====
     logger.info("=" * 60)
-    logger.info("第1步：从ODP加载PPT内容")
+    logger.info("第1步：加载PPT内容")
     logger.info("=" * 60)
     
     try:
-        # 验证页面索引
-        validated_page_indices = _validate_and_normalize_page_indices(select_page)
-        
-        # 直接调用加载函数，不使用子进程
-        ppt_data = load_entire_ppt_direct(odp_working_path, validated_page_indices)
+        if session is not None:
+            pages = list(session.iter_pages(validated_page_indices))
+            ppt_data = {
+                'presentation_path': odp_working_path,
+                'statistics': calculate_statistics(pages),
+                'pages': pages
+            }
+        else:
+            # 直接调用加载函数，不使用子进程
+            ppt_data = load_entire_ppt_direct(odp_working_path, validated_page_indices)
         
         if not ppt_data:
             logger.error("无法从ODP加载PPT内容")
-            # 清理临时ODP文件
-            if os.path.exists(odp_working_path):
-                os.remove(odp_working_path)
             return None
         
         # 记录加载信息
@@ -488,9 +441,6 @@ def pyuno_controller(presentation_path: str,
         
     except Exception as e:
         logger.error(f"加载ODP内容失败: {e}", exc_info=True)
-        # 清理临时ODP文件
-        if os.path.exists(odp_working_path):
-            os.remove(odp_working_path)
         return None
     
     # ===== 第二步：翻译PPT内容 =====
@@ -514,23 +464,27 @@ def pyuno_controller(presentation_path: str,
         
         logger.info(f"提取到 {len(text_boxes_data)} 个需要翻译的文本框段落")
         
+        # 跨页面去重，相同的段落只翻译一次
+        unique_text_boxes_data, dedup_info = deduplicate_text_boxes_data(text_boxes_data)
+        
         # 调用翻译API
         from api_translate_uno import translate_pages_by_page, validate_translation_result
-        translation_results = translate_pages_by_page(text_boxes_data, progress_callback, source_language, target_language, model)
+        timer = timer if timer is not None else PhaseTimer()
+        with timer.phase("translate"):
+            translation_results = translate_pages_by_page(unique_text_boxes_data, progress_callback, source_language, target_language, model,
+                                                          glossary_fp=glossary_fp, stop_words_list=stop_words_list,
+                                                          custom_translations=custom_translations, checkpoint=checkpoint)
         
         logger.info(f"翻译完成，共处理 {len(translation_results)} 页")
         
-        # 验证翻译结果
-        validation_stats = validate_translation_result(translation_results, text_boxes_data)
+        # 验证翻译结果（只覆盖实际翻译的唯一段落，重复段落在映射时分发）
+        validation_stats = validate_translation_result(translation_results, unique_text_boxes_data)
         logger.info(f"翻译结果验证完成，覆盖率: {validation_stats['translation_coverage']:.2f}%")
         
         logger.info("✅ 翻译处理完成")
         
     except Exception as e:
         logger.error(f"翻译过程失败: {e}", exc_info=True)
-        # 清理临时ODP文件
-        if os.path.exists(odp_working_path):
-            os.remove(odp_working_path)
         return None
     
     # ===== 第三步：映射翻译结果 =====
@@ -539,7 +493,7 @@ def pyuno_controller(presentation_path: str,
     logger.info("=" * 60)
     
     try:
-        translated_ppt_data = map_translation_results_back(ppt_data, translation_results, text_boxes_data)
+        translated_ppt_data = map_translation_results_back(ppt_data, translation_results, text_boxes_data, dedup_info)
         logger.info("✅ 翻译结果映射完成")
         
     except Exception as e:
@@ -549,78 +503,277 @@ def pyuno_controller(presentation_path: str,
     
     # ===== 第四步：将翻译结果写入ODP =====
     logger.info("=" * 60)
-    logger.info("第4步：将翻译结果写入ODP文件")
+    logger.info("第4步：将翻译结果写入文档")
     logger.info("=" * 60)
     
     try:
-        # 生成翻译后的ODP文件路径
-        translated_odp_filename = f"{input_filename}_translated_{timestamp}.odp"
-        translated_odp_path = os.path.join(input_dir, translated_odp_filename)
-        
-        # 直接调用写入函数，不使用子进程
-        write_success = write_entire_ppt_direct(
-            input_ppt=odp_working_path,
-            output_ppt=translated_odp_path,
-            translated_data=translated_ppt_data,
-            mode=bilingual_translation
-        )
+        if session is not None:
+            write_success = session.write_pages(translated_ppt_data.get('pages', []), bilingual_translation)
+        else:
+            # 直接调用写入函数，不使用子进程
+            write_success = write_entire_ppt_direct(
+                input_ppt=odp_working_path,
+                output_ppt=translated_odp_path,
+                translated_data=translated_ppt_data,
+                mode=bilingual_translation
+            )
         
         if not write_success:
-            logger.error("写入翻译内容到ODP失败")
-            # 清理临时文件
-            if os.path.exists(odp_working_path):
-                os.remove(odp_working_path)
+            logger.error("写入翻译内容失败")
             return None
         
-        logger.info(f"✅ 翻译内容写入ODP成功: {translated_odp_path}")
+        logger.info("✅ 翻译内容写入完成")
         
     except Exception as e:
         logger.error(f"写入翻译内容失败: {e}", exc_info=True)
-        # 清理临时文件
-        if os.path.exists(odp_working_path):
-            os.remove(odp_working_path)
         return None
     
-    # ===== 第五步：使用PyUNO接口将ODP转换回PPTX =====
+    return {
+        'ppt_data': ppt_data,
+        'translation_results': translation_results,
+        'text_boxes_data': text_boxes_data,
+        'dedup_info': dedup_info
+    }
+
+def _translate_pages(input_path, output_path, validated_page_indices, select_page, source_language, target_language,
+                     bilingual_translation, progress_callback, model, stop_words_list, custom_translations,
+                     glossary_fp, checkpoint, timer, session=None):
+    """按 UNO_PIPELINE_ENABLED 选择流水线或分阶段方式完成读取、翻译和写入"""
+    if UNO_PIPELINE_ENABLED:
+        return run_translation_pipeline(
+            input_path, output_path, validated_page_indices,
+            source_language, target_language, model, mode=bilingual_translation,
+            progress_callback=progress_callback, stop_words_list=stop_words_list,
+            custom_translations=custom_translations, glossary_fp=glossary_fp, checkpoint=checkpoint,
+            session=session, timer=timer)
+    return _translate_odp_phased(
+        input_path, output_path, validated_page_indices, select_page,
+        source_language, target_language, bilingual_translation, progress_callback, model,
+        stop_words_list, custom_translations, glossary_fp, checkpoint, session=session, timer=timer)
+
+def _translate_in_session(presentation_path, final_pptx_path, validated_page_indices, select_page, source_language,
+                          target_language, bilingual_translation, progress_callback, model, stop_words_list,
+                          custom_translations, glossary_fp, checkpoint, timer):
+    """
+    单文档会话：原始PPTX只加载一次，读取、翻译、写入后直接导出为 final_pptx_path
+    
+    Returns:
+        dict: 同 _translate_odp_phased，失败时返回None（并删除不完整的输出文件）
+    """
     logger.info("=" * 60)
-    logger.info("第5步：使用PyUNO接口将翻译后的ODP转换为PPTX")
+    logger.info("第1-5步：单文档会话中读取、翻译、写入并导出PPTX")
     logger.info("=" * 60)
     
+    translation_output = None
     try:
-        # 转换ODP到PPTX
-        final_pptx_path = convert_odp_to_pptx_pyuno(translated_odp_path)
+        with DocumentSession(presentation_path, timer) as session:
+            translation_output = _translate_pages(
+                presentation_path, None, validated_page_indices, select_page, source_language, target_language,
+                bilingual_translation, progress_callback, model, stop_words_list, custom_translations,
+                glossary_fp, checkpoint, timer, session=session)
+            if translation_output and not session.export(final_pptx_path):
+                translation_output = None
+    except Exception as e:
+        logger.error(f"单文档会话处理失败: {e}", exc_info=True)
+        translation_output = None
+    
+    if not translation_output:
+        if os.path.exists(final_pptx_path):
+            os.remove(final_pptx_path)
+        return None
+    
+    logger.info(f"✅ 翻译内容已写入并导出PPTX: {final_pptx_path}")
+    return translation_output
+
+def _translate_via_odp(presentation_path, input_dir, input_filename, timestamp, validated_page_indices, select_page,
+                       source_language, target_language, bilingual_translation, progress_callback, model,
+                       stop_words_list, custom_translations, glossary_fp, checkpoint, timer):
+    """
+    转换流程：PPTX->ODP，在ODP上读取、翻译、写入，再转换回PPTX（UNO_SESSION_MODE 关闭时使用）
+    
+    Returns:
+        tuple: (translation_output, final_pptx_path)，失败时 translation_output 为None
+    """
+    # ===== 第0步：使用PyUNO接口将PPTX转换为ODP =====
+    logger.info("=" * 60)
+    logger.info("第0步：使用PyUNO接口将PPTX转换为ODP格式")
+    logger.info("=" * 60)
+    
+    try:
+        # 生成ODP文件路径
+        odp_filename = f"{input_filename}_working_{timestamp}.odp"
+        odp_working_path = os.path.join(input_dir, odp_filename)
         
-        if not final_pptx_path:
-            logger.error("ODP转PPTX失败")
-            # 清理临时文件
-            if os.path.exists(odp_working_path):
-                os.remove(odp_working_path)
-            if os.path.exists(translated_odp_path):
-                os.remove(translated_odp_path)
-            return None
+        # 转换PPTX到ODP
+        with timer.phase("convert_to_odp"):
+            converted_odp_path = convert_pptx_to_odp_pyuno(presentation_path, input_dir)
         
-        logger.info(f"✅ ODP转PPTX成功: {final_pptx_path}")
+        if not converted_odp_path:
+            logger.error("PPTX转ODP失败，无法继续处理")
+            return None, None
         
-        # 清理临时ODP文件
-        try:
-            if os.path.exists(odp_working_path):
-                os.remove(odp_working_path)
-                logger.info(f"已删除临时工作文件: {odp_working_path}")
-            if os.path.exists(translated_odp_path):
-                os.remove(translated_odp_path)
-                logger.info(f"已删除临时翻译文件: {translated_odp_path}")
-        except Exception as e:
-            logger.warning(f"清理临时文件失败: {e}")
+        # 重命名为工作文件
+        if converted_odp_path != odp_working_path:
+            os.rename(converted_odp_path, odp_working_path)
+            logger.info(f"重命名工作文件: {odp_working_path}")
+        
+        logger.info(f"✅ PPTX转ODP成功: {odp_working_path}")
         
+    except Exception as e:
+        logger.error(f"PPTX转ODP过程失败: {e}", exc_info=True)
+        return None, None
+    
+    # 生成翻译后的ODP文件路径
+    translated_odp_filename = f"{input_filename}_translated_{timestamp}.odp"
+    translated_odp_path = os.path.join(input_dir, translated_odp_filename)
+    
+    def _cleanup():
+        for path in (odp_working_path, translated_odp_path):
+            if os.path.exists(path):
+                os.remove(path)
+                logger.info(f"已删除临时文件: {path}")
+    
+    try:
+        if UNO_PIPELINE_ENABLED:
+            # ===== 第1-4步：读取、翻译、写入流水线并行 =====
+            logger.info("=" * 60)
+            logger.info("第1-4步：流水线读取、翻译并写入ODP")
+            logger.info("=" * 60)
+        # ODP的加载和保存包含在读取、写入阶段内，单独计时便于与会话模式对比
+        with timer.phase("process_odp"):
+            translation_output = _translate_pages(
+                odp_working_path, translated_odp_path, validated_page_indices, select_page, source_language,
+                target_language, bilingual_translation, progress_callback, model, stop_words_list,
+                custom_translations, glossary_fp, checkpoint, timer)
+    except Exception as e:
+        logger.error(f"翻译ODP内容失败: {e}", exc_info=True)
+        translation_output = None
+    
+    if not translation_output:
+        _cleanup()
+        return None, None
+    
+    logger.info(f"✅ 翻译内容写入ODP成功: {translated_odp_path}")
+    
+    # ===== 第五步：使用PyUNO接口将ODP转换回PPTX =====
+    logger.info("=" * 60)
+    logger.info("第5步：使用PyUNO接口将翻译后的ODP转换为PPTX")
+    logger.info("=" * 60)
+    
+    try:
+        # 转换ODP到PPTX
+        with timer.phase("convert_to_pptx"):
+            final_pptx_path = convert_odp_to_pptx_pyuno(translated_odp_path)
     except Exception as e:
         logger.error(f"ODP转PPTX失败: {e}", exc_info=True)
-        # 清理临时文件
-        if os.path.exists(odp_working_path):
-            os.remove(odp_working_path)
-        if os.path.exists(translated_odp_path):
-            os.remove(translated_odp_path)
+        final_pptx_path = None
+    
+    # 清理临时ODP文件
+    try:
+        _cleanup()
+    except Exception as e:
+        logger.warning(f"清理临时文件失败: {e}")
+    
+    if not final_pptx_path:
+        logger.error("ODP转PPTX失败")
+        return None, None
+    
+    logger.info(f"✅ ODP转PPTX成功: {final_pptx_path}")
+    return translation_output, final_pptx_path
+
+def pyuno_controller(presentation_path: str,
+                     stop_words_list: List[str],
+                     custom_translations: Dict[str, str],
+                     select_page: List[int],
+                     source_language: str,
+                     target_language: str,
+                     bilingual_translation: str,
+                     progress_callback,
+                     model: str,
+                     document_hash: str = None):
+    """
+    主控制器函数（默认单文档会话，UNO_SESSION_MODE 关闭时为PPTX->ODP->操作->PPTX流程）
+    启用实例池时整个任务借用池中的一个soffice实例，否则使用端口2002上的单个服务
+    document_hash 为上传文件的原始内容哈希，用作翻译断点的键（文件此时已被就地修改过）
+    """
+    args = (presentation_path, stop_words_list, custom_translations, select_page, source_language,
+            target_language, bilingual_translation, progress_callback, model, document_hash)
+    if soffice_pool is None or not SOFFICE_POOL_ENABLED:
+        # 确保soffice服务存活
+        ensure_soffice_running()
+        return _run_pyuno_controller(*args)
+    
+    with ExitStack() as stack:
+        try:
+            worker = stack.enter_context(soffice_pool.checkout())
+        except Exception as e:
+            logger.error(f"获取soffice实例失败: {e}", exc_info=True)
+            return None
+        logger.info(f"使用soffice实例 {worker.index}（端口 {worker.port}）")
+        return _run_pyuno_controller(*args)
+
+def _run_pyuno_controller(presentation_path, stop_words_list, custom_translations, select_page, source_language,
+                          target_language, bilingual_translation, progress_callback, model, document_hash=None):
+    start_time = datetime.now()
+
+    log_function_call(logger, "pyuno_controller", 
+                     presentation_path=presentation_path,
+                     stop_words_list=stop_words_list,
+                     custom_translations=custom_translations,
+                     select_page=select_page,
+                     source_language=source_language,
+                     target_language=target_language,
+                     bilingual_translation=bilingual_translation,
+                     model=model)
+    
+    logger.info(f"开始处理PPT（{'单文档会话' if UNO_SESSION_MODE else 'PPTX->ODP->操作->PPTX'}）: {presentation_path}")
+    logger.info(f"翻译模式: {bilingual_translation}")
+    logger.info(f"指定页面: {select_page if select_page else '所有页面'}")
+    
+    # 检查PPT文件是否存在
+    if not os.path.exists(presentation_path):
+        logger.error(f"PPT文件不存在: {presentation_path}")
         return None
     
+    file_size = os.path.getsize(presentation_path)
+    logger.info(f"PPT文件大小: {file_size / (1024*1024):.2f} MB")
+    
+    input_dir = os.path.dirname(presentation_path)
+    input_filename = os.path.splitext(os.path.basename(presentation_path))[0]
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    
+    # 验证页面索引
+    validated_page_indices = _validate_and_normalize_page_indices(select_page)
+    
+    from api_translate_uno import glossary_fingerprint
+    glossary_fp = glossary_fingerprint(stop_words_list, custom_translations)
+    # 同一文件、同样参数的任务重试时从断点继续，已完成页面不再调用大模型
+    checkpoint = TranslationCheckpoint.for_task(presentation_path, source_language, target_language, model, glossary_fp,
+                                                content_hash=document_hash)
+    
+    timer = PhaseTimer()
+    translate_args = (validated_page_indices, select_page, source_language, target_language, bilingual_translation,
+                      progress_callback, model, stop_words_list, custom_translations, glossary_fp, checkpoint, timer)
+    if UNO_SESSION_MODE:
+        final_pptx_path = os.path.join(input_dir, f"{input_filename}_translated_{timestamp}.pptx")
+        translation_output = _translate_in_session(presentation_path, final_pptx_path, *translate_args)
+    else:
+        translation_output, final_pptx_path = _translate_via_odp(presentation_path, input_dir, input_filename,
+                                                                 timestamp, *translate_args)
+    
+    if not translation_output:
+        return None
+    
+    # 任务已完成，不再需要断点
+    if checkpoint is not None:
+        checkpoint.remove()
+    
+    ppt_data = translation_output['ppt_data']
+    translation_results = translation_output['translation_results']
+    text_boxes_data = translation_output['text_boxes_data']
+    dedup_info = translation_output['dedup_info']
+    actual_pages = ppt_data.get('pages', [])
+    
     # ===== 处理完成统计 =====
     logger.info("=" * 60)
     logger.info("处理完成统计")
@@ -645,8 +798,14 @@ def pyuno_controller(presentation_path: str,
         logger.info(f"  - 总段落数: {total_paragraphs}")
         logger.info(f"  - 总文本片段数: {total_fragments}")
         logger.info(f"  - 有内容的文本框段落数: {len(text_boxes_data)}")
+        if 'dedup_info' in locals():
+            logger.info(f"  - 去重后翻译段落数: {dedup_info['unique_paragraphs']}（去重率 {dedup_info['dedup_ratio']:.2f}%）")
         logger.info(f"  - 成功翻译页数: {successful_translations}")
         logger.info(f"  - 翻译文本框段落数: {total_translated_box_paragraphs}")
+        if 'translation_results' in locals():
+            truncation_splits = sum(r.get('truncation_splits', 0) for r in translation_results.values())
+            if truncation_splits:
+                logger.info(f"  - 输出截断后拆分请求次数: {truncation_splits}")
         logger.info(f"  - 最终PPTX文件: {final_pptx_path}")
         logger.info(f"  - PPTX文件大小: {os.path.getsize(final_pptx_path) / (1024*1024):.2f} MB")
         
@@ -655,6 +814,8 @@ def pyuno_controller(presentation_path: str,
             logger.info(f"  - 实际处理页面数: {len(actual_pages)}")
         
         log_execution_time(logger, "pyuno_controller", start_time)
+        timer.log_summary(logger, "pyuno_controller",
+                          note="流水线模式下读取、翻译、写入并行执行，各项之和可能超过总耗时" if UNO_PIPELINE_ENABLED else None)
         
         logger.info("=" * 60)
         logger.info("🎉 pyuno_controller 处理完成！")
@@ -7,6 +7,20 @@ import sys, os
 sys.path.insert(0, os.path.dirname(__file__))
 from logger_config import get_logger
 import math
+import re
+import zlib
+
+try:
+    from app.utils.soffice_pool import current_uno_url
+except ImportError:
+    # 独立运行（不在app包内）时只连接固定端口的soffice服务
+    current_uno_url = None
+
+def libreoffice_url():
+    """当前任务使用的soffice服务地址：借出了实例池中的实例时连接该实例，否则连接默认的2002端口"""
+    if current_uno_url is not None:
+        return current_uno_url()
+    return "uno:socket,host=localhost,port=2002;urp;StarOffice.ComponentContext"
 
 # 连接到本地运行的LibreOffice（需要先启动监听服务）
 def connect_to_libreoffice():
@@ -17,76 +31,133 @@ def connect_to_libreoffice():
         local_ctx = uno.getComponentContext()
         resolver = local_ctx.ServiceManager.createInstanceWithContext(
             "com.sun.star.bridge.UnoUrlResolver", local_ctx)
-        context = resolver.resolve(
-            "uno:socket,host=localhost,port=2002;urp;StarOffice.ComponentContext")
+        context = resolver.resolve(libreoffice_url())
         logger.info("成功连接到LibreOffice")
         return context
     except Exception as e:
         logger.error(f"连接LibreOffice失败: {e}", exc_info=True)
         raise
 
-# 提取文本框中每个字符的内容及其字体属性，并按属性分片，同时记录段落分割信息
-def extract_text_and_attrs(shape):
-    logger = get_logger("pyuno.subprocess")
-    logger.debug("开始提取文本框内容和属性...")
-    
-    text = shape.getText()  # 获取文本对象
+def shape_name(shape):
+    """形状名称（未命名或不支持时为空字符串）"""
+    try:
+        return shape.getName() if hasattr(shape, 'getName') else ""
+    except Exception:
+        return ""
+
+def shape_z_order(shape):
+    """形状的z-order（读取失败时为-1）"""
+    try:
+        return shape.getPropertyValue("ZOrder")
+    except Exception:
+        return -1
+
+def text_fingerprint(text):
+    """形状全文的指纹，用于确认写回时定位到的仍是读取时的那个形状"""
+    return zlib.crc32(text.encode("utf-8"))
+
+def build_shape_locator(shape, page_index, shape_index, text):
+    """
+    记录文本框所在形状的定位信息，写回时直接按索引取形状，不再逐个形状比较文本
+    （校验逻辑见 write_ppt_page_uno.locate_shape）
+    """
+    return {
+        "page_index": page_index,
+        "shape_index": shape_index,
+        "shape_name": shape_name(shape),
+        "z_order": shape_z_order(shape),
+        "text_crc": text_fingerprint(text)
+    }
+
+# 读取的字符属性，顺序与属性元组 (颜色, 下划线, 加粗, 上下标, 字号) 一致
+_CHAR_PROPERTY_NAMES = ("CharColor", "CharUnderline", "CharWeight", "CharEscapement", "CharHeight")
+# 段落之间的分隔没有字符属性，用占位值代替（与任何真实属性都不相等）
+_BREAK_ATTRS = object()
+
+def _char_attrs(values):
+    """将 _CHAR_PROPERTY_NAMES 顺序的属性值转换为属性元组"""
+    font_color, underline, weight, escapement, font_size = values
+    return (font_color, underline != 0, weight > 100, escapement, font_size)
+
+def iter_text_portions(text):
+    """
+    按段落和文本片段（portion，属性一致的连续文本）枚举文本，产出 (文本, 属性元组)，段落之间产出 ("\n", None)
+    每个portion只做一次getString和一次多属性读取，跨进程调用次数与portion数成正比
+    """
+    paragraphs = text.createEnumeration()
+    first_paragraph = True
+    while paragraphs.hasMoreElements():
+        paragraph = paragraphs.nextElement()
+        if not first_paragraph:
+            yield "\n", None
+        first_paragraph = False
+        portions = paragraph.createEnumeration()
+        while portions.hasMoreElements():
+            portion = portions.nextElement()
+            portion_text = portion.getString()
+            if not portion_text:
+                continue
+            try:
+                values = portion.getPropertyValues(_CHAR_PROPERTY_NAMES)
+            except Exception:
+                values = [portion.getPropertyValue(name) for name in _CHAR_PROPERTY_NAMES]
+            yield portion_text, _char_attrs(values)
+
+def iter_text_characters(text, text_str):
+    """
+    逐字符移动游标读取属性，产出 (字符, 属性元组)
+    每个字符需要多次跨进程调用，只在portion枚举不可用或结果与全文不一致时使用
+    """
     cursor = text.createTextCursor()  # 创建文本游标
-    cursor.gotoStart(False)  # 游标移到开头
+    for idx, char in enumerate(text_str):
+        cursor.gotoStart(False)  # 游标回到开头
+        cursor.goRight(idx, False)  # 向右移动到第idx个字符
+        cursor.goRight(1, True)     # 选中当前字符
+        yield char, _char_attrs([getattr(cursor, name) for name in _CHAR_PROPERTY_NAMES])
+
+def _split_runs_into_fragments(runs):
+    """
+    将 (文本, 属性) 序列按属性分片，换行符处记录段落分割
+    逐字符和按portion两种读取方式共用这一分片逻辑，输出完全一致
+    """
     content_queue = []  # 存储文本片段
     attr_queue = []     # 存储对应属性
     paragraph_breaks = []  # 存储段落分割位置
-    text_str = text.getString()  # 获取全部文本内容
-    
-    if not text_str:
-        logger.debug("文本框为空，跳过处理")
-        return [], [], []  # 没有文本直接返回空队列
-
-    logger.debug(f"文本框内容长度: {len(text_str)} 字符")
     last_attrs = None  # 上一个片段的属性
     buffer = ''        # 当前片段内容缓冲
     current_fragment_index = 0  # 当前片段索引
     
-    # 遍历每一个字
-    for idx, char in enumerate(text_str):
-        cursor.gotoStart(False)  # 游标回到开头
-        cursor.goRight(idx, False)  # 向右移动到第idx个字符
-        cursor.goRight(1, True)     # 选中当前字符
-        
-        # 提取字体属性
-        font_color = cursor.CharColor  # 字体颜色（RGB整数）
-        underline = cursor.CharUnderline != 0  # 是否有下划线
-        bold = cursor.CharWeight > 100         # 是否加粗
-        escapement = cursor.CharEscapement     # 上下标（正数为上标，负数为下标，0为正常）
-        font_size = cursor.CharHeight          # 字体大小
-        attrs = (font_color, underline, bold, escapement, font_size)
-        
-        # 检查是否为换行符
-        is_line_break = char in ['\n', '\r']
-        
-        # 判断属性是否与上一个片段一致
-        if last_attrs is None:
-            last_attrs = attrs
-            if not is_line_break:  # 跳过换行符本身
-                buffer = char
-        elif attrs == last_attrs and not is_line_break:
-            buffer += char
-        else:
-            # 属性变化或遇到换行符，保存上一个片段
-            if buffer.strip():  # 只保存非空内容
-                content_queue.append(buffer)
-                attr_queue.append(last_attrs)
-                current_fragment_index = len(content_queue) - 1
+    for run_text, attrs in runs:
+        if attrs is None:
+            attrs = _BREAK_ATTRS
+        # 按换行符切开，换行符单独处理
+        for piece in re.split(r'([\n\r])', run_text):
+            if not piece:
+                continue
+            is_line_break = piece in ('\n', '\r')
             
-            # 如果是换行符，记录段落分割位置
-            if is_line_break:
-                if content_queue:  # 确保有内容才记录分割
-                    paragraph_breaks.append(current_fragment_index)
-                buffer = ''
-                # 换行符后继续使用当前属性
+            # 判断属性是否与上一个片段一致
+            if last_attrs is None:
                 last_attrs = attrs
+                if not is_line_break:  # 跳过换行符本身
+                    buffer = piece
+            elif attrs == last_attrs and not is_line_break:
+                buffer += piece
             else:
-                buffer = char
+                # 属性变化或遇到换行符，保存上一个片段
+                if buffer.strip():  # 只保存非空内容
+                    content_queue.append(buffer)
+                    attr_queue.append(last_attrs)
+                    current_fragment_index = len(content_queue) - 1
+                
+                # 如果是换行符，记录段落分割位置
+                if is_line_break:
+                    if content_queue:  # 确保有内容才记录分割
+                        paragraph_breaks.append(current_fragment_index)
+                    buffer = ''
+                else:
+                    buffer = piece
+                # 换行符后继续使用当前属性
                 last_attrs = attrs
     
     # 保存最后一个片段
@@ -94,6 +165,37 @@ def extract_text_and_attrs(shape):
         content_queue.append(buffer)
         attr_queue.append(last_attrs)
     
+    return content_queue, attr_queue, paragraph_breaks
+
+# 提取文本框中文本片段的内容及其字体属性，并按属性分片，同时记录段落分割信息
+def extract_text_and_attrs(shape):
+    logger = get_logger("pyuno.subprocess")
+    logger.debug("开始提取文本框内容和属性...")
+    
+    text = shape.getText()  # 获取文本对象
+    text_str = text.getString()  # 获取全部文本内容
+    
+    if not text_str:
+        logger.debug("文本框为空，跳过处理")
+        return [], [], []  # 没有文本直接返回空队列
+
+    logger.debug(f"文本框内容长度: {len(text_str)} 字符")
+    
+    # 按段落/portion枚举；拼接结果与全文不一致时（例如特殊字段或换行符表示不同）退回逐字符读取
+    runs = None
+    try:
+        runs = list(iter_text_portions(text))
+        if "".join(run_text for run_text, _ in runs) != text_str:
+            logger.debug("portion枚举结果与文本框全文不一致，改为逐字符读取")
+            runs = None
+    except Exception as e:
+        logger.debug(f"portion枚举失败，改为逐字符读取: {e}")
+        runs = None
+    if runs is None:
+        runs = iter_text_characters(text, text_str)
+    
+    content_queue, attr_queue, paragraph_breaks = _split_runs_into_fragments(runs)
+    
     # 过滤掉内容为空或全是空格的片段
     filtered_content = []
     filtered_attr = []
@@ -291,6 +393,7 @@ def read_slide_from_presentation(context, slides, page_index=0):
                                 "box_id": f"textbox_{box_index}",
                                 "box_type": "text",
                                 "total_paragraphs": len(paragraphs),
+                                "shape_locator": build_shape_locator(shape, page_index, j, text),
                                 "paragraphs": paragraphs
                             }
                             
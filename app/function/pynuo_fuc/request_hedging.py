@@ -0,0 +1,250 @@
+'''
+request_hedging.py
+翻译请求的对冲与故障转移
+
+- 按模型统计请求延迟直方图（按估算输出token归一化为 秒/千token）
+- 请求超过该模型近期延迟的指定分位数仍未返回时，向备用模型再发一个相同的请求，取先返回的有效结果并取消另一个
+- 主模型调用失败时立即转向备用模型
+'''
+import sys, os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import math
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from logger_config import get_logger
+
+logger = get_logger("pyuno")
+
+# 对冲配置（默认关闭）
+UNO_HEDGE_ENABLED = os.getenv("UNO_HEDGE_ENABLED", "false").lower() in ("true", "1", "yes", "on")
+# 触发对冲的延迟分位数
+UNO_HEDGE_PERCENTILE = float(os.getenv("UNO_HEDGE_PERCENTILE", "95"))
+# 样本数不足时不对冲（只做失败转移）
+UNO_HEDGE_MIN_SAMPLES = int(os.getenv("UNO_HEDGE_MIN_SAMPLES", "20"))
+# 对冲等待时间下限（秒），避免短请求频繁触发
+UNO_HEDGE_MIN_DELAY = float(os.getenv("UNO_HEDGE_MIN_DELAY", "5"))
+# 主模型 -> 备用模型
+UNO_HEDGE_SECONDARY_MODELS = os.getenv("UNO_HEDGE_SECONDARY_MODELS", "qwen:deepseek,deepseek:qwen,gpt4o:qwen")
+
+# 直方图桶：0.1 ~ 约1000 秒/千token，按1.25倍递增
+_BUCKET_BASE = 0.1
+_BUCKET_FACTOR = 1.25
+_BUCKET_COUNT = 42
+# 每记录这么多个样本，历史计数减半，使直方图偏向近期延迟
+_DECAY_INTERVAL = 200
+
+
+def _parse_secondary_models(value):
+    mapping = {}
+    for pair in value.split(","):
+        if ":" in pair:
+            primary, secondary = (part.strip() for part in pair.split(":", 1))
+            if primary and secondary and primary != secondary:
+                mapping[primary] = secondary
+    return mapping
+
+
+_SECONDARY_MODELS = _parse_secondary_models(UNO_HEDGE_SECONDARY_MODELS)
+
+
+def secondary_model_for(model):
+    """返回模型的备用模型，未配置时返回None"""
+    return _SECONDARY_MODELS.get(model)
+
+
+class LatencyHistogram:
+    """对数分桶的延迟直方图（线程安全，周期性衰减）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = [0.0] * _BUCKET_COUNT
+        self._recorded = 0
+        self.samples = 0
+
+    @staticmethod
+    def _bucket(value):
+        if value <= _BUCKET_BASE:
+            return 0
+        index = int(math.log(value / _BUCKET_BASE, _BUCKET_FACTOR)) + 1
+        return min(index, _BUCKET_COUNT - 1)
+
+    @staticmethod
+    def _upper_bound(index):
+        return _BUCKET_BASE * (_BUCKET_FACTOR ** index)
+
+    def record(self, value):
+        with self._lock:
+            self._counts[self._bucket(value)] += 1
+            self._recorded += 1
+            self.samples += 1
+            if self._recorded >= _DECAY_INTERVAL:
+                self._counts = [count / 2 for count in self._counts]
+                self._recorded = 0
+
+    def percentile(self, p):
+        """分位数（取所在桶的上界，偏保守），没有样本时返回None"""
+        with self._lock:
+            total = sum(self._counts)
+            if total <= 0:
+                return None
+            threshold = total * p / 100
+            cumulative = 0.0
+            for index, count in enumerate(self._counts):
+                cumulative += count
+                if cumulative >= threshold:
+                    return self._upper_bound(index)
+            return self._upper_bound(_BUCKET_COUNT - 1)
+
+
+class ModelLatencyTracker:
+    """按模型统计翻译请求延迟，并计算对冲等待时间"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def _histogram(self, model):
+        with self._lock:
+            return self._histograms.setdefault(model, LatencyHistogram())
+
+    @staticmethod
+    def _size_factor(output_tokens):
+        # 不足1千token的请求按1千token计，固定开销（排队、首token）不随请求变小而变小
+        return max(1.0, (output_tokens or 0) / 1000)
+
+    def record(self, model, elapsed, output_tokens):
+        """记录一次成功请求的耗时"""
+        self._histogram(model).record(elapsed / self._size_factor(output_tokens))
+
+    def hedge_delay(self, model, output_tokens, percentile=None):
+        """
+        请求发出多少秒后仍未返回时发起对冲
+
+        Returns:
+            float: 等待秒数；样本不足时返回None（不对冲）
+        """
+        histogram = self._histogram(model)
+        if histogram.samples < UNO_HEDGE_MIN_SAMPLES:
+            return None
+        rate = histogram.percentile(percentile or UNO_HEDGE_PERCENTILE)
+        if rate is None:
+            return None
+        return max(UNO_HEDGE_MIN_DELAY, rate * self._size_factor(output_tokens))
+
+    def get_stats(self):
+        with self._lock:
+            histograms = dict(self._histograms)
+        return {
+            model: {
+                'samples': histogram.samples,
+                'p50_seconds_per_1k_tokens': histogram.percentile(50),
+                'p95_seconds_per_1k_tokens': histogram.percentile(95),
+                'p99_seconds_per_1k_tokens': histogram.percentile(99),
+            }
+            for model, histogram in histograms.items()
+        }
+
+
+class HedgeStats:
+    """对冲结果统计（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedged = 0
+        self.failovers = 0
+        self.secondary_wins = 0
+
+    def record(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'hedged': self.hedged,
+                'failovers': self.failovers,
+                'secondary_wins': self.secondary_wins,
+                'hedge_rate': self.hedged / self.calls * 100 if self.calls else 0.0,
+            }
+
+
+# 全局延迟统计与对冲统计
+model_latency_tracker = ModelLatencyTracker()
+hedge_stats = HedgeStats()
+
+
+def run_hedged(primary, secondary, hedge_delay, description=""):
+    """
+    执行对冲请求
+
+    Args:
+        primary: 主请求，callable(cancel_event) -> 结果；结果无效时应抛出异常
+        secondary: 备用请求，签名同 primary；为None时只执行主请求
+        hedge_delay: 主请求超过多少秒未返回时发起备用请求；None表示只在主请求失败时转移
+        description: 日志中的请求描述
+
+    Returns:
+        tuple: (是否由备用请求返回, 结果)
+
+    备用请求与主请求中先返回有效结果的一方胜出，另一方的 cancel_event 被设置。
+    流式调用会立即关闭连接；非流式调用无法中途中止，其结果被丢弃。
+    """
+    hedge_stats.record('calls')
+    if secondary is None:
+        return False, primary(threading.Event())
+
+    cancel_events = {'primary': threading.Event(), 'secondary': threading.Event()}
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="uno_hedge")
+    try:
+        futures = {executor.submit(contextvars.copy_context().run, primary, cancel_events['primary']): 'primary'}
+        done, _ = wait(futures, timeout=hedge_delay)
+        if not done:
+            hedge_stats.record('hedged')
+            logger.info(f"{description} 超过 {hedge_delay:.1f} 秒未返回，向备用模型发起对冲请求")
+            futures[executor.submit(contextvars.copy_context().run, secondary, cancel_events['secondary'])] = 'secondary'
+
+        errors = {}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors[name] = e
+                    logger.warning(f"{description} {'主' if name == 'primary' else '备用'}模型请求失败: {e}")
+                    continue
+                for other_name, cancel_event in cancel_events.items():
+                    if other_name != name:
+                        cancel_event.set()
+                if name == 'secondary':
+                    hedge_stats.record('secondary_wins')
+                return name == 'secondary', result
+
+            # 主请求在对冲之前就失败了：立即转向备用模型
+            if not pending and 'secondary' not in futures.values():
+                hedge_stats.record('failovers')
+                logger.info(f"{description} 主模型请求失败，转向备用模型")
+                future = executor.submit(contextvars.copy_context().run, secondary, cancel_events['secondary'])
+                futures[future] = 'secondary'
+                pending = {future}
+
+        raise errors.get('primary') or errors['secondary']
+    finally:
+        executor.shutdown(wait=False)
+
+
+def timed_attempt(func, model, output_tokens):
+    """包装请求函数，成功时记录模型延迟"""
+    def wrapper(cancel_event):
+        start = time.monotonic()
+        result = func(cancel_event)
+        model_latency_tracker.record(model, time.monotonic() - start, output_tokens)
+        return result
+    return wrapper
@@ -0,0 +1,317 @@
+'''
+request_packer.py
+按token预算打包/拆分翻译请求
+
+- 稀疏页面（标题页、章节页）合并到同一个请求中，减少往返次数和重复的系统提示词
+- 超长页面按文本框/段落边界拆分，避免输出超过模型的 max_tokens
+- 请求内对文本框重新编号，保证多页合并时【文本框X-段落Y】键不冲突，结果再映射回真实的(页面, 文本框)
+'''
+import sys, os
+sys.path.insert(0, os.path.dirname(__file__))
+
+from logger_config import get_logger
+
+# 与限流、调用计量共用同一个token估算
+from app.utils.llm_usage import estimate_tokens
+
+logger = get_logger("pyuno")
+
+# 打包配置
+UNO_PAGE_PACKING_ENABLED = os.getenv("UNO_PAGE_PACKING_ENABLED", "true").lower() in ("true", "1", "yes", "on")
+# 单个请求的输入/输出token预算（不含系统提示词）
+UNO_REQUEST_MAX_INPUT_TOKENS = int(os.getenv("UNO_REQUEST_MAX_INPUT_TOKENS", "2500"))
+UNO_REQUEST_MAX_OUTPUT_TOKENS = int(os.getenv("UNO_REQUEST_MAX_OUTPUT_TOKENS", "6000"))
+# 单个请求最多合并的页数，限制一次失败影响的页面范围
+UNO_PACK_MAX_PAGES = int(os.getenv("UNO_PACK_MAX_PAGES", "8"))
+
+# 输出估算：每个段落输出一个JSON对象，包含原文回显和译文
+_JSON_ITEM_OVERHEAD_TOKENS = 25
+_TRANSLATION_EXPANSION = 1.5
+
+
+def estimate_output_tokens(box_para):
+    """估算一个文本框段落在JSON输出中占用的token数"""
+    input_tokens = estimate_tokens(box_para['combined_text'])
+    return _JSON_ITEM_OVERHEAD_TOKENS + int(input_tokens * (1 + _TRANSLATION_EXPANSION))
+
+
+def format_reference_translations(references):
+    """
+    格式化翻译记忆中的相似句译文，作为提示词中的参考信息
+
+    Args:
+        references: [(原文, 译文)] 列表
+    """
+    if not references:
+        return ""
+    text = "【参考译文】（以下是翻译记忆中的相似句及其译文，仅供术语和风格参考，不需要翻译或输出）\n"
+    for source, target in references:
+        # 参考句中的[block]分隔符对模型没有意义，避免与待翻译段落的格式混淆
+        source = source.replace('[block]', ' ')
+        target = target.replace('[block]', ' ')
+        text += f"原文：{source}\n译文：{target}\n"
+    return text + "\n"
+
+
+def format_page_glossary(stop_words, custom_translations):
+    """
+    格式化页面中出现的术语，作为提示词中的术语表
+
+    Args:
+        stop_words: 本页出现的停翻词
+        custom_translations: 本页出现的自定义翻译 {原文: 译文}
+    """
+    if not stop_words and not custom_translations:
+        return ""
+    text = "【术语表】（仅列出本页出现的术语，不需要翻译或输出）\n"
+    if stop_words:
+        text += "以下词语保留原样，不翻译：" + "、".join(stop_words) + "\n"
+    if custom_translations:
+        text += "以下词语请使用指定译法：\n"
+        for source, target in custom_translations.items():
+            text += f"{source} -> {target}\n"
+    return text + "\n"
+
+
+class TranslationRequest:
+    """
+    一次翻译API调用的内容，可以包含多个页面，或者一个页面的一部分
+    """
+
+    def __init__(self):
+        self.box_paragraphs = []
+        self.page_indices = []
+        self.references = {}
+        self.glossaries = {}
+        self.input_tokens = 0
+        self.output_tokens = 0
+        # 是否只包含某一页的一部分（超长页面被拆分）
+        self.is_partial = False
+        # 指定翻译模型（按段落路由时设置），为None时使用任务的模型
+        self.model = None
+        # 输出被截断后二分拆分的次数 {page_index: 次数}
+        self.truncation_splits = {}
+        # 放在所有页面内容之前的附加说明（如[block]格式修复的要求和上下文）
+        self.preamble = ""
+        # 请求内文本框编号(1-based) -> (页面索引, 文本框索引)
+        self._box_map = {}
+        self._local_box_numbers = {}
+
+    def __len__(self):
+        return len(self.box_paragraphs)
+
+    def add_page_references(self, page_index, references):
+        """记录页面的参考译文，并计入输入token"""
+        if page_index in self.references or not references:
+            return
+        self.references[page_index] = references
+        self.input_tokens += estimate_tokens(format_reference_translations(references))
+
+    def add_page_glossary(self, page_index, glossary):
+        """记录页面的术语表文本，并计入输入token"""
+        if page_index in self.glossaries or not glossary:
+            return
+        self.glossaries[page_index] = glossary
+        self.input_tokens += estimate_tokens(glossary)
+
+    def add(self, box_para):
+        """加入一个文本框段落"""
+        page_index = box_para['page_index']
+        if page_index not in self.page_indices:
+            self.page_indices.append(page_index)
+
+        real_box = (page_index, box_para['box_index'])
+        if real_box not in self._local_box_numbers:
+            local_number = len(self._local_box_numbers) + 1
+            self._local_box_numbers[real_box] = local_number
+            self._box_map[local_number] = real_box
+
+        self.box_paragraphs.append(box_para)
+        self.input_tokens += estimate_tokens(box_para['combined_text'])
+        self.output_tokens += estimate_output_tokens(box_para)
+
+    def bisect(self, box_paragraphs=None):
+        """
+        按输入顺序把段落（默认为请求的全部段落）对半分成两个请求，保留各页的术语表、参考译文和指定模型
+
+        Returns:
+            tuple: (前半部分, 后半部分)
+        """
+        page_order = {page_index: order for order, page_index in enumerate(self.page_indices)}
+        ordered = sorted(box_paragraphs if box_paragraphs is not None else self.box_paragraphs,
+                         key=lambda bp: (page_order[bp['page_index']], bp['box_index'], bp['paragraph_index']))
+        middle = (len(ordered) + 1) // 2
+
+        halves = []
+        for part in (ordered[:middle], ordered[middle:]):
+            request = TranslationRequest()
+            request.is_partial = True
+            request.model = self.model
+            for box_para in part:
+                page_index = box_para['page_index']
+                request.add_page_glossary(page_index, self.glossaries.get(page_index))
+                request.add_page_references(page_index, self.references.get(page_index))
+                request.add(box_para)
+            halves.append(request)
+        return tuple(halves)
+
+    def paragraph_label(self, box_para):
+        """段落在请求内的标记，如 文本框3-段落1"""
+        local_box = self._local_box_numbers[(box_para['page_index'], box_para['box_index'])]
+        return f"文本框{local_box}-段落{box_para['paragraph_index'] + 1}"
+
+    def describe(self):
+        """请求内容的简短描述，用于日志"""
+        pages = "、".join(str(p + 1) for p in self.page_indices)
+        suffix = "（部分）" if self.is_partial else ""
+        if self.model:
+            suffix += f"（{self.model}）"
+        return f"第{pages}页{suffix}，{len(self.box_paragraphs)} 个段落，约 {self.input_tokens}/{self.output_tokens} 输入/输出token"
+
+    def format_text(self):
+        """
+        生成发送给翻译API的格式化文本
+
+        文本框使用请求内编号，段落序号保持原值，保证【文本框X-段落Y】在请求内唯一。
+        """
+        formatted_text = self.preamble
+        for page_index in self.page_indices:
+            formatted_text += f"第{page_index + 1}页内容（PPT原始页面索引：{page_index}）：\n\n"
+            formatted_text += self.glossaries.get(page_index, "")
+            formatted_text += format_reference_translations(self.references.get(page_index))
+
+            page_box_paragraphs = sorted(
+                (bp for bp in self.box_paragraphs if bp['page_index'] == page_index),
+                key=lambda bp: (bp['box_index'], bp['paragraph_index'])
+            )
+            for box_para in page_box_paragraphs:
+                formatted_text += f"【{self.paragraph_label(box_para)}】\n"
+                formatted_text += f"{box_para['combined_text']}\n\n"
+        return formatted_text.strip()
+
+    def remap_fragments(self, api_fragments):
+        """
+        将API结果中的请求内键映射回各页面的真实键
+
+        Args:
+            api_fragments: separate_translate_text 的结果 {"局部文本框_段落": fragments}
+
+        Returns:
+            dict: {page_index: {"文本框_段落": fragments}}，键均为1-based
+        """
+        page_fragments = {page_index: {} for page_index in self.page_indices}
+        for key, fragments in api_fragments.items():
+            try:
+                local_box, paragraph_number = (int(part) for part in str(key).split('_'))
+            except ValueError:
+                logger.warning(f"翻译结果中存在无法识别的键: {key}")
+                continue
+            real_box = self._box_map.get(local_box)
+            if real_box is None:
+                logger.warning(f"翻译结果中的文本框 {local_box} 不在本次请求中，忽略")
+                continue
+            page_index, box_index = real_box
+            page_fragments[page_index][f"{box_index + 1}_{paragraph_number}"] = fragments
+        return page_fragments
+
+
+def _split_oversized_page(box_paragraphs, references, glossary, max_input_tokens, max_output_tokens):
+    """
+    按文本框/段落边界拆分超出预算的页面
+
+    优先保持文本框完整；单个文本框超出预算时再按段落拆分，单个段落超出预算时单独成为一个请求。
+    """
+    boxes = {}
+    for box_para in box_paragraphs:
+        boxes.setdefault(box_para['box_index'], []).append(box_para)
+
+    chunks = []
+    current = None
+
+    def fits(request, paragraphs):
+        input_tokens = sum(estimate_tokens(bp['combined_text']) for bp in paragraphs)
+        output_tokens = sum(estimate_output_tokens(bp) for bp in paragraphs)
+        return (request.input_tokens + input_tokens <= max_input_tokens and
+                request.output_tokens + output_tokens <= max_output_tokens)
+
+    def new_chunk():
+        request = TranslationRequest()
+        request.is_partial = True
+        request.add_page_glossary(box_paragraphs[0]['page_index'], glossary)
+        request.add_page_references(box_paragraphs[0]['page_index'], references)
+        chunks.append(request)
+        return request
+
+    for box_index in sorted(boxes):
+        paragraphs = sorted(boxes[box_index], key=lambda bp: bp['paragraph_index'])
+        # 当前请求放不下整个文本框时另起一个请求，新请求中仍放不下再按段落拆分
+        if current is None or (len(current) and not fits(current, paragraphs)):
+            current = new_chunk()
+        for box_para in paragraphs:
+            if len(current) and not fits(current, [box_para]):
+                current = new_chunk()
+            current.add(box_para)
+
+    return chunks
+
+
+def pack_translation_requests(pages, max_input_tokens=None, max_output_tokens=None, max_pages=None, glossaries=None):
+    """
+    将各页待翻译的段落打包成若干翻译请求
+
+    Args:
+        pages: [(page_index, box_paragraphs, references)]，按页面顺序排列
+        max_input_tokens: 单个请求的输入token预算
+        max_output_tokens: 单个请求的输出token预算
+        max_pages: 单个请求最多合并的页数
+        glossaries: {page_index: 术语表文本}，见 format_page_glossary
+
+    Returns:
+        list[TranslationRequest]: 按页面顺序排列的请求列表
+    """
+    max_input_tokens = max_input_tokens or UNO_REQUEST_MAX_INPUT_TOKENS
+    max_output_tokens = max_output_tokens or UNO_REQUEST_MAX_OUTPUT_TOKENS
+    max_pages = max_pages or UNO_PACK_MAX_PAGES
+    glossaries = glossaries or {}
+
+    requests_list = []
+    current = None
+
+    for page_index, box_paragraphs, references in pages:
+        if not box_paragraphs:
+            continue
+
+        glossary = glossaries.get(page_index, "")
+        page_request = TranslationRequest()
+        page_request.add_page_glossary(page_index, glossary)
+        page_request.add_page_references(page_index, references)
+        for box_para in box_paragraphs:
+            page_request.add(box_para)
+
+        # 超长页面：单独拆分成多个请求
+        if page_request.input_tokens > max_input_tokens or page_request.output_tokens > max_output_tokens:
+            chunks = _split_oversized_page(box_paragraphs, references, glossary, max_input_tokens, max_output_tokens)
+            logger.info(f"PPT第 {page_index + 1} 页超出请求预算（约 {page_request.input_tokens}/"
+                        f"{page_request.output_tokens} 输入/输出token），拆分为 {len(chunks)} 个请求")
+            requests_list.extend(chunks)
+            current = None
+            continue
+
+        if not UNO_PAGE_PACKING_ENABLED:
+            requests_list.append(page_request)
+            continue
+
+        # 尝试与前面的页面合并
+        if (current is not None and
+                len(current.page_indices) < max_pages and
+                current.input_tokens + page_request.input_tokens <= max_input_tokens and
+                current.output_tokens + page_request.output_tokens <= max_output_tokens):
+            current.add_page_glossary(page_index, glossary)
+            current.add_page_references(page_index, references)
+            for box_para in box_paragraphs:
+                current.add(box_para)
+        else:
+            current = page_request
+            requests_list.append(current)
+
+    return requests_list
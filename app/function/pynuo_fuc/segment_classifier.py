@@ -0,0 +1,258 @@
+'''
+segment_classifier.py
+翻译前的本地快速通道
+
+页码、纯数字、带单位的数值、日期、网址、产品编号、术语表精确命中等片段不需要大模型：
+在本地直接得到译文（原样保留、术语表查询、按目标语言调整数字/日期格式），并从请求中移除。
+只有段落内所有[block]片段都能在本地解决时，整个段落才走快速通道。
+'''
+import sys, os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import re
+import datetime
+import unicodedata
+from logger_config import get_logger
+from request_packer import estimate_tokens, estimate_output_tokens
+from app.utils.llm_usage import HAN_RE, KANA_HANGUL_CHARS
+
+logger = get_logger("pyuno")
+
+UNO_LOCAL_FAST_PATH_ENABLED = os.getenv("UNO_LOCAL_FAST_PATH_ENABLED", "true").lower() in ("true", "1", "yes", "on")
+
+# 语言参数的各种写法 -> 语言代码
+_LANGUAGE_ALIASES = {
+    'zh': 'zh', 'zh-cn': 'zh', 'zh_cn': 'zh', 'chinese': 'zh', '中文': 'zh',
+    'en': 'en', 'english': 'en', '英文': 'en', '英语': 'en',
+    'nl': 'nl', 'dutch': 'nl', '荷兰语': 'nl',
+}
+
+# 数字格式：(千分位分隔符, 小数点)
+_NUMBER_FORMATS = {'en': (',', '.'), 'zh': (',', '.'), 'nl': ('.', ',')}
+
+_MONTHS_EN = ['January', 'February', 'March', 'April', 'May', 'June', 'July',
+              'August', 'September', 'October', 'November', 'December']
+_MONTHS_NL = ['januari', 'februari', 'maart', 'april', 'mei', 'juni', 'juli',
+              'augustus', 'september', 'oktober', 'november', 'december']
+_MONTH_LOOKUP = {}
+for _index, _name in enumerate(_MONTHS_EN, 1):
+    _MONTH_LOOKUP[_name.lower()] = _index
+    _MONTH_LOOKUP[_name[:3].lower()] = _index
+_MONTH_LOOKUP['sept'] = 9
+for _index, _name in enumerate(_MONTHS_NL, 1):
+    _MONTH_LOOKUP.setdefault(_name, _index)
+
+_UNITS = {
+    '%', '‰', '°', '°C', '°F', '℃', '℉',
+    'kg', 'g', 'mg', 'μg', 'µg', 'ng', 't',
+    'km', 'm', 'cm', 'mm', 'μm', 'µm', 'nm',
+    'L', 'l', 'mL', 'ml', 'μL', 'µL', 'dL',
+    'Hz', 'kHz', 'MHz', 'GHz', 'W', 'kW', 'MW', 'GW', 'kWh', 'MWh',
+    'V', 'mV', 'kV', 'A', 'mA', 'Ω', 'kΩ', 'J', 'kJ', 'kcal', 'Pa', 'kPa', 'MPa', 'bar', 'psi',
+    'ms', 'μs', 'µs', 'ns', 'KB', 'MB', 'GB', 'TB', 'PB', 'Kb', 'Mb', 'Gb', 'bps', 'Kbps', 'Mbps', 'Gbps',
+    'px', 'pt', 'dpi', 'rpm', 'mol', 'mmol', 'μmol', 'µmol', 'IU',
+    'mg/mL', 'mg/ml', 'mg/kg', 'μg/mL', 'µg/mL', 'ng/mL', 'mmol/L', 'g/L', 'mg/L', 'm²', 'm³', 'km²', 'cm²', 'x', '×',
+}
+_CURRENCY_SYMBOLS = '$€£¥￥'
+
+_URL_RE = re.compile(r'^(?:https?://|ftp://|www\.)\S+$', re.IGNORECASE)
+_EMAIL_RE = re.compile(r'^[\w.+-]+@[\w-]+(?:\.[\w-]+)+$')
+# 产品编号/型号：大写字母、数字和连接符，且至少包含一个数字
+_CODE_RE = re.compile(r'^(?=[^\s]*\d)[A-Z0-9][A-Z0-9\-_/.#]*[A-Z0-9]$')
+# 财年/季度等写法需要翻译（如 Q3 -> 第三季度），不能当作编号原样保留
+_PERIOD_RE = re.compile(r'^(?:[QH]\d|FY\d{2,4}|CY\d{2,4}|[QH]\d\s?FY\d{2,4})$')
+_VERSION_RE = re.compile(r'^[vV]\d+(?:\.\d+){0,3}$')
+_ISO_DATE_RE = re.compile(r'^(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})$')
+_ZH_DATE_RE = re.compile(r'^(\d{4})\s*年\s*(\d{1,2})\s*月(?:\s*(\d{1,2})\s*日)?$')
+_EN_DATE_MDY_RE = re.compile(r'^([A-Za-z]+)\.?\s+(?:(\d{1,2})(?:st|nd|rd|th)?,?\s+)?(\d{4})$')
+_EN_DATE_DMY_RE = re.compile(r'^(\d{1,2})(?:st|nd|rd|th)?\s+([A-Za-z]+)\.?,?\s+(\d{4})$')
+_KANA_HANGUL_LATIN_RE = re.compile(f'[{KANA_HANGUL_CHARS}A-Za-z]')
+
+
+def normalize_language(language):
+    """把 'Chinese'、'zh-cn'、'中文' 等写法统一为语言代码"""
+    key = str(language or '').strip().lower()
+    return _LANGUAGE_ALIASES.get(key, key)
+
+
+def _number_re(thousands, decimal):
+    t, d = re.escape(thousands), re.escape(decimal)
+    return re.compile(
+        rf'^(?P<sign>[+\-−±]?)(?P<currency>[{_CURRENCY_SYMBOLS}]?)\s?'
+        rf'(?P<integer>\d{{1,3}}(?:{t}\d{{3}})+|\d+)(?:{d}(?P<fraction>\d+))?'
+        rf'(?:\s?(?P<unit>\S+))?$'
+    )
+
+
+_NUMBER_RES = {fmt: _number_re(*fmt) for fmt in set(_NUMBER_FORMATS.values())}
+
+
+def _convert_number(text, source, target):
+    """数值（可带符号、货币符号和单位）：按目标语言的千分位/小数点格式重写"""
+    source_format = _NUMBER_FORMATS.get(source, _NUMBER_FORMATS['en'])
+    target_format = _NUMBER_FORMATS.get(target)
+    match = _NUMBER_RES[source_format].match(text)
+    if not match:
+        return None
+    unit = match.group('unit')
+    if unit is not None and unit not in _UNITS:
+        return None
+    if target_format is None or target_format == source_format:
+        return text
+
+    source_thousands, _ = source_format
+    target_thousands, target_decimal = target_format
+    integer = match.group('integer').replace(source_thousands, target_thousands)
+    fraction = match.group('fraction')
+    number = integer + (target_decimal + fraction if fraction is not None else '')
+    return text[:match.start('integer')] + number + text[match.end('fraction') if fraction is not None
+                                                        else match.end('integer'):]
+
+
+def _format_date(year, month, day, target):
+    if target == 'zh':
+        return f"{year}年{month}月" + (f"{day}日" if day else "")
+    if target == 'en':
+        return f"{_MONTHS_EN[month - 1]} {day}, {year}" if day else f"{_MONTHS_EN[month - 1]} {year}"
+    if target == 'nl':
+        return f"{day} {_MONTHS_NL[month - 1]} {year}" if day else f"{_MONTHS_NL[month - 1]} {year}"
+    return None
+
+
+def _valid_date(year, month, day):
+    try:
+        datetime.date(year, month, day or 1)
+        return True
+    except ValueError:
+        return False
+
+
+def _convert_date(text, target):
+    """日期：只处理没有歧义的写法（ISO、中文、英文月份名），数字月日顺序有歧义的保持交给模型"""
+    match = _ISO_DATE_RE.match(text)
+    if match:
+        year, month, day = (int(g) for g in match.groups())
+        if not _valid_date(year, month, day):
+            return None
+        # ISO日期在中文里改写为年月日，其他语言原样保留
+        return _format_date(year, month, day, 'zh') if target == 'zh' else text
+
+    match = _ZH_DATE_RE.match(text)
+    if match:
+        year, month = int(match.group(1)), int(match.group(2))
+        day = int(match.group(3)) if match.group(3) else None
+        if not _valid_date(year, month, day):
+            return None
+        return _format_date(year, month, day, target)
+
+    for pattern, month_group, day_group, year_group in ((_EN_DATE_MDY_RE, 1, 2, 3), (_EN_DATE_DMY_RE, 2, 1, 3)):
+        match = pattern.match(text)
+        if not match:
+            continue
+        month = _MONTH_LOOKUP.get(match.group(month_group).lower())
+        if month is None:
+            continue
+        year = int(match.group(year_group))
+        day = int(match.group(day_group)) if match.group(day_group) else None
+        if not _valid_date(year, month, day):
+            return None
+        return _format_date(year, month, day, target)
+    return None
+
+
+def _is_symbols_only(text):
+    """只包含标点、符号（如项目符号、破折号、版权符号）"""
+    return all(unicodedata.category(ch)[0] in ('P', 'S', 'Z') for ch in text)
+
+
+def classify_fragment(text, source_language, target_language, glossary_matcher=None):
+    """
+    判断单个片段能否在本地翻译
+
+    Returns:
+        tuple: (类别, 译文)；需要大模型翻译时返回None
+    """
+    if not text or not text.strip():
+        return 'whitespace', text
+
+    stripped = text.strip()
+    leading = text[:len(text) - len(text.lstrip())]
+    trailing = text[len(text.rstrip()):]
+
+    def result(category, translated):
+        return category, leading + translated + trailing
+
+    source = normalize_language(source_language)
+    target = normalize_language(target_language)
+
+    if _is_symbols_only(stripped):
+        return result('symbol', stripped)
+
+    if glossary_matcher is not None:
+        translated = glossary_matcher.lookup_exact(stripped)
+        if translated is not None:
+            return result('glossary', translated)
+
+    converted = _convert_number(stripped, source, target)
+    if converted is not None:
+        return result('number', converted)
+
+    converted = _convert_date(stripped, target)
+    if converted is not None:
+        return result('date', converted)
+
+    if _URL_RE.match(stripped) or _EMAIL_RE.match(stripped):
+        return result('url', stripped)
+
+    if (_CODE_RE.match(stripped) and not _PERIOD_RE.match(stripped)) or _VERSION_RE.match(stripped):
+        return result('code', stripped)
+
+    # 目标语言为中文时，纯中文片段原样保留（与提示词中的规则一致）
+    if target == 'zh' and HAN_RE.search(stripped) and not _KANA_HANGUL_LATIN_RE.search(stripped):
+        return result('chinese', stripped)
+
+    return None
+
+
+def resolve_trivial_paragraphs(box_paragraphs, source_language, target_language, glossary_matcher=None):
+    """
+    在本地解决所有片段都无需大模型的段落
+
+    Args:
+        box_paragraphs: 文本框段落列表
+        source_language: 源语言
+        target_language: 目标语言
+        glossary_matcher: 可选的术语表匹配器，用于术语精确命中
+
+    Returns:
+        tuple: (resolved, remaining, stats)
+            - resolved: {"文本框_段落"(1-based): fragments}
+            - remaining: 仍需调用大模型的段落
+            - stats: {'segments': 段落数, 'input_tokens': 节省的输入token, 'output_tokens': 节省的输出token,
+                      'categories': {类别: 片段数}}
+    """
+    stats = {'segments': 0, 'input_tokens': 0, 'output_tokens': 0, 'categories': {}}
+    if not UNO_LOCAL_FAST_PATH_ENABLED:
+        return {}, list(box_paragraphs), stats
+
+    resolved = {}
+    remaining = []
+    for box_para in box_paragraphs:
+        classified = [classify_fragment(text, source_language, target_language, glossary_matcher)
+                      for text in box_para['texts']]
+        # 全部是空白的段落仍交给原流程处理
+        if any(item is None for item in classified) or all(category == 'whitespace' for category, _ in classified):
+            remaining.append(box_para)
+            continue
+
+        resolved[f"{box_para['box_index'] + 1}_{box_para['paragraph_index'] + 1}"] = [
+            translated for _, translated in classified
+        ]
+        stats['segments'] += 1
+        stats['input_tokens'] += estimate_tokens(box_para['combined_text'])
+        stats['output_tokens'] += estimate_output_tokens(box_para)
+        for category, _ in classified:
+            if category != 'whitespace':
+                stats['categories'][category] = stats['categories'].get(category, 0) + 1
+
+    return resolved, remaining, stats
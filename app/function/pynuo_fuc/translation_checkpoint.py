@@ -0,0 +1,150 @@
+'''
+translation_checkpoint.py
+按页保存翻译断点，任务中途失败后重试时从未完成的页面继续
+
+- 断点按任务标识（文件内容哈希 + 源/目标语言 + 模型 + 术语表指纹）保存在 UNO_CHECKPOINT_DIR 下
+- 每页所有请求完成后立即追加一行JSON，进程崩溃时最多丢失最后一行
+- 任务成功后删除断点；残留的断点由定时清理任务按修改时间删除
+'''
+import sys, os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from logger_config import get_logger
+
+try:
+    from app.utils.translation_memory import file_content_hash
+except ImportError:
+    # 独立运行（不在app包内）时只能使用调用方传入的文件哈希
+    file_content_hash = None
+
+logger = get_logger("pyuno")
+
+UNO_CHECKPOINT_ENABLED = os.getenv("UNO_CHECKPOINT_ENABLED", "true").lower() in ("true", "1", "yes", "on")
+UNO_CHECKPOINT_DIR = os.getenv("UNO_CHECKPOINT_DIR", os.path.join(tempfile.gettempdir(), "pyuno_checkpoints"))
+# 超过该时间未更新的断点视为过期
+UNO_CHECKPOINT_MAX_AGE_HOURS = float(os.getenv("UNO_CHECKPOINT_MAX_AGE_HOURS", "48"))
+
+_CHECKPOINT_SUFFIX = ".jsonl"
+
+
+class TranslationCheckpoint:
+    """
+    单个翻译任务的断点文件
+
+    每行一个页面: {"page_index": 页面索引, "fragments": {"文本框_段落": fragments}}，同一页面以最后一行为准。
+    """
+
+    def __init__(self, task_key, directory=None):
+        self.task_key = task_key
+        self.path = os.path.join(directory or UNO_CHECKPOINT_DIR, task_key + _CHECKPOINT_SUFFIX)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_task(cls, presentation_path, source_language, target_language, model, glossary_fp="", content_hash=None):
+        """
+        按文件内容和翻译参数生成任务断点；未启用断点或文件无法读取时返回None
+
+        content_hash 为上传时计算的原始文件哈希。翻译流程会就地保存文件（布局调整），
+        此时再读文件得到的哈希每次都不同，调用方应传入上传时的哈希，未提供时才读取当前文件
+        """
+        if not UNO_CHECKPOINT_ENABLED:
+            return None
+        if not content_hash:
+            if file_content_hash is None:
+                logger.warning("未提供文件哈希且无法计算，本次任务不保存断点")
+                return None
+            try:
+                content_hash = file_content_hash(presentation_path)
+            except OSError as e:
+                logger.warning(f"计算文件哈希失败，本次任务不保存断点: {e}")
+                return None
+        key_source = json.dumps([content_hash, source_language, target_language, model, glossary_fp],
+                                ensure_ascii=False)
+        return cls(hashlib.sha256(key_source.encode('utf-8')).hexdigest()[:32])
+
+    def load(self):
+        """
+        读取已完成页面的译文
+
+        Returns:
+            dict: {page_index: {"文本框_段落": fragments}}；没有断点时返回空字典
+        """
+        pages = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line_number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                        pages[int(record['page_index'])] = dict(record['fragments'])
+                    except (ValueError, KeyError, TypeError):
+                        # 写入中途崩溃留下的不完整行
+                        logger.warning(f"断点文件第 {line_number} 行不完整，忽略: {self.path}")
+        except FileNotFoundError:
+            return {}
+        except OSError as e:
+            logger.warning(f"读取断点文件失败，从头开始翻译: {e}")
+            return {}
+        if pages:
+            logger.info(f"读取翻译断点: {len(pages)} 页已完成（{self.path}）")
+        return pages
+
+    def save_page(self, page_index, fragments):
+        """追加一个页面的译文；写入失败只记录警告，不影响翻译"""
+        if not fragments:
+            return
+        line = json.dumps({'page_index': page_index, 'fragments': fragments}, ensure_ascii=False) + "\n"
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+                    f.flush()
+            except OSError as e:
+                logger.warning(f"保存第 {page_index + 1} 页翻译断点失败: {e}")
+
+    def remove(self):
+        """任务成功后删除断点"""
+        with self._lock:
+            try:
+                os.remove(self.path)
+                logger.info(f"任务完成，已删除翻译断点: {self.path}")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"删除翻译断点失败: {e}")
+
+
+def cleanup_expired_checkpoints(max_age_hours=None, directory=None):
+    """
+    删除超过 max_age_hours 未更新的断点文件（供定时清理任务调用）
+
+    Returns:
+        int: 删除的文件数
+    """
+    directory = directory or UNO_CHECKPOINT_DIR
+    max_age_hours = UNO_CHECKPOINT_MAX_AGE_HOURS if max_age_hours is None else max_age_hours
+    if not os.path.isdir(directory):
+        return 0
+
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for filename in os.listdir(directory):
+        if not filename.endswith(_CHECKPOINT_SUFFIX):
+            continue
+        path = os.path.join(directory, filename)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError as e:
+            logger.warning(f"删除过期翻译断点 {filename} 失败: {e}")
+    if removed:
+        logger.info(f"清理了 {removed} 个过期翻译断点")
+    return removed
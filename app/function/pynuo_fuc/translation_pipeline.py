@@ -0,0 +1,409 @@
+'''
+translation_pipeline.py
+读取、翻译、写入三个阶段的流水线：边读取页面边翻译，翻译完成的页面立即交给写入线程
+
+- 读取线程逐页从ODP读取内容，放入有界的页面队列
+- 调度线程（调用方线程）把页面按 UNO_PIPELINE_CHUNK_PAGES 页分批，批次内提取、去重后交给翻译线程池，
+  在途批次数不超过翻译线程数；去重的代表段落表跨批次共用，重复段落等其代表段落所在批次完成后再映射
+- 写入线程打开工作文件副本，逐页写入翻译完成的页面，全部页面写完后保存
+- 传入 DocumentSession 时读取和写入都在会话中已加载的同一个文档上进行，不再打开文件、也不保存
+
+队列都有上限，翻译跟不上时读取会阻塞，写入跟不上时翻译会阻塞，内存中只保留有限的在途页面。
+任一阶段失败时整条流水线中止，调用方按失败处理（与分阶段流程一致）。
+'''
+import sys, os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import queue
+import shutil
+import threading
+import contextvars
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from logger_config import get_logger, log_execution_time, PhaseTimer
+from load_ppt_functions import iter_ppt_pages_direct, calculate_statistics
+from edit_ppt_functions import write_ppt_pages_direct
+from ppt_data_utils import extract_texts_for_translation, deduplicate_text_boxes_data, map_translation_results_back
+
+logger = get_logger("pyuno.main")
+
+UNO_PIPELINE_ENABLED = os.getenv("UNO_PIPELINE_ENABLED", "true").lower() in ("true", "1", "yes", "on")
+# 每批交给翻译的页数（批内页面一起打包请求，批次越大请求合并越充分，首批开始翻译越晚）
+UNO_PIPELINE_CHUNK_PAGES = max(1, int(os.getenv("UNO_PIPELINE_CHUNK_PAGES", "4")))
+# 读取->翻译、翻译->写入两个队列各自最多缓存的页数
+UNO_PIPELINE_QUEUE_PAGES = max(1, int(os.getenv("UNO_PIPELINE_QUEUE_PAGES", "8")))
+# 同时翻译的批次数（不超过 UNO_PAGE_CONCURRENCY，单任务的请求并发由各批次均分，见 _translate_concurrency）
+UNO_PIPELINE_TRANSLATE_WORKERS = max(1, int(os.getenv("UNO_PIPELINE_TRANSLATE_WORKERS", "2")))
+
+# 队列等待的轮询间隔（秒），用于及时响应中止
+_POLL_INTERVAL = 0.2
+_END = object()
+
+
+def _translate_concurrency():
+    """
+    计算同时翻译的批次数与每批的请求并发数
+
+    每个批次各自调用 translate_pages_by_page，两者相乘才是单任务的在途请求数；
+    按 UNO_PAGE_CONCURRENCY 均分，开启流水线时单任务并发的含义与关闭时一致
+
+    Returns:
+        tuple: (批次数, 每批请求并发数)
+    """
+    from api_translate_uno import UNO_PAGE_CONCURRENCY
+
+    task_concurrency = max(1, UNO_PAGE_CONCURRENCY)
+    workers = min(UNO_PIPELINE_TRANSLATE_WORKERS, task_concurrency)
+    return workers, task_concurrency // workers
+
+
+class PipelineAborted(Exception):
+    """流水线其他阶段失败，当前阶段停止"""
+
+
+class _Chunk:
+    """一批页面及其翻译状态"""
+
+    def __init__(self, chunk_id, pages):
+        self.chunk_id = chunk_id
+        self.pages = pages
+        self.text_boxes_data = []
+        self.unique_text_boxes_data = []
+        self.dedup_info = None
+        # 重复段落引用的代表段落所在的批次
+        self.depends_on = set()
+        self.done = threading.Event()
+
+
+class TranslationPipeline:
+    """
+    单个任务的读取-翻译-写入流水线
+
+    用法:
+        pipeline = TranslationPipeline(odp_path, output_odp_path, page_indices, ...)
+        result = pipeline.run()
+
+    session 不为None时从会话文档读取并写回会话文档，odp_path 仅用于记录，output_odp_path 不使用；
+    timer 用于累计翻译阶段耗时（会话模式下读取、写入耗时由会话记录到同一个 timer）
+    """
+
+    def __init__(self, odp_path, output_odp_path, page_indices, source_language, target_language, model,
+                 mode='paragraph_up', progress_callback=None, stop_words_list=None, custom_translations=None,
+                 glossary_fp="", checkpoint=None, session=None, timer=None):
+        self.odp_path = odp_path
+        self.output_odp_path = output_odp_path
+        self.page_indices = page_indices
+        self.source_language = source_language
+        self.target_language = target_language
+        self.model = model
+        self.mode = mode
+        self.progress_callback = progress_callback
+        self.stop_words_list = stop_words_list
+        self.custom_translations = custom_translations
+        self.glossary_fp = glossary_fp
+        self.checkpoint = checkpoint
+        self.session = session
+        self.timer = timer if timer is not None else PhaseTimer()
+
+        self._page_queue = queue.Queue(maxsize=UNO_PIPELINE_QUEUE_PAGES)
+        self._write_queue = queue.Queue(maxsize=UNO_PIPELINE_QUEUE_PAGES)
+        self._abort = threading.Event()
+        self._errors = []
+        self._lock = threading.Lock()
+        # 进度的计算与回调在同一把锁内完成，多个翻译线程上报时回调收到的页数才单调递增
+        self._progress_lock = threading.Lock()
+
+        self._total_pages = 0
+        self._chunks = []
+        self._page_chunk = {}
+        self._representatives = {}
+        self._translation_results = {}
+        self._chunk_progress = {}
+        self._reported_progress = -1
+        self._write_success = False
+        self._translate_workers, self._chunk_concurrency = _translate_concurrency()
+
+    # ----- 队列与中止 -----
+
+    def _fail(self, stage, error):
+        with self._lock:
+            self._errors.append((stage, error))
+        if not self._abort.is_set():
+            logger.error(f"流水线{stage}阶段失败，中止其余阶段: {error}", exc_info=error)
+        self._abort.set()
+
+    def _put(self, q, item):
+        """放入有界队列，队列满时等待；流水线中止时返回False"""
+        while not self._abort.is_set():
+            try:
+                q.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        """从队列取出一项；流水线中止时抛出 PipelineAborted"""
+        while True:
+            if self._abort.is_set():
+                raise PipelineAborted()
+            try:
+                return q.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+
+    def _wait(self, event):
+        while not event.wait(_POLL_INTERVAL):
+            if self._abort.is_set():
+                raise PipelineAborted()
+
+    # ----- 读取阶段 -----
+
+    def _on_open(self, page_indices):
+        self._total_pages = len(page_indices)
+        logger.info(f"流水线: 共 {self._total_pages} 页，每批 {UNO_PIPELINE_CHUNK_PAGES} 页，"
+                    f"翻译并发 {self._translate_workers} 批 × 每批 {self._chunk_concurrency} 个请求，队列上限 {UNO_PIPELINE_QUEUE_PAGES} 页")
+        if self.progress_callback:
+            self._reported_progress = 0
+            self.progress_callback(0, self._total_pages)
+
+    def _read_pages(self):
+        if self.session is not None:
+            pages = self.session.iter_pages(self.page_indices, on_open=self._on_open)
+        else:
+            pages = iter_ppt_pages_direct(self.odp_path, self.page_indices, on_open=self._on_open)
+        try:
+            for page_data in pages:
+                if not self._put(self._page_queue, page_data):
+                    return
+        except Exception as e:
+            self._fail("读取", e)
+        finally:
+            pages.close()
+            self._put(self._page_queue, _END)
+
+    # ----- 写入阶段 -----
+
+    def _pages_to_write(self):
+        while True:
+            page_data = self._get(self._write_queue)
+            if page_data is _END:
+                return
+            yield page_data
+
+    def _write_pages(self, working_copy_path):
+        try:
+            if self.session is not None:
+                self._write_success = self.session.write_pages(self._pages_to_write(), self.mode)
+            else:
+                self._write_success = write_ppt_pages_direct(working_copy_path, self.output_odp_path,
+                                                             self._pages_to_write(), self.mode)
+            if not self._write_success and not self._abort.is_set():
+                self._fail("写入", RuntimeError("写入翻译内容失败"))
+        except Exception as e:
+            self._fail("写入", e)
+
+    # ----- 翻译阶段 -----
+
+    def _report_progress(self, chunk, completed, total):
+        """把批次内的进度 (completed, total) 换算为整个任务的页数进度"""
+        if not self.progress_callback:
+            return
+        with self._progress_lock:
+            self._chunk_progress[chunk.chunk_id] = completed / total if total else 1.0
+            overall = int(sum(progress * len(self._chunks[chunk_id].pages)
+                              for chunk_id, progress in self._chunk_progress.items()))
+            if overall <= self._reported_progress:
+                return
+            self._reported_progress = overall
+            self.progress_callback(overall, self._total_pages)
+
+    def _prepare_chunk(self, chunk):
+        """提取批次内的文本并去重（在调度线程中按页面顺序执行，代表段落表跨批次共用）"""
+        chunk.text_boxes_data, _ = extract_texts_for_translation({'pages': chunk.pages})
+        chunk.unique_text_boxes_data, chunk.dedup_info = deduplicate_text_boxes_data(
+            chunk.text_boxes_data, representatives=self._representatives)
+        for representative_key in chunk.dedup_info['duplicates'].values():
+            representative_chunk = self._page_chunk[int(representative_key.split('_')[0])]
+            if representative_chunk != chunk.chunk_id:
+                chunk.depends_on.add(representative_chunk)
+
+    def _translate_chunk(self, chunk):
+        from api_translate_uno import translate_pages_by_page
+
+        try:
+            results = {}
+            if chunk.unique_text_boxes_data:
+                with self.timer.phase("translate"):
+                    results = translate_pages_by_page(
+                        chunk.unique_text_boxes_data,
+                        lambda completed, total: self._report_progress(chunk, completed, total),
+                        self.source_language, self.target_language, self.model,
+                        max_concurrency=self._chunk_concurrency, glossary_fp=self.glossary_fp, stop_words_list=self.stop_words_list,
+                        custom_translations=self.custom_translations, checkpoint=self.checkpoint)
+            with self._lock:
+                self._translation_results.update(results)
+            chunk.done.set()
+            self._report_progress(chunk, 1, 1)
+
+            # 重复段落的译文来自之前的批次，等这些批次翻译完成后再映射
+            for chunk_id in sorted(chunk.depends_on):
+                self._wait(self._chunks[chunk_id].done)
+            with self._lock:
+                translation_results = dict(self._translation_results)
+
+            try:
+                translated = map_translation_results_back({'pages': chunk.pages}, translation_results,
+                                                          chunk.text_boxes_data, chunk.dedup_info)
+                translated_pages = translated.get('pages', [])
+            except Exception as e:
+                logger.error(f"映射第 {chunk.chunk_id + 1} 批翻译结果失败，使用原始页面数据: {e}", exc_info=True)
+                translated_pages = chunk.pages
+
+            for page_data in translated_pages:
+                if not self._put(self._write_queue, page_data):
+                    return
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            self._fail("翻译", e)
+
+    def _dispatch(self, executor):
+        """从页面队列取页面，凑满一批后提交翻译；在途批次数达到上限时等待"""
+        slots = threading.BoundedSemaphore(self._translate_workers)
+        futures = []
+        pending_pages = []
+        finished = False
+
+        while not finished:
+            page_data = self._get(self._page_queue)
+            if page_data is _END:
+                finished = True
+            else:
+                pending_pages.append(page_data)
+            if not pending_pages or (not finished and len(pending_pages) < UNO_PIPELINE_CHUNK_PAGES):
+                continue
+
+            chunk = _Chunk(len(self._chunks), pending_pages)
+            pending_pages = []
+            self._chunks.append(chunk)
+            for page in chunk.pages:
+                self._page_chunk[page['page_index']] = chunk.chunk_id
+            self._prepare_chunk(chunk)
+
+            while not slots.acquire(timeout=_POLL_INTERVAL):
+                if self._abort.is_set():
+                    raise PipelineAborted()
+            logger.info(f"流水线: 提交第 {chunk.chunk_id + 1} 批翻译，页面 "
+                        f"{[page['page_index'] + 1 for page in chunk.pages]}，"
+                        f"唯一段落 {len(chunk.unique_text_boxes_data)} 个")
+            future = executor.submit(contextvars.copy_context().run, self._translate_chunk, chunk)
+            future.add_done_callback(lambda _: slots.release())
+            futures.append(future)
+
+        for future in futures:
+            future.result()
+        if not self._abort.is_set():
+            self._put(self._write_queue, _END)
+
+    # ----- 汇总 -----
+
+    def _merged_dedup_info(self):
+        duplicates = {}
+        total = unique = 0
+        for chunk in self._chunks:
+            duplicates.update(chunk.dedup_info['duplicates'])
+            total += chunk.dedup_info['total_paragraphs']
+            unique += chunk.dedup_info['unique_paragraphs']
+        return {
+            'duplicates': duplicates,
+            'total_paragraphs': total,
+            'unique_paragraphs': unique,
+            'duplicate_paragraphs': len(duplicates),
+            'dedup_ratio': len(duplicates) / total * 100 if total else 0.0
+        }
+
+    def run(self):
+        """
+        运行流水线
+
+        Returns:
+            dict: {'ppt_data', 'translation_results', 'text_boxes_data', 'dedup_info'}，任一阶段失败时返回None
+        """
+        start_time = datetime.now()
+        working_copy_path = None
+        if self.session is None:
+            # 写入线程打开工作文件的副本，避免与读取线程同时打开同一个文件
+            root, ext = os.path.splitext(self.odp_path)
+            working_copy_path = f"{root}_pipeline_write{ext}"
+            shutil.copyfile(self.odp_path, working_copy_path)
+
+        reader = threading.Thread(target=contextvars.copy_context().run, args=(self._read_pages,),
+                                  name="uno_pipeline_reader", daemon=True)
+        writer = threading.Thread(target=contextvars.copy_context().run, args=(self._write_pages, working_copy_path),
+                                  name="uno_pipeline_writer", daemon=True)
+        executor = ThreadPoolExecutor(max_workers=self._translate_workers,
+                                      thread_name_prefix="uno_pipeline_translate")
+        try:
+            reader.start()
+            writer.start()
+            try:
+                self._dispatch(executor)
+            except PipelineAborted:
+                pass
+            except BaseException as e:
+                self._fail("调度", e)
+                if not isinstance(e, Exception):
+                    raise
+            finally:
+                executor.shutdown(wait=True)
+            reader.join()
+            writer.join()
+        finally:
+            if working_copy_path is not None:
+                try:
+                    os.remove(working_copy_path)
+                except OSError as e:
+                    logger.warning(f"删除流水线写入副本失败: {e}")
+
+        if self._errors or not self._write_success:
+            logger.error(f"流水线失败: {[stage for stage, _ in self._errors] or '写入'}")
+            return None
+
+        from api_translate_uno import validate_translation_result
+        pages = sorted((page for chunk in self._chunks for page in chunk.pages), key=lambda page: page['page_index'])
+        text_boxes_data = [box_para for chunk in self._chunks for box_para in chunk.text_boxes_data]
+        unique_text_boxes_data = [box_para for chunk in self._chunks for box_para in chunk.unique_text_boxes_data]
+        dedup_info = self._merged_dedup_info()
+
+        validation_stats = validate_translation_result(self._translation_results, unique_text_boxes_data)
+        logger.info(f"流水线完成: {len(self._chunks)} 批，{len(pages)} 页，"
+                    f"翻译覆盖率 {validation_stats['translation_coverage']:.2f}%，"
+                    f"去重率 {dedup_info['dedup_ratio']:.2f}%")
+        log_execution_time(logger, "translation_pipeline", start_time)
+
+        return {
+            'ppt_data': {
+                'presentation_path': self.odp_path,
+                'statistics': calculate_statistics(pages),
+                'pages': pages
+            },
+            'translation_results': dict(sorted(self._translation_results.items())),
+            'text_boxes_data': text_boxes_data,
+            'dedup_info': dedup_info
+        }
+
+
+def run_translation_pipeline(odp_path, output_odp_path, page_indices, source_language, target_language, model,
+                             mode='paragraph_up', progress_callback=None, stop_words_list=None,
+                             custom_translations=None, glossary_fp="", checkpoint=None, session=None, timer=None):
+    """
+    以流水线方式读取、翻译并写入ODP或会话文档（参数含义同 TranslationPipeline）
+
+    Returns:
+        dict: 见 TranslationPipeline.run，失败时返回None
+    """
+    return TranslationPipeline(odp_path, output_odp_path, page_indices, source_language, target_language, model,
+                               mode=mode, progress_callback=progress_callback, stop_words_list=stop_words_list,
+                               custom_translations=custom_translations, glossary_fp=glossary_fp,
+                               checkpoint=checkpoint, session=session, timer=timer).run()
@@ -0,0 +1,181 @@
+'''
+verify_bulk_write.py
+校验整段写入（write_paragraphs_bulk）与逐片段写入（write_paragraphs_mode）的输出一致，并统计每个文本框的写入耗时
+
+同一文件打开两份，每个文本框分别用两种方式写入同样的译文，逐段落、逐portion比较文字和字符属性。
+--record 把逐片段写入的结果保存为golden文件，之后用 --golden 校验整段写入（例如升级LibreOffice后复查）。
+整段写入默认关闭，样例文稿全部校验一致后再设置 UNO_BULK_WRITE=true 开启。
+
+用法（需要先启动soffice监听服务，端口2002）:
+    python verify_bulk_write.py 文件.pptx [--modes paragraph_up,replace] [--pages 1,2]
+    python verify_bulk_write.py 文件.pptx --record golden.json      # 保存逐片段写入结果
+    python verify_bulk_write.py 文件.pptx --golden golden.json      # 整段写入结果与golden文件比较
+    python verify_bulk_write.py --synthetic [--boxes 6] [--chars 2000]
+    python verify_bulk_write.py 文件.pptx --translations translated.json  # 使用真实译文（save_translated_ppt_data输出）
+'''
+import uno  # type: ignore
+import sys, os
+sys.path.insert(0, os.path.dirname(__file__))
+import json
+import time
+import logging
+import argparse
+from read_ppt_page_uno import connect_to_libreoffice, read_slide_from_presentation
+from write_ppt_page_uno import write_paragraphs_mode, write_paragraphs_bulk, BULK_WRITE_MODES
+from benchmark_extraction import create_synthetic_presentation, _property
+
+# 比较的字符属性：写入时设置的属性以及应当从原文继承的常用属性
+_COMPARED_PROPERTIES = ("CharColor", "CharEscapement", "CharHeight", "CharUnderline", "CharWeight",
+                        "CharPosture", "CharFontName")
+
+
+def open_presentation(context, ppt_path):
+    """打开文件（不设只读，两份副本都要写入，校验结束后不保存直接关闭）"""
+    desktop = context.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", context)
+    file_url = uno.systemPathToFileUrl(os.path.abspath(ppt_path))
+    return desktop.loadComponentFromURL(file_url, "_blank", 0, (_property("Hidden", True),))
+
+
+def fake_translate(content):
+    """没有提供译文时使用的确定性“译文”，长度与原文不同以覆盖区间偏移"""
+    return f"«{content.swapcase()}»" if content.strip() else content
+
+
+def load_translations(path):
+    """读取翻译后的PPT数据，返回 {(页面索引, 文本框索引): 文本框数据}"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {(page["page_index"], box["box_index"]): box
+            for page in data.get("pages", []) for box in page.get("text_boxes", [])}
+
+
+def with_translation(box, translations, page_index):
+    translated = translations.get((page_index, box["box_index"])) if translations else None
+    if translated is not None:
+        return translated
+    for paragraph in box["paragraphs"]:
+        for fragment in paragraph["text_fragments"]:
+            fragment["translated_text"] = fake_translate(fragment["text"])
+    return box
+
+
+def dump_text(text):
+    """按段落、portion导出文本及字符属性，作为比较单位"""
+    dump = []
+    paragraphs = text.createEnumeration()
+    while paragraphs.hasMoreElements():
+        portions = paragraphs.nextElement().createEnumeration()
+        paragraph = []
+        while portions.hasMoreElements():
+            portion = portions.nextElement()
+            values = portion.getPropertyValues(_COMPARED_PROPERTIES)
+            paragraph.append([portion.getString()] + [round(v, 2) if isinstance(v, float) else v for v in values])
+        dump.append(paragraph)
+    return dump
+
+
+def write_box(shape, box, mode, bulk):
+    text = shape.getText()
+    cursor = text.createTextCursor()
+    logger = logging.getLogger("verify_bulk_write")
+    start = time.perf_counter()
+    if bulk:
+        write_paragraphs_bulk(text, cursor, box, mode, logger)
+    else:
+        write_paragraphs_mode(text, cursor, box, mode, logger)
+    return time.perf_counter() - start, dump_text(text)
+
+
+def verify_mode(context, open_copy, mode, page_indices, translations, golden, record):
+    legacy_presentation = open_copy()
+    bulk_presentation = open_copy()
+    mismatches = 0
+    total_legacy = total_bulk = 0.0
+    try:
+        legacy_slides = legacy_presentation.getDrawPages()
+        bulk_slides = bulk_presentation.getDrawPages()
+        indices = page_indices if page_indices is not None else range(legacy_slides.getCount())
+
+        print(f"\n模式 {mode}")
+        print(f"{'页':<4} {'文本框':<6} {'字符数':<8} {'逐片段(ms)':<12} {'整段(ms)':<12} {'加速比':<8} {'结果'}")
+        for page_index in indices:
+            page_data = read_slide_from_presentation(context, legacy_slides, page_index)
+            for box in page_data["text_boxes"]:
+                shape_index = box["shape_locator"]["shape_index"]
+                key = f"{page_index}_{box['box_index']}"
+                box = with_translation(box, translations, page_index)
+
+                legacy_time, legacy_dump = write_box(legacy_slides.getByIndex(page_index).getByIndex(shape_index),
+                                                     box, mode, bulk=False)
+                bulk_time, bulk_dump = write_box(bulk_slides.getByIndex(page_index).getByIndex(shape_index),
+                                                 box, mode, bulk=True)
+                total_legacy += legacy_time
+                total_bulk += bulk_time
+
+                if record is not None:
+                    record.setdefault(mode, {})[key] = legacy_dump
+                expected = golden.get(mode, {}).get(key) if golden is not None else legacy_dump
+                # JSON往返后元组变为列表，统一比较
+                matched = json.loads(json.dumps(bulk_dump)) == json.loads(json.dumps(expected))
+                mismatches += 0 if matched else 1
+
+                chars = sum(len(portion[0]) for paragraph in bulk_dump for portion in paragraph)
+                speedup = legacy_time / bulk_time if bulk_time else 0.0
+                print(f"{page_index + 1:<4} {box['box_index']:<6} {chars:<8} {legacy_time * 1000:<12.1f} "
+                      f"{bulk_time * 1000:<12.1f} {speedup:<8.1f} {'一致' if matched else '不一致'}")
+    finally:
+        legacy_presentation.close(True)
+        bulk_presentation.close(True)
+
+    speedup = total_legacy / total_bulk if total_bulk else 0.0
+    print(f"合计: 逐片段 {total_legacy:.3f}s，整段 {total_bulk:.3f}s，加速 {speedup:.1f} 倍，不一致 {mismatches} 个文本框")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="校验整段写入与逐片段写入的结果一致并比较耗时")
+    parser.add_argument("ppt_path", nargs="?", help="PPTX/ODP文件路径")
+    parser.add_argument("--modes", default="paragraph_up,paragraph_down",
+                        help=f"要校验的写入模式（逗号分隔），可选 {','.join(BULK_WRITE_MODES)}")
+    parser.add_argument("--pages", help="要校验的页码（1-based，逗号分隔），默认全部")
+    parser.add_argument("--translations", help="翻译后的PPT数据JSON，默认使用生成的译文")
+    parser.add_argument("--record", help="把逐片段写入的结果保存为golden文件")
+    parser.add_argument("--golden", help="与golden文件比较，而不是与本次逐片段写入的结果比较")
+    parser.add_argument("--synthetic", action="store_true", help="生成文字密集的测试页代替输入文件")
+    parser.add_argument("--boxes", type=int, default=6, help="测试页文本框数（--synthetic）")
+    parser.add_argument("--chars", type=int, default=2000, help="每个文本框的字符数（--synthetic）")
+    args = parser.parse_args()
+
+    if not args.ppt_path and not args.synthetic:
+        parser.error("需要指定PPT文件路径或 --synthetic")
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = [mode for mode in modes if mode not in BULK_WRITE_MODES]
+    if unknown:
+        parser.error(f"整段写入不支持的模式: {unknown}")
+
+    context = connect_to_libreoffice()
+    if args.synthetic:
+        open_copy = lambda: create_synthetic_presentation(context, args.boxes, args.chars)
+    else:
+        open_copy = lambda: open_presentation(context, args.ppt_path)
+    page_indices = [int(page) - 1 for page in args.pages.split(",")] if args.pages else None
+    translations = load_translations(args.translations) if args.translations else None
+    golden = None
+    if args.golden:
+        with open(args.golden, encoding="utf-8") as f:
+            golden = json.load(f)
+    record = {} if args.record else None
+
+    mismatches = sum(verify_mode(context, open_copy, mode, page_indices, translations, golden, record)
+                     for mode in modes)
+
+    if record is not None:
+        with open(args.record, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False)
+        print(f"\n已保存golden文件: {args.record}")
+    print("\n全部一致" if not mismatches else f"\n共 {mismatches} 个文本框不一致")
+    sys.exit(0 if not mismatches else 1)
+
+
+if __name__ == "__main__":
+    main()
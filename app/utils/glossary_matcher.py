@@ -0,0 +1,220 @@
+"""
+术语表匹配引擎
+将用户的停翻词和自定义翻译编译成 Aho–Corasick 自动机，一次扫描找出文本中实际出现的术语，
+提示词中只注入这些术语，而不是把整个术语表都塞进去。
+编译结果按术语表指纹缓存，术语表变化时自动重建。
+"""
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .translation_memory import glossary_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# 缓存的已编译术语表数量
+_MATCHER_CACHE_SIZE = 64
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isascii() and (ch.isalnum() or ch == '_')
+
+
+class AhoCorasick:
+    """
+    多模式串匹配自动机（纯Python实现）
+
+    构建 O(术语总长度)，匹配 O(文本长度 + 命中数)，与术语数量无关。
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        # 每个状态: 转移表、失败指针、以该状态结尾的模式串编号
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+        self.patterns: List[str] = []
+
+        for pattern in patterns:
+            if not pattern:
+                continue
+            state = 0
+            for ch in pattern:
+                next_state = self._goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                    self._goto[state][ch] = next_state
+                state = next_state
+            self._output[state].append(len(self.patterns))
+            self.patterns.append(pattern)
+
+        self._build_fail_links()
+
+    def _build_fail_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(ch, 0)
+                # 合并失败状态的输出，匹配时不需要再沿失败链回溯
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def iter_matches(self, text: str):
+        """
+        逐个返回命中
+
+        Yields:
+            (结束位置(不含), 模式串编号)
+        """
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for position, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for pattern_index in output[state]:
+                yield position + 1, pattern_index
+
+
+class GlossaryHits(NamedTuple):
+    """文本中出现的术语"""
+    stop_words: List[str]
+    custom_translations: Dict[str, str]
+
+    def __bool__(self) -> bool:
+        return bool(self.stop_words or self.custom_translations)
+
+
+class GlossaryMatcher:
+    """
+    编译后的用户术语表
+
+    匹配不区分大小写；首尾是英文字母/数字的术语要求词边界，避免 "AI" 命中 "MAIN"。
+    """
+
+    def __init__(self, stop_words: Optional[Iterable[str]] = None,
+                 custom_translations: Optional[Dict[str, str]] = None):
+        self.stop_words = [w for w in dict.fromkeys(w.strip() for w in (stop_words or [])) if w]
+        self.custom_translations = {k.strip(): v for k, v in (custom_translations or {}).items() if k and k.strip()}
+        self.fingerprint = glossary_fingerprint(self.stop_words, self.custom_translations)
+
+        # 模式串(小写) -> [(类型, 原术语)]，同一个词可能既是停翻词又是自定义翻译
+        self._entries: Dict[str, List[Tuple[str, str]]] = {}
+        for word in self.stop_words:
+            self._entries.setdefault(word.lower(), []).append(('stop', word))
+        for source in self.custom_translations:
+            self._entries.setdefault(source.lower(), []).append(('custom', source))
+        self._automaton = AhoCorasick(self._entries.keys())
+
+    def __len__(self) -> int:
+        return len(self.stop_words) + len(self.custom_translations)
+
+    def lookup_exact(self, text: str) -> Optional[str]:
+        """
+        整段文本恰好是一个术语时返回其译文（停翻词返回原文），否则返回None
+        """
+        term_text = text.strip() if text else ''
+        entries = self._entries.get(term_text.lower())
+        if not entries:
+            return None
+        if any(kind == 'stop' for kind, _ in entries):
+            return term_text
+        return self.custom_translations[entries[0][1]]
+
+    def find(self, text: str) -> GlossaryHits:
+        """
+        找出文本中出现的术语
+
+        Returns:
+            GlossaryHits: 出现的停翻词（保持术语表顺序）和自定义翻译
+        """
+        if not text or not self._entries:
+            return GlossaryHits([], {})
+
+        lowered = text.lower()
+        found = set()
+        patterns = self._automaton.patterns
+        for end, pattern_index in self._automaton.iter_matches(lowered):
+            if pattern_index in found:
+                continue
+            pattern = patterns[pattern_index]
+            start = end - len(pattern)
+            if _is_word_char(pattern[0]) and start > 0 and _is_word_char(lowered[start - 1]):
+                continue
+            if _is_word_char(pattern[-1]) and end < len(lowered) and _is_word_char(lowered[end]):
+                continue
+            found.add(pattern_index)
+
+        stop_hits = set()
+        custom_hits = set()
+        for pattern_index in found:
+            for kind, term in self._entries[patterns[pattern_index]]:
+                (stop_hits if kind == 'stop' else custom_hits).add(term)
+
+        return GlossaryHits(
+            [w for w in self.stop_words if w in stop_hits],
+            {k: v for k, v in self.custom_translations.items() if k in custom_hits}
+        )
+
+
+class _MatcherCache:
+    """按术语表指纹缓存编译好的匹配器（LRU，线程安全）"""
+
+    def __init__(self, max_size: int):
+        self._lock = threading.Lock()
+        self._matchers: 'OrderedDict[str, GlossaryMatcher]' = OrderedDict()
+        self._max_size = max_size
+
+    def get(self, stop_words: Optional[Iterable[str]], custom_translations: Optional[Dict[str, str]]) -> GlossaryMatcher:
+        stop_words = list(stop_words or [])
+        custom_translations = dict(custom_translations or {})
+        fingerprint = glossary_fingerprint(stop_words, custom_translations)
+        with self._lock:
+            matcher = self._matchers.get(fingerprint)
+            if matcher is not None:
+                self._matchers.move_to_end(fingerprint)
+                return matcher
+
+        # 编译在锁外进行，大术语表也不会阻塞其他任务
+        matcher = GlossaryMatcher(stop_words, custom_translations)
+        logger.info(f"术语表已编译: 停翻词 {len(matcher.stop_words)} 个，自定义翻译 {len(matcher.custom_translations)} 个")
+        with self._lock:
+            self._matchers[fingerprint] = matcher
+            self._matchers.move_to_end(fingerprint)
+            while len(self._matchers) > self._max_size:
+                self._matchers.popitem(last=False)
+        return matcher
+
+
+_matcher_cache = _MatcherCache(_MATCHER_CACHE_SIZE)
+
+
+def get_glossary_matcher(stop_words: Optional[Iterable[str]] = None,
+                         custom_translations: Optional[Dict[str, str]] = None) -> GlossaryMatcher:
+    """获取术语表对应的匹配器，术语表未变化时复用已编译的结果"""
+    return _matcher_cache.get(stop_words, custom_translations)
+
+
+def load_user_glossary(user_id: int) -> Tuple[List[str], Dict[str, str]]:
+    """
+    从数据库加载用户的停翻词和自定义翻译（需要在应用上下文中调用）
+
+    Returns:
+        (停翻词列表, {原文: 译文})
+    """
+    from ..models import StopWord, Translation
+
+    stop_words = [row.word for row in StopWord.query.filter_by(user_id=user_id).order_by(StopWord.id).all()]
+    custom_translations = {
+        row.english: row.chinese
+        for row in Translation.query.filter_by(user_id=user_id).order_by(Translation.id).all()
+    }
+    logger.info(f"已加载用户 {user_id} 的术语表: 停翻词 {len(stop_words)} 个，自定义翻译 {len(custom_translations)} 个")
+    return stop_words, custom_translations
@@ -0,0 +1,234 @@
+"""
+本地JSON修复工具
+大模型输出的JSON经常带有代码块标记、尾逗号、全角标点、未转义的引号或被截断，
+这里按代价从低到高依次尝试本地修复策略，只有全部失败时才需要再调用大模型修复。
+各策略的成功次数会被统计，便于观察输出质量。
+"""
+import re
+import ast
+import json
+import logging
+import threading
+from typing import Any, Dict, Tuple
+
+from .llm_streaming import JsonObjectStreamParser
+
+logger = logging.getLogger(__name__)
+
+_CODE_FENCE_RE = re.compile(r'```(?:json|JSON|python)?\s*(.*?)\s*```', re.DOTALL)
+
+# 结构位置上的全角标点 -> 半角
+_FULLWIDTH_STRUCTURAL = {
+    '，': ',', '：': ':', '｛': '{', '｝': '}', '［': '[', '］': ']',
+}
+_FULLWIDTH_QUOTES = {'“', '”', '＂'}
+# JSON主体的起始符 -> 可能的结束符
+_OPENERS = {'[': (']', '］'), '［': (']', '］'), '{': ('}', '｝'), '｛': ('}', '｝')}
+
+# 修复策略（按尝试顺序）
+REPAIR_STRATEGIES = (
+    'direct',          # 原文即合法JSON
+    'extract',         # 去除代码块标记/前后说明文字
+    'literal_eval',    # Python字面量（单引号、True/None等）
+    'normalize',       # 全角标点、尾逗号、未转义引号
+    'truncated',       # 输出被截断，保留已完整的对象
+    'salvaged',        # 个别对象损坏，保留其余完整对象
+    'llm',             # 本地修复失败后由大模型修复
+    'failed',          # 全部失败
+)
+
+
+class JsonRepairError(ValueError):
+    """本地修复策略全部失败"""
+    pass
+
+
+class JsonRepairStats:
+    """按策略统计修复结果（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {strategy: 0 for strategy in REPAIR_STRATEGIES}
+
+    def record(self, strategy: str) -> None:
+        with self._lock:
+            self._counts[strategy] = self._counts.get(strategy, 0) + 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counts)
+        total = sum(stats.values())
+        stats['total'] = total
+        # 需要修复（非直接解析成功）的比例
+        stats['repair_rate'] = (total - stats['direct']) / total * 100 if total else 0.0
+        return stats
+
+
+# 全局修复统计
+json_repair_stats = JsonRepairStats()
+
+
+def _extract_json_body(text: str) -> str:
+    """去除代码块标记，截取第一个 [ 或 { 开始、到对应最后一个 ] 或 } 结束的主体"""
+    fence = _CODE_FENCE_RE.search(text)
+    if fence:
+        text = fence.group(1)
+    else:
+        # 只有开头的代码块标记（输出被截断时没有结尾标记）
+        text = re.sub(r'^\s*```(?:json|JSON|python)?', '', text)
+
+    starts = [pos for pos in (text.find(opener) for opener in _OPENERS) if pos != -1]
+    if not starts:
+        return text.strip()
+    start = min(starts)
+    end = max(text.rfind(closer) for closer in _OPENERS[text[start]])
+    return text[start:end + 1] if end > start else text[start:]
+
+
+def _is_json_like(value: Any) -> bool:
+    """literal_eval 的结果是否只包含JSON支持的类型（排除集合、元组等）"""
+    if isinstance(value, dict):
+        return all(isinstance(k, str) and _is_json_like(v) for k, v in value.items())
+    if isinstance(value, list):
+        return all(_is_json_like(v) for v in value)
+    return value is None or isinstance(value, (str, int, float, bool))
+
+
+def _next_significant(text: str, pos: int) -> str:
+    """返回pos之后第一个非空白字符"""
+    while pos < len(text) and text[pos].isspace():
+        pos += 1
+    return text[pos] if pos < len(text) else ''
+
+
+def _normalize(text: str) -> str:
+    """
+    结构化修复：只处理字符串之外的全角标点和尾逗号，以及字符串内未转义的引号
+
+    字符串内的一个引号如果后面紧跟的不是 , : } ] 或文本结尾，就认为它是内容的一部分并转义。
+    """
+    out = []
+    in_string = False
+    escape = False
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+                out.append(ch)
+            elif ch == '\\':
+                escape = True
+                out.append(ch)
+            elif ch == '"' or ch in _FULLWIDTH_QUOTES:
+                following = _next_significant(text, i + 1)
+                if following in (',', ':', '}', ']', '，', '：', '｝', '］', ''):
+                    in_string = False
+                    out.append('"')
+                elif ch == '"':
+                    out.append('\\"')
+                else:
+                    # 内容中的全角引号保持原样
+                    out.append(ch)
+            elif ch == '\n':
+                out.append('\\n')
+            else:
+                out.append(ch)
+        else:
+            if ch == '"' or ch in _FULLWIDTH_QUOTES:
+                in_string = True
+                out.append('"')
+            elif ch in _FULLWIDTH_STRUCTURAL:
+                out.append(_FULLWIDTH_STRUCTURAL[ch])
+            elif ch == ',' and _next_significant(text, i + 1) in ('}', ']', '｝', '］'):
+                # 尾逗号
+                pass
+            else:
+                out.append(ch)
+        i += 1
+    return ''.join(out)
+
+
+def _salvage_objects(text: str) -> Tuple[list, bool]:
+    """
+    逐个提取完整的顶层对象
+
+    Returns:
+        (对象列表, 是否被截断)
+    """
+    parser = JsonObjectStreamParser()
+    parser.feed(text)
+    return parser.objects, parser.is_incomplete
+
+
+def repair_json_with_strategy(text: str) -> Tuple[Any, str]:
+    """
+    依次尝试本地修复策略解析大模型输出的JSON，同时返回成功的策略（不计入统计）
+
+    Args:
+        text: 大模型的原始输出
+
+    Returns:
+        (解析结果, 策略名)；策略为 truncated/salvaged 时结果只包含完整的对象
+
+    Raises:
+        JsonRepairError: 所有本地策略都失败
+    """
+    if text is None or not str(text).strip():
+        raise JsonRepairError("待解析文本为空")
+    text = str(text).strip()
+
+    try:
+        return json.loads(text, strict=False), 'direct'
+    except ValueError:
+        pass
+
+    body = _extract_json_body(text)
+    try:
+        result = json.loads(body, strict=False)
+        logger.info("去除代码块/说明文字后解析JSON成功")
+        return result, 'extract'
+    except ValueError:
+        pass
+
+    try:
+        result = ast.literal_eval(body)
+        if isinstance(result, (list, dict)) and _is_json_like(result):
+            logger.info("使用 ast.literal_eval 解析成功")
+            return result, 'literal_eval'
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        pass
+
+    normalized = _normalize(body)
+    try:
+        result = json.loads(normalized, strict=False)
+        logger.info("修复全角标点/尾逗号/未转义引号后解析JSON成功")
+        return result, 'normalize'
+    except ValueError as e:
+        last_error = e
+
+    objects, truncated = _salvage_objects(normalized)
+    if objects:
+        strategy = 'truncated' if truncated else 'salvaged'
+        logger.warning(f"JSON不完整（{'输出被截断' if truncated else '存在损坏的对象'}），保留 {len(objects)} 个完整对象")
+        return objects, strategy
+
+    raise JsonRepairError(f"本地修复JSON失败: {last_error}")
+
+
+def repair_json(text: str) -> Any:
+    """
+    依次尝试本地修复策略解析大模型输出的JSON，并按成功的策略计数
+
+    Args:
+        text: 大模型的原始输出
+
+    Returns:
+        解析结果
+
+    Raises:
+        JsonRepairError: 所有本地策略都失败
+    """
+    result, strategy = repair_json_with_strategy(text)
+    json_repair_stats.record(strategy)
+    return result
@@ -0,0 +1,292 @@
+"""
+大模型HTTP网关
+所有大模型调用共用同一个 httpx 连接池（keep-alive，安装了 h2 时启用 HTTP/2），避免每次调用重新建立TCP+TLS连接；
+统一超时与重试策略，并按端点统计连接复用率和延迟。
+"""
+import os
+import time
+import random
+import logging
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional, Tuple, Union
+
+import httpx
+from openai import OpenAI
+
+from .llm_usage import llm_usage
+from .llm_rate_limiter import report_http_status
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    _H2_AVAILABLE = True
+except ImportError:
+    _H2_AVAILABLE = False
+
+# 连接池配置
+LLM_GATEWAY_HTTP2 = os.getenv('LLM_GATEWAY_HTTP2', 'true').lower() in ('true', '1', 'yes', 'on')
+LLM_GATEWAY_MAX_CONNECTIONS = int(os.getenv('LLM_GATEWAY_MAX_CONNECTIONS', '100'))
+LLM_GATEWAY_MAX_KEEPALIVE = int(os.getenv('LLM_GATEWAY_MAX_KEEPALIVE', '40'))
+LLM_GATEWAY_KEEPALIVE_EXPIRY = float(os.getenv('LLM_GATEWAY_KEEPALIVE_EXPIRY', '90'))
+
+# 默认超时（秒）
+LLM_GATEWAY_CONNECT_TIMEOUT = float(os.getenv('LLM_GATEWAY_CONNECT_TIMEOUT', '10'))
+LLM_GATEWAY_READ_TIMEOUT = float(os.getenv('LLM_GATEWAY_READ_TIMEOUT', '120'))
+
+# 重试配置（仅对 post 生效；OpenAI 客户端使用 SDK 自带的重试）
+LLM_GATEWAY_MAX_RETRIES = int(os.getenv('LLM_GATEWAY_MAX_RETRIES', '2'))
+LLM_GATEWAY_RETRY_BACKOFF = float(os.getenv('LLM_GATEWAY_RETRY_BACKOFF', '1.0'))
+_MAX_RETRY_DELAY = 30.0
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504, 521, 522, 524})
+
+# 每个端点保留的延迟样本数
+_LATENCY_SAMPLES = 500
+
+# httpcore 建立新连接时触发的 trace 事件
+_CONNECT_EVENTS = ('connection.connect_tcp.complete', 'connection.connect_unix_socket.complete')
+
+
+def default_timeout(read: Optional[float] = None) -> httpx.Timeout:
+    """网关默认超时，read 为读超时（秒）"""
+    return httpx.Timeout(
+        connect=LLM_GATEWAY_CONNECT_TIMEOUT,
+        read=read or LLM_GATEWAY_READ_TIMEOUT,
+        write=30.0,
+        pool=30.0
+    )
+
+
+def _to_timeout(timeout: Union[None, float, Tuple[float, float], httpx.Timeout]) -> httpx.Timeout:
+    """兼容 requests 风格的 (连接, 读取) 超时写法"""
+    if timeout is None:
+        return default_timeout()
+    if isinstance(timeout, httpx.Timeout):
+        return timeout
+    if isinstance(timeout, (tuple, list)):
+        connect, read = timeout
+        return httpx.Timeout(connect=connect, read=read, write=connect, pool=connect)
+    return default_timeout(read=float(timeout))
+
+
+def _endpoint_of(url: httpx.URL) -> str:
+    return f"{url.scheme}://{url.host}" + (f":{url.port}" if url.port else "")
+
+
+class EndpointStats:
+    """单个端点的请求、连接复用与延迟统计"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.new_connections = 0
+        self.status_counts: Dict[int, int] = {}
+        self.http_versions: Dict[str, int] = {}
+        self.latencies = deque(maxlen=_LATENCY_SAMPLES)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def to_dict(self) -> Dict[str, Any]:
+        reused = self.requests - self.new_connections
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'retries': self.retries,
+            'new_connections': self.new_connections,
+            'connection_reuse_rate': max(0, reused) / self.requests * 100 if self.requests else 0.0,
+            'status_counts': dict(self.status_counts),
+            'http_versions': dict(self.http_versions),
+            'latency_avg': sum(self.latencies) / len(self.latencies) if self.latencies else None,
+            'latency_p50': self.percentile(50),
+            'latency_p95': self.percentile(95),
+        }
+
+
+class _InstrumentedTransport(httpx.HTTPTransport):
+    """在连接池之下记录每次请求的延迟（到收到响应头为止）以及是否新建了连接"""
+
+    def __init__(self, gateway: 'LLMGateway', **kwargs):
+        super().__init__(**kwargs)
+        self._gateway = gateway
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint = _endpoint_of(request.url)
+        connected = []
+        upstream_trace = request.extensions.get('trace')
+
+        def trace(event_name, info):
+            if event_name in _CONNECT_EVENTS:
+                connected.append(event_name)
+            if upstream_trace is not None:
+                upstream_trace(event_name, info)
+
+        request.extensions['trace'] = trace
+        start = time.monotonic()
+        try:
+            response = super().handle_request(request)
+        except Exception:
+            self._gateway._record(endpoint, time.monotonic() - start, None, bool(connected), None)
+            llm_usage.note_http_attempt(time.monotonic() - start)
+            raise
+        self._gateway._record(endpoint, time.monotonic() - start, response.status_code, bool(connected),
+                              response.extensions.get('http_version', b'').decode('ascii', 'ignore') or None)
+        # 每次HTTP请求（含网关和SDK的重试）都计入当前调用，响应头到达时间作为首字节时间
+        llm_usage.note_http_attempt(time.monotonic() - start)
+        # 被重试掉的429/5xx也要让限流器看到，否则重试成功后AIMD只记录到成功
+        if response.status_code == 429 or 500 <= response.status_code < 600:
+            report_http_status(response.status_code, LLMGateway._retry_after(response))
+        return response
+
+
+class LLMGateway:
+    """
+    大模型调用的统一HTTP出口
+
+    - http_client: 所有调用共享的 httpx 连接池
+    - get_openai_client: 按 (api_key, base_url) 缓存、复用连接池的 OpenAI 客户端
+    - post: 带重试的 JSON POST，用于非 OpenAI 兼容的接口
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client: Optional[httpx.Client] = None
+        self._openai_clients: Dict[tuple, OpenAI] = {}
+        self._stats: Dict[str, EndpointStats] = {}
+
+    @property
+    def http_client(self) -> httpx.Client:
+        with self._lock:
+            if self._client is None:
+                http2 = LLM_GATEWAY_HTTP2 and _H2_AVAILABLE
+                limits = httpx.Limits(
+                    max_connections=LLM_GATEWAY_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_GATEWAY_MAX_KEEPALIVE,
+                    keepalive_expiry=LLM_GATEWAY_KEEPALIVE_EXPIRY
+                )
+                self._client = httpx.Client(
+                    transport=_InstrumentedTransport(self, http2=http2, limits=limits),
+                    timeout=default_timeout()
+                )
+                logger.info(f"大模型网关连接池已创建: HTTP/2 {'启用' if http2 else '未启用'}，"
+                            f"最大连接数 {LLM_GATEWAY_MAX_CONNECTIONS}，keep-alive {LLM_GATEWAY_MAX_KEEPALIVE}")
+            return self._client
+
+    def get_openai_client(self, api_key: str, base_url: str, timeout: Any = None,
+                          max_retries: Optional[int] = None) -> OpenAI:
+        """
+        获取共享连接池的 OpenAI 客户端（按参数缓存，线程安全）
+
+        Args:
+            api_key: API密钥
+            base_url: OpenAI 兼容接口地址
+            timeout: 默认超时，支持秒数、(连接, 读取) 或 httpx.Timeout
+            max_retries: SDK 重试次数，默认与网关一致
+        """
+        timeout = _to_timeout(timeout)
+        max_retries = LLM_GATEWAY_MAX_RETRIES if max_retries is None else max_retries
+        key = (api_key, base_url.rstrip('/'), repr(timeout), max_retries)
+        http_client = self.http_client
+        with self._lock:
+            client = self._openai_clients.get(key)
+            if client is None:
+                client = OpenAI(api_key=api_key, base_url=base_url, timeout=timeout,
+                                max_retries=max_retries, http_client=http_client)
+                self._openai_clients[key] = client
+            return client
+
+    def post(self, url: str, json: Any = None, headers: Optional[Dict[str, str]] = None, timeout: Any = None,
+             max_retries: Optional[int] = None) -> httpx.Response:
+        """
+        发送 JSON POST 请求，对连接错误和 429/5xx 按指数退避重试（优先遵循 Retry-After）
+
+        重试耗尽后返回最后一次响应（由调用方检查状态码），或抛出最后一次的连接异常。
+        """
+        timeout = _to_timeout(timeout)
+        max_retries = LLM_GATEWAY_MAX_RETRIES if max_retries is None else max_retries
+        client = self.http_client
+
+        attempt = 0
+        while True:
+            try:
+                response = client.post(url, json=json, headers=headers, timeout=timeout)
+            except httpx.TransportError as e:
+                if attempt >= max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"请求 {url} 失败（{type(e).__name__}: {str(e)}），{delay:.1f}秒后第{attempt + 1}次重试")
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= max_retries:
+                    return response
+                delay = self._retry_after(response)
+                if delay is None:
+                    delay = self._backoff(attempt)
+                logger.warning(f"请求 {url} 返回状态码 {response.status_code}，{delay:.1f}秒后第{attempt + 1}次重试")
+                response.close()
+
+            with self._lock:
+                self._stats.setdefault(_endpoint_of(httpx.URL(url)), EndpointStats()).retries += 1
+            time.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        return min(_MAX_RETRY_DELAY, LLM_GATEWAY_RETRY_BACKOFF * (2 ** attempt)) * random.uniform(0.8, 1.2)
+
+    @staticmethod
+    def _retry_after(response: httpx.Response) -> Optional[float]:
+        value = response.headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return min(_MAX_RETRY_DELAY, max(0.0, float(value)))
+        except ValueError:
+            pass
+        try:
+            return min(_MAX_RETRY_DELAY, max(0.0, parsedate_to_datetime(value).timestamp() - time.time()))
+        except (TypeError, ValueError):
+            return None
+
+    def _record(self, endpoint: str, latency: float, status_code: Optional[int], new_connection: bool,
+                http_version: Optional[str]) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, EndpointStats())
+            stats.requests += 1
+            stats.latencies.append(latency)
+            if new_connection:
+                stats.new_connections += 1
+            if status_code is None:
+                stats.errors += 1
+            else:
+                stats.status_counts[status_code] = stats.status_counts.get(status_code, 0) + 1
+            if http_version:
+                stats.http_versions[http_version] = stats.http_versions.get(http_version, 0) + 1
+
+    def latency_percentile(self, endpoint: str, p: float) -> Optional[float]:
+        """端点最近请求的延迟分位数（秒），样本不足时返回 None"""
+        with self._lock:
+            stats = self._stats.get(endpoint)
+            return stats.percentile(p) if stats else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各端点的连接复用与延迟统计"""
+        with self._lock:
+            return {endpoint: stats.to_dict() for endpoint, stats in self._stats.items()}
+
+    def close(self) -> None:
+        with self._lock:
+            client, self._client = self._client, None
+            self._openai_clients.clear()
+        if client is not None:
+            client.close()
+
+
+# 全局网关
+llm_gateway = LLMGateway()
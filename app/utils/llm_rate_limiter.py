@@ -0,0 +1,412 @@
+"""
+大模型调用限流器（进程级，按服务商划分）
+- 请求数与估算token数两个令牌桶，平滑突发流量
+- AIMD并发控制：成功时加性增加并发上限，遇到429/5xx或延迟过高时乘性减小
+  （网关逐次上报HTTP响应，SDK或网关内部重试成功的调用同样会触发退避）
+- 优先级通道：交互式调用（页面上的即时请求）优先于批量文档翻译获得执行机会
+"""
+import os
+import re
+import time
+import heapq
+import logging
+import itertools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from .llm_usage import llm_usage
+
+logger = logging.getLogger(__name__)
+
+# 优先级：数值越小越优先
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+LLM_RATE_LIMIT_ENABLED = os.getenv('LLM_RATE_LIMIT_ENABLED', 'true').lower() in ('true', '1', 'yes', 'on')
+# 获取执行许可的最长等待时间（秒）
+LLM_RATE_LIMIT_ACQUIRE_TIMEOUT = float(os.getenv('LLM_RATE_LIMIT_ACQUIRE_TIMEOUT', '600'))
+# 两次乘性减小之间的最短间隔，避免同一波错误把并发压到最低
+_DECREASE_COOLDOWN = 5.0
+# 收到429且没有Retry-After时暂停发放许可的时间（秒）
+_DEFAULT_THROTTLE_PAUSE = 2.0
+
+# 各服务商默认配置：每分钟请求数、每分钟token数（0表示不限）、最大并发、延迟阈值（秒）
+_DEFAULT_PROVIDER_CONFIG = {
+    'qwen': {'rpm': 120, 'tpm': 300000, 'max_concurrency': 16, 'latency_threshold': 120},
+    'deepseek': {'rpm': 60, 'tpm': 0, 'max_concurrency': 8, 'latency_threshold': 150},
+    'gpt4o': {'rpm': 60, 'tpm': 0, 'max_concurrency': 8, 'latency_threshold': 150},
+}
+
+_current_priority: ContextVar[int] = ContextVar('llm_priority', default=PRIORITY_BULK)
+_current_slot: ContextVar[Optional['CallSlot']] = ContextVar('llm_call_slot', default=None)
+
+_STATUS_RE = re.compile(r'\b(429|5\d\d)\b')
+
+
+class LLMRateLimitTimeout(TimeoutError):
+    """等待限流许可超时"""
+    pass
+
+
+def _provider_config(provider: str) -> Dict[str, float]:
+    """读取服务商配置，环境变量 LLM_RATE_<PROVIDER>_<KEY> 可覆盖默认值"""
+    config = dict(_DEFAULT_PROVIDER_CONFIG.get(provider, _DEFAULT_PROVIDER_CONFIG['qwen']))
+    for key in list(config.keys()):
+        env_value = os.getenv(f'LLM_RATE_{provider.upper()}_{key.upper()}')
+        if env_value:
+            config[key] = float(env_value)
+    return config
+
+
+def classify_error(error: BaseException) -> str:
+    """
+    根据异常判断失败类型
+
+    Returns:
+        'throttled'（429）、'server_error'（5xx）、'timeout'（超时/流停滞）或 'error'（其他）
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, TimeoutError) or 'Timeout' in type(error).__name__:
+            return 'timeout'
+        status = getattr(error, 'status_code', None)
+        response = getattr(error, 'response', None)
+        if status is None and response is not None:
+            status = getattr(response, 'status_code', None)
+        if status is None:
+            match = _STATUS_RE.search(str(error))
+            if match and ('Error' in str(error) or 'error' in str(error)):
+                status = int(match.group(1))
+        if status == 429:
+            return 'throttled'
+        if isinstance(status, int) and 500 <= status < 600:
+            return 'server_error'
+        error = error.__cause__ or error.__context__
+    return 'error'
+
+
+class CallSlot:
+    """一次受限调用的句柄，未抛异常的失败响应（如返回429状态码）可通过它上报"""
+
+    def __init__(self):
+        self.outcome: Optional[str] = None
+        self.retry_after: Optional[float] = None
+        # 许可内任意一次HTTP请求（含网关与SDK的重试）遇到的429/5xx，重试成功后仍用于AIMD退避
+        self.congestion: Optional[str] = None
+        self.congestion_retry_after: Optional[float] = None
+
+    def mark_status(self, status_code: int, retry_after: Optional[float] = None) -> None:
+        """根据HTTP状态码记录调用结果"""
+        if status_code == 429:
+            self.outcome = 'throttled'
+            self.retry_after = retry_after
+        elif 500 <= status_code < 600:
+            self.outcome = 'server_error'
+
+    def note_attempt(self, status_code: int, retry_after: Optional[float] = None) -> None:
+        """记录许可内单次HTTP请求的状态码（429优先于5xx）"""
+        if status_code == 429:
+            self.congestion = 'throttled'
+            self.congestion_retry_after = max(retry_after or 0.0, self.congestion_retry_after or 0.0) or None
+        elif 500 <= status_code < 600 and self.congestion is None:
+            self.congestion = 'server_error'
+
+
+def report_http_status(status_code: int, retry_after: Optional[float] = None) -> None:
+    """网关每收到一次HTTP响应调用一次，把429/5xx上报给当前许可（不在许可内时忽略）"""
+    slot = _current_slot.get()
+    if slot is not None:
+        slot.note_attempt(status_code, retry_after)
+
+
+class ProviderLimiter:
+    """单个服务商的限流器（线程安全）"""
+
+    def __init__(self, provider: str, rpm: float, tpm: float, max_concurrency: float,
+                 latency_threshold: float, min_concurrency: int = 1):
+        self.provider = provider
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.min_concurrency = max(1, min_concurrency)
+        self.latency_threshold = latency_threshold
+
+        # 并发上限从最大值的一半起步，由AIMD自行调整
+        self._limit = float(max(self.min_concurrency, self.max_concurrency // 2))
+        self._in_flight = 0
+        self._request_tokens = float(max(1, rpm / 60)) if rpm else 0.0
+        self._token_tokens = float(tpm / 60) if tpm else 0.0
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._seq = itertools.count()
+
+        self.stats = {
+            'requests': 0,
+            'succeeded': 0,
+            'throttled': 0,
+            'server_errors': 0,
+            'timeouts': 0,
+            'errors': 0,
+            'slow': 0,
+            'decreases': 0,
+            'interactive_requests': 0,
+            'total_wait_ms': 0.0,
+            'total_latency_ms': 0.0
+        }
+
+    @property
+    def _request_capacity(self) -> float:
+        # 桶容量为1秒的配额（至少1个），允许小突发
+        return max(1.0, self.rpm / 60)
+
+    @property
+    def _token_capacity(self) -> float:
+        return self.tpm / 60
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.rpm:
+            self._request_tokens = min(self._request_capacity, self._request_tokens + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._token_tokens = min(self._token_capacity, self._token_tokens + elapsed * self.tpm / 60)
+
+    def _wait_time(self, now: float, needed_tokens: float) -> float:
+        """距离配额可能满足的估计时间（最多0.5秒，许可归还时也会被唤醒）"""
+        waits = []
+        if self._paused_until > now:
+            waits.append(self._paused_until - now)
+        if self.rpm and self._request_tokens < 1:
+            waits.append((1 - self._request_tokens) * 60 / self.rpm)
+        if self.tpm and self._token_tokens < needed_tokens:
+            waits.append((needed_tokens - self._token_tokens) * 60 / self.tpm)
+        return max(0.01, min(0.5, max(waits))) if waits else 0.5
+
+    def acquire(self, estimated_tokens: int = 0, priority: int = PRIORITY_BULK,
+                timeout: Optional[float] = None) -> float:
+        """
+        获取一个执行许可，阻塞直到轮到自己且配额充足
+
+        Returns:
+            等待时间（秒）
+
+        Raises:
+            LLMRateLimitTimeout: 等待超时
+        """
+        start = time.monotonic()
+        deadline = start + timeout if timeout else None
+        # 超过桶容量的请求在桶满时放行，避免永远等不到
+        needed_tokens = min(float(estimated_tokens or 0), self._token_capacity) if self.tpm else 0.0
+
+        with self._cond:
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if (self._waiters[0] == entry and
+                            self._in_flight < int(self._limit) and
+                            now >= self._paused_until and
+                            (not self.rpm or self._request_tokens >= 1) and
+                            (not self.tpm or self._token_tokens >= needed_tokens)):
+                        break
+                    wait_for = self._wait_time(now, needed_tokens)
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            raise LLMRateLimitTimeout(
+                                f"等待 {self.provider} 限流许可超时（{timeout:.0f}秒）")
+                        wait_for = min(wait_for, remaining)
+                    self._cond.wait(wait_for)
+            except BaseException:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+                raise
+
+            heapq.heappop(self._waiters)
+            if self.rpm:
+                self._request_tokens -= 1
+            if self.tpm:
+                self._token_tokens -= needed_tokens
+            self._in_flight += 1
+
+            waited = time.monotonic() - start
+            self.stats['requests'] += 1
+            self.stats['total_wait_ms'] += waited * 1000
+            if priority <= PRIORITY_INTERACTIVE:
+                self.stats['interactive_requests'] += 1
+            # 下一个等待者可能也能立即执行
+            self._cond.notify_all()
+            return waited
+
+    def release(self, latency: float, outcome: str = 'ok', retry_after: Optional[float] = None) -> None:
+        """
+        归还许可并根据结果调整并发上限
+
+        Args:
+            latency: 本次调用耗时（秒）
+            outcome: 'ok'、'throttled'、'server_error'、'timeout' 或 'error'
+            retry_after: 服务端要求的重试等待时间（秒）
+        """
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            self.stats['total_latency_ms'] += latency * 1000
+            now = time.monotonic()
+
+            if outcome == 'throttled':
+                self.stats['throttled'] += 1
+                self._paused_until = max(self._paused_until, now + (retry_after or _DEFAULT_THROTTLE_PAUSE))
+                self._decrease(now, "触发限流(429)")
+            elif outcome == 'server_error':
+                self.stats['server_errors'] += 1
+                self._decrease(now, "服务端错误(5xx)")
+            elif outcome == 'timeout':
+                self.stats['timeouts'] += 1
+                self._decrease(now, "请求超时")
+            elif outcome == 'ok':
+                self.stats['succeeded'] += 1
+                if self.latency_threshold and latency > self.latency_threshold:
+                    self.stats['slow'] += 1
+                    self._decrease(now, f"延迟过高({latency:.1f}s)")
+                else:
+                    # 加性增加：大约每完成“当前上限”个请求，上限加1
+                    self._limit = min(float(self.max_concurrency), self._limit + 1.0 / max(self._limit, 1.0))
+            else:
+                self.stats['errors'] += 1
+
+            self._cond.notify_all()
+
+    def _decrease(self, now: float, reason: str) -> None:
+        """乘性减小并发上限（冷却期内只减一次）"""
+        if now - self._last_decrease < _DECREASE_COOLDOWN:
+            return
+        self._last_decrease = now
+        old_limit = self._limit
+        self._limit = max(float(self.min_concurrency), self._limit / 2)
+        self.stats['decreases'] += 1
+        logger.warning(f"{self.provider} {reason}，并发上限 {old_limit:.1f} -> {self._limit:.1f}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self.stats)
+            stats['concurrency_limit'] = round(self._limit, 2)
+            stats['in_flight'] = self._in_flight
+            stats['waiting'] = len(self._waiters)
+            stats['avg_wait_ms'] = stats['total_wait_ms'] / stats['requests'] if stats['requests'] else 0.0
+            finished = (stats['succeeded'] + stats['throttled'] + stats['server_errors'] +
+                        stats['timeouts'] + stats['errors'])
+            stats['avg_latency_ms'] = stats['total_latency_ms'] / finished if finished else 0.0
+            return stats
+
+
+class LLMRateLimiter:
+    """进程级限流器，按服务商维护独立的 ProviderLimiter"""
+
+    def __init__(self, enabled: bool = LLM_RATE_LIMIT_ENABLED):
+        self.enabled = enabled
+        self._providers: Dict[str, ProviderLimiter] = {}
+        self._lock = threading.Lock()
+
+    def get_provider(self, provider: str) -> ProviderLimiter:
+        limiter = self._providers.get(provider)
+        if limiter is None:
+            with self._lock:
+                limiter = self._providers.get(provider)
+                if limiter is None:
+                    config = _provider_config(provider)
+                    limiter = ProviderLimiter(provider, **config)
+                    self._providers[provider] = limiter
+                    logger.info(f"创建 {provider} 限流器: {config}")
+        return limiter
+
+    @contextmanager
+    def limit(self, provider: str, estimated_tokens: int = 0, priority: Optional[int] = None):
+        """
+        在限流许可内执行一次大模型调用，排队等待、耗时和结果同时计入调用计量（llm_usage）
+
+        用法:
+            with llm_rate_limiter.limit('qwen', estimated_tokens=2000) as slot:
+                response = session.post(...)
+                slot.mark_status(response.status_code)
+                llm_usage.record_usage(model, usage=response.json().get('usage'))
+        """
+        slot = CallSlot()
+        with llm_usage.track_call(provider) as call:
+            limiter = None
+            if self.enabled:
+                limiter = self.get_provider(provider)
+                if priority is None:
+                    priority = _current_priority.get()
+                try:
+                    call.queue_wait = limiter.acquire(estimated_tokens, priority, LLM_RATE_LIMIT_ACQUIRE_TIMEOUT)
+                except LLMRateLimitTimeout:
+                    call.queue_wait = LLM_RATE_LIMIT_ACQUIRE_TIMEOUT
+                    call.outcome = 'queue_timeout'
+                    raise
+                if call.queue_wait > 1:
+                    logger.info(f"{provider} 调用等待限流许可 {call.queue_wait:.1f}s")
+
+            start = time.monotonic()
+            retry_after = None
+            slot_token = _current_slot.set(slot)
+            try:
+                yield slot
+            except Exception as e:
+                outcome = classify_error(e)
+                response = getattr(e, 'response', None)
+                headers = getattr(response, 'headers', None)
+                if headers and headers.get('retry-after'):
+                    try:
+                        retry_after = float(headers.get('retry-after'))
+                    except ValueError:
+                        pass
+                raise
+            except BaseException:
+                outcome = 'error'
+                raise
+            else:
+                outcome = slot.outcome or 'ok'
+                retry_after = slot.retry_after
+            finally:
+                _current_slot.reset(slot_token)
+                call.latency = time.monotonic() - start
+                call.outcome = outcome
+                if limiter is not None:
+                    # SDK/网关重试成功时最终结果是ok，但限流器仍需按重试前遇到的429/5xx退避
+                    limiter_outcome = outcome
+                    if slot.congestion and outcome not in ('throttled', 'server_error', 'timeout'):
+                        limiter_outcome = slot.congestion
+                    if limiter_outcome == 'throttled' and retry_after is None:
+                        retry_after = slot.congestion_retry_after
+                    limiter.release(call.latency, limiter_outcome, retry_after)
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """各服务商的限流统计"""
+        return {name: limiter.get_stats() for name, limiter in list(self._providers.items())}
+
+
+@contextmanager
+def interactive_priority():
+    """
+    将当前上下文中的大模型调用标记为交互式（优先通道）
+
+    注意：线程池中的任务不会自动继承该标记，需要在线程内重新设置或显式传入priority。
+    """
+    token = _current_priority.set(PRIORITY_INTERACTIVE)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+# 创建全局限流器实例
+llm_rate_limiter = LLMRateLimiter()
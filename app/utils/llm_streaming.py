@@ -0,0 +1,279 @@
+"""
+大模型流式响应工具
+- 增量解析流式输出中的JSON数组，每个顶层对象闭合时立即回调
+- 首token超时（TTFT）与token间隔超时看门狗，请求停滞时主动关闭流，而不是等满整个超时时间
+- 支持外部取消（对冲请求中落后的一方），取消后立即关闭流
+"""
+import os
+import json
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# 流式响应配置
+LLM_STREAMING_ENABLED = os.getenv('LLM_STREAMING_ENABLED', 'true').lower() in ('true', '1', 'yes', 'on')
+LLM_STREAM_FIRST_TOKEN_TIMEOUT = float(os.getenv('LLM_STREAM_FIRST_TOKEN_TIMEOUT', '30'))
+LLM_STREAM_INTER_TOKEN_TIMEOUT = float(os.getenv('LLM_STREAM_INTER_TOKEN_TIMEOUT', '15'))
+
+# 看门狗检查间隔（秒）
+_WATCHDOG_INTERVAL = 0.5
+
+
+class StreamStallError(TimeoutError):
+    """流式响应停滞（首token或token间隔超时）"""
+    pass
+
+
+class StreamCancelledError(Exception):
+    """流式调用被外部取消"""
+    pass
+
+
+class StreamResult(NamedTuple):
+    """流式调用结果"""
+    text: str
+    finish_reason: Optional[str]
+    objects: List[Dict[str, Any]]
+    usage: Optional[Any]
+    time_to_first_token: Optional[float]
+    elapsed: float
+
+
+class JsonObjectStreamParser:
+    """
+    增量JSON对象解析器
+
+    逐块输入模型输出，跟踪括号层级与字符串状态；顶层数组中的对象（或没有外层数组时的顶层对象）
+    一旦闭合就立即解析并返回，不需要等待整个数组结束。数组前后的说明文字、代码块标记会被忽略。
+    """
+
+    def __init__(self):
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._collecting = False
+        self._object_depth = 0
+        self._buffer: List[str] = []
+        self.objects: List[Dict[str, Any]] = []
+        self.invalid_objects = 0
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        输入一段新的输出文本
+
+        Returns:
+            本次新闭合的对象列表
+        """
+        emitted = []
+        for ch in chunk:
+            if self._collecting:
+                self._buffer.append(ch)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                # 结构外的引号属于说明文字，不进入字符串状态
+                if self._stack:
+                    self._in_string = True
+            elif ch == '[' or ch == '{':
+                if ch == '{' and not self._collecting and (not self._stack or self._stack == ['[']):
+                    self._collecting = True
+                    self._object_depth = len(self._stack)
+                    self._buffer = ['{']
+                self._stack.append(ch)
+            elif ch == ']' or ch == '}':
+                if self._stack:
+                    self._stack.pop()
+                if ch == '}' and self._collecting and len(self._stack) == self._object_depth:
+                    self._collecting = False
+                    obj = self._decode(''.join(self._buffer))
+                    self._buffer = []
+                    if obj is not None:
+                        emitted.append(obj)
+
+        self.objects.extend(emitted)
+        return emitted
+
+    @property
+    def is_incomplete(self) -> bool:
+        """输入是否停在未闭合的结构中（通常是输出被截断）"""
+        return self._collecting or bool(self._stack)
+
+    def _decode(self, text: str) -> Optional[Dict[str, Any]]:
+        """解析一个完整的对象文本，失败时留给整体解析流程处理"""
+        try:
+            obj = json.loads(text)
+        except ValueError:
+            self.invalid_objects += 1
+            logger.debug(f"流式对象解析失败，等待整体解析: {text[:100]}")
+            return None
+        return obj if isinstance(obj, dict) else None
+
+
+class _StreamWatchdog(threading.Thread):
+    """监控流式响应的首token与token间隔，超时后关闭流使读取线程立即退出"""
+
+    def __init__(self, first_token_timeout: float, inter_token_timeout: float,
+                 cancel_event: Optional[threading.Event] = None):
+        super().__init__(name="llm_stream_watchdog", daemon=True)
+        self.first_token_timeout = first_token_timeout
+        self.inter_token_timeout = inter_token_timeout
+        self.cancel_event = cancel_event
+        self.stall_reason: Optional[str] = None
+        self.cancelled = False
+        self._started_at = time.monotonic()
+        self._last_token_at: Optional[float] = None
+        self._stream = None
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def attach(self, stream) -> None:
+        """绑定流对象；如果在此之前已经超时，立即关闭"""
+        with self._lock:
+            self._stream = stream
+            stalled = self.stall_reason is not None or self.cancelled
+        if stalled:
+            self._close()
+
+    def touch(self) -> None:
+        """收到新token"""
+        self._last_token_at = time.monotonic()
+
+    def stop(self) -> None:
+        self._done.set()
+
+    def run(self) -> None:
+        while not self._done.wait(_WATCHDOG_INTERVAL):
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                self.cancelled = True
+                self._close()
+                return
+            now = time.monotonic()
+            if self._last_token_at is None:
+                if now - self._started_at > self.first_token_timeout:
+                    self.stall_reason = f"首token超时（{self.first_token_timeout:g}秒内未收到输出）"
+            elif now - self._last_token_at > self.inter_token_timeout:
+                self.stall_reason = f"token间隔超时（{self.inter_token_timeout:g}秒内没有新输出）"
+            if self.stall_reason:
+                self._close()
+                return
+
+    def _close(self) -> None:
+        with self._lock:
+            stream = self._stream
+        if stream is None:
+            return
+        try:
+            response = getattr(stream, 'response', None)
+            if response is not None:
+                response.close()
+            elif hasattr(stream, 'close'):
+                stream.close()
+        except Exception as e:
+            logger.debug(f"关闭停滞的流失败: {str(e)}")
+
+
+def stream_chat_completion(client, on_object: Optional[Callable[[Dict[str, Any]], None]] = None,
+                           first_token_timeout: Optional[float] = None,
+                           inter_token_timeout: Optional[float] = None,
+                           cancel_event: Optional[threading.Event] = None,
+                           **create_kwargs) -> StreamResult:
+    """
+    以流式方式调用 OpenAI 兼容的 chat.completions 接口
+
+    Args:
+        client: OpenAI 客户端
+        on_object: 输出中每个JSON对象闭合时的回调（在调用线程中执行）
+        first_token_timeout: 首token超时（秒）
+        inter_token_timeout: token间隔超时（秒）
+        cancel_event: 被设置时关闭流并中止调用
+        **create_kwargs: 传给 chat.completions.create 的参数（model、messages等）
+
+    Returns:
+        StreamResult: 完整文本、结束原因、已解析的对象等
+
+    Raises:
+        StreamStallError: 首token或token间隔超时
+        StreamCancelledError: cancel_event 被设置
+    """
+    first_token_timeout = first_token_timeout or LLM_STREAM_FIRST_TOKEN_TIMEOUT
+    inter_token_timeout = inter_token_timeout or LLM_STREAM_INTER_TOKEN_TIMEOUT
+    # 等待响应头阶段看门狗还拿不到流对象，由HTTP读超时兜底
+    create_kwargs.setdefault('timeout', httpx.Timeout(
+        connect=10.0,
+        read=max(first_token_timeout, inter_token_timeout),
+        write=10.0,
+        pool=first_token_timeout
+    ))
+
+    # 让最后一个分片带上token用量，供调用计量使用；openai==1.6.1 的 create 没有 stream_options 参数，
+    # 通过 extra_body 放进请求体。服务端不返回 usage 时由 llm_usage 按文本本地估算
+    extra_body = dict(create_kwargs.pop('extra_body', None) or {})
+    extra_body.setdefault('stream_options', {'include_usage': True})
+    create_kwargs['extra_body'] = extra_body
+
+    parser = JsonObjectStreamParser()
+    parts: List[str] = []
+    finish_reason = None
+    usage = None
+    time_to_first_token = None
+    start = time.monotonic()
+
+    watchdog = _StreamWatchdog(first_token_timeout, inter_token_timeout, cancel_event)
+    watchdog.start()
+    try:
+        stream = client.chat.completions.create(stream=True, **create_kwargs)
+        watchdog.attach(stream)
+        for chunk in stream:
+            if getattr(chunk, 'usage', None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
+            content = choice.delta.content if choice.delta else None
+            if not content:
+                continue
+
+            watchdog.touch()
+            if time_to_first_token is None:
+                time_to_first_token = time.monotonic() - start
+            parts.append(content)
+            for obj in parser.feed(content):
+                if on_object is not None:
+                    try:
+                        on_object(obj)
+                    except Exception as e:
+                        logger.warning(f"流式对象回调失败: {str(e)}")
+    except Exception as e:
+        if watchdog.cancelled:
+            raise StreamCancelledError("流式调用已取消") from e
+        if watchdog.stall_reason:
+            raise StreamStallError(f"流式响应停滞，已中止: {watchdog.stall_reason}") from e
+        raise
+    finally:
+        watchdog.stop()
+
+    if watchdog.cancelled and finish_reason is None:
+        raise StreamCancelledError("流式调用已取消")
+    if watchdog.stall_reason and finish_reason is None:
+        # 流被关闭时迭代可能正常结束，没有结束原因说明输出并不完整
+        raise StreamStallError(f"流式响应停滞，已中止: {watchdog.stall_reason}")
+
+    elapsed = time.monotonic() - start
+    logger.debug(f"流式响应完成: 首token {time_to_first_token or 0:.2f}s，总耗时 {elapsed:.2f}s，"
+                 f"解析到 {len(parser.objects)} 个对象，结束原因 {finish_reason}")
+    return StreamResult(''.join(parts), finish_reason, parser.objects, usage, time_to_first_token, elapsed)
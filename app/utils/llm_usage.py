@@ -0,0 +1,297 @@
+"""
+大模型调用计量
+每次经限流器发出的大模型调用都会记录模型、输入/输出token（优先取响应中的usage，否则本地估算）、
+排队等待、首字节时间、总耗时、重试次数和结果，并按全局、模型、用户和任务汇总。
+
+任务归属通过 contextvars 传递：任务线程进入 task_scope 后，其中发起的调用都计入该任务；
+切换到线程池时需要用 contextvars.copy_context().run 携带上下文。
+"""
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 保留最近多少个任务的汇总（任务本身也持有自己的汇总对象）
+LLM_USAGE_MAX_TASKS = int(os.getenv('LLM_USAGE_MAX_TASKS', '200'))
+
+# token估算与文本分类共用的字符范围（打包、限流、计量都使用本模块的 estimate_tokens，估算值不会互相偏离）
+HAN_CHARS = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+KANA_HANGUL_CHARS = '\u3040-\u30ff\uac00-\ud7af'
+HAN_RE = re.compile(f'[{HAN_CHARS}]')
+CJK_RE = re.compile(f'[{KANA_HANGUL_CHARS}{HAN_CHARS}]')
+
+_current_scope: ContextVar[Optional['UsageScope']] = ContextVar('llm_usage_scope', default=None)
+_current_call: ContextVar[Optional['CallRecord']] = ContextVar('llm_usage_call', default=None)
+
+
+def estimate_tokens(text: Any) -> int:
+    """本地估算token数（中日韩字符约1个token/字，其他字符约3.5个字符/token），支持消息列表"""
+    if isinstance(text, (list, tuple)):
+        return sum(estimate_tokens(message.get('content') if isinstance(message, dict) else message)
+                   for message in text)
+    if not text:
+        return 0
+    text = str(text)
+    cjk_count = len(CJK_RE.findall(text))
+    return int(cjk_count + (len(text) - cjk_count) / 3.5) + 1
+
+
+def _usage_value(usage: Any, *names: str) -> Optional[int]:
+    for name in names:
+        value = usage.get(name) if isinstance(usage, dict) else getattr(usage, name, None)
+        if isinstance(value, (int, float)):
+            return int(value)
+    return None
+
+
+class CallRecord:
+    """一次大模型调用的计量信息（在限流许可内填写）"""
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.model: Optional[str] = None
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.usage_source = 'none'  # 'usage'（响应中的usage）、'estimate'（本地估算）或 'none'
+        self.queue_wait = 0.0
+        self.time_to_first_byte: Optional[float] = None
+        self.latency = 0.0
+        self.http_attempts = 0
+        self.outcome = 'ok'
+
+    @property
+    def retries(self) -> int:
+        return max(0, self.http_attempts - 1)
+
+    def set_usage(self, usage: Any = None, prompt_text: Any = None, completion_text: Any = None) -> None:
+        """
+        记录token用量：usage 为响应中的 usage（OpenAI 对象或 DashScope 字典），
+        没有 usage 时按提示词和输出文本本地估算
+        """
+        if usage is not None:
+            prompt = _usage_value(usage, 'prompt_tokens', 'input_tokens')
+            completion = _usage_value(usage, 'completion_tokens', 'output_tokens')
+            if prompt is not None or completion is not None:
+                self.prompt_tokens = prompt or 0
+                self.completion_tokens = completion or 0
+                self.usage_source = 'usage'
+                return
+        if prompt_text is not None or completion_text is not None:
+            self.prompt_tokens = estimate_tokens(prompt_text)
+            self.completion_tokens = estimate_tokens(completion_text)
+            self.usage_source = 'estimate'
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'provider': self.provider,
+            'model': self.model,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'usage_source': self.usage_source,
+            'queue_wait_ms': round(self.queue_wait * 1000, 1),
+            'ttfb_ms': round(self.time_to_first_byte * 1000, 1) if self.time_to_first_byte is not None else None,
+            'latency_ms': round(self.latency * 1000, 1),
+            'retries': self.retries,
+            'outcome': self.outcome,
+        }
+
+
+class UsageTotals:
+    """调用计量的累计值"""
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.estimated_calls = 0
+        self.queue_wait = 0.0
+        self.time_to_first_byte = 0.0
+        self.ttfb_samples = 0
+        self.latency = 0.0
+        self.retries = 0
+        self.outcomes: Dict[str, int] = {}
+
+    def add(self, record: CallRecord) -> None:
+        self.calls += 1
+        self.prompt_tokens += record.prompt_tokens or 0
+        self.completion_tokens += record.completion_tokens or 0
+        if record.usage_source != 'usage':
+            self.estimated_calls += 1
+        self.queue_wait += record.queue_wait
+        if record.time_to_first_byte is not None:
+            self.time_to_first_byte += record.time_to_first_byte
+            self.ttfb_samples += 1
+        self.latency += record.latency
+        self.retries += record.retries
+        self.outcomes[record.outcome] = self.outcomes.get(record.outcome, 0) + 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'calls': self.calls,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'total_tokens': self.prompt_tokens + self.completion_tokens,
+            'estimated_calls': self.estimated_calls,
+            'queue_wait_ms': round(self.queue_wait * 1000, 1),
+            'latency_ms': round(self.latency * 1000, 1),
+            'avg_queue_wait_ms': round(self.queue_wait / self.calls * 1000, 1) if self.calls else 0.0,
+            'avg_ttfb_ms': round(self.time_to_first_byte / self.ttfb_samples * 1000, 1) if self.ttfb_samples else None,
+            'avg_latency_ms': round(self.latency / self.calls * 1000, 1) if self.calls else 0.0,
+            'retries': self.retries,
+            'outcomes': dict(self.outcomes),
+        }
+
+
+class UsageScope:
+    """单个任务的调用计量（总计 + 按模型）"""
+
+    def __init__(self, task_id: str, user_id: Any = None):
+        self.task_id = task_id
+        self.user_id = user_id
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.totals = UsageTotals()
+        self.by_model: Dict[str, UsageTotals] = {}
+        self._lock = threading.Lock()
+
+    def add(self, record: CallRecord) -> None:
+        with self._lock:
+            self.totals.add(record)
+            self.by_model.setdefault(record.model or record.provider, UsageTotals()).add(record)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            result = self.totals.to_dict()
+            result['by_model'] = {model: totals.to_dict() for model, totals in self.by_model.items()}
+        result['task_id'] = self.task_id
+        result['user_id'] = self.user_id
+        end = self.finished_at or time.time()
+        result['wall_time_s'] = round(end - self.started_at, 2)
+        return result
+
+    def summary(self) -> str:
+        """一行文字摘要，用于任务日志"""
+        stats = self.to_dict()
+        return (f"大模型调用 {stats['calls']} 次，输入 {stats['prompt_tokens']} / 输出 {stats['completion_tokens']} token"
+                f"{'（含估算）' if stats['estimated_calls'] else ''}，排队 {stats['queue_wait_ms'] / 1000:.1f}s，"
+                f"调用耗时 {stats['latency_ms'] / 1000:.1f}s，重试 {stats['retries']} 次")
+
+
+class LLMUsageTracker:
+    """进程级调用计量（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = UsageTotals()
+        self._by_model: Dict[str, UsageTotals] = {}
+        self._by_user: Dict[Any, UsageTotals] = {}
+        self._tasks: 'OrderedDict[str, UsageScope]' = OrderedDict()
+
+    @contextmanager
+    def task_scope(self, task_id: str, user_id: Any = None):
+        """
+        将当前上下文中的大模型调用计入指定任务
+
+        用法:
+            with llm_usage.task_scope(task.task_id, task.user_id) as usage:
+                task.llm_usage = usage
+                ...
+        """
+        scope = UsageScope(task_id, user_id)
+        with self._lock:
+            self._tasks[task_id] = scope
+            self._tasks.move_to_end(task_id)
+            while len(self._tasks) > LLM_USAGE_MAX_TASKS:
+                self._tasks.popitem(last=False)
+        token = _current_scope.set(scope)
+        try:
+            yield scope
+        finally:
+            _current_scope.reset(token)
+            scope.finished_at = time.time()
+
+    @contextmanager
+    def track_call(self, provider: str):
+        """
+        记录一次大模型调用（由限流器在许可内调用），产出的 CallRecord 可由调用方补充模型和用量
+        """
+        record = CallRecord(provider)
+        token = _current_call.set(record)
+        try:
+            yield record
+        finally:
+            _current_call.reset(token)
+            self._record(record)
+
+    def current_call(self) -> Optional[CallRecord]:
+        """当前上下文中进行中的调用（不在调用内时返回None）"""
+        return _current_call.get()
+
+    def record_usage(self, model: Optional[str] = None, usage: Any = None, prompt_text: Any = None,
+                     completion_text: Any = None, time_to_first_byte: Optional[float] = None) -> None:
+        """
+        在限流许可内补充当前调用的模型、token用量和首字节时间（不在调用内时忽略）
+
+        Args:
+            model: 实际使用的模型名
+            usage: 响应中的 usage，没有时按 prompt_text / completion_text 估算
+            prompt_text: 提示词文本或消息列表
+            completion_text: 模型输出文本
+            time_to_first_byte: 流式调用的首token时间（秒），覆盖网关记录的响应头时间
+        """
+        record = _current_call.get()
+        if record is None:
+            return
+        if model:
+            record.model = model
+        record.set_usage(usage, prompt_text, completion_text)
+        if time_to_first_byte is not None:
+            record.time_to_first_byte = time_to_first_byte
+
+    def note_http_attempt(self, time_to_headers: float) -> None:
+        """网关每发出一次HTTP请求调用一次，用于统计重试次数和首字节时间"""
+        record = _current_call.get()
+        if record is None:
+            return
+        record.http_attempts += 1
+        record.time_to_first_byte = time_to_headers
+
+    def _record(self, record: CallRecord) -> None:
+        scope = _current_scope.get()
+        with self._lock:
+            self._totals.add(record)
+            self._by_model.setdefault(record.model or record.provider, UsageTotals()).add(record)
+            if scope is not None and scope.user_id is not None:
+                self._by_user.setdefault(scope.user_id, UsageTotals()).add(record)
+        if scope is not None:
+            scope.add(record)
+        logger.debug(f"大模型调用计量: {record.to_dict()}")
+
+    def get_task_usage(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """指定任务的调用汇总（任务不在最近记录中时返回None）"""
+        with self._lock:
+            scope = self._tasks.get(task_id)
+        return scope.to_dict() if scope is not None else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """全局、按模型、按用户和最近任务的调用汇总"""
+        with self._lock:
+            stats = {
+                'total': self._totals.to_dict(),
+                'by_model': {model: totals.to_dict() for model, totals in self._by_model.items()},
+                'by_user': {str(user_id): totals.to_dict() for user_id, totals in self._by_user.items()},
+            }
+            scopes = list(self._tasks.values())
+        stats['tasks'] = {scope.task_id: scope.to_dict() for scope in scopes}
+        return stats
+
+
+# 全局调用计量
+llm_usage = LLMUsageTracker()
@@ -0,0 +1,388 @@
+"""
+LibreOffice headless 实例池
+- 池中每个实例使用独立的端口和 -env:UserInstallation 配置目录，多个任务可以同时操作文档
+- 任务通过 checkout() 借出实例，归还后供其他任务使用；借出期间当前上下文中的UNO连接都指向该实例
+- 借出超过期限的实例由看门狗强制结束（卡死的文档不会拖住其他任务），下次借出前重新启动
+- 处理的文档数或内存占用（RSS）超过阈值的实例在归还时回收重启
+"""
+import os
+import time
+import socket
+import atexit
+import logging
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+SOFFICE_POOL_ENABLED = os.getenv('SOFFICE_POOL_ENABLED', 'true').lower() in ('true', '1', 'yes', 'on')
+SOFFICE_POOL_SIZE = max(1, int(os.getenv('SOFFICE_POOL_SIZE', '2')))
+SOFFICE_POOL_BASE_PORT = int(os.getenv('SOFFICE_POOL_BASE_PORT', '2100'))
+SOFFICE_POOL_PROFILE_DIR = os.getenv('SOFFICE_POOL_PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'soffice_pool'))
+SOFFICE_PATH = os.getenv('SOFFICE_PATH', 'soffice')
+# 实例处理多少个文档后回收（0表示不限）
+SOFFICE_POOL_MAX_DOCUMENTS = int(os.getenv('SOFFICE_POOL_MAX_DOCUMENTS', '50'))
+# 实例（含子进程）RSS超过该值（MB）时回收（0表示不限）
+SOFFICE_POOL_MAX_RSS_MB = float(os.getenv('SOFFICE_POOL_MAX_RSS_MB', '1500'))
+# 等待空闲实例的最长时间（秒）
+SOFFICE_POOL_CHECKOUT_TIMEOUT = float(os.getenv('SOFFICE_POOL_CHECKOUT_TIMEOUT', '600'))
+# 单次借出的最长占用时间（秒），超过后强制结束实例；默认与任务超时（TASK_QUEUE_TIMEOUT）一致，
+# 短于任务超时会在大文件仍在正常处理时结束实例
+SOFFICE_POOL_CHECKOUT_DEADLINE = float(os.getenv('SOFFICE_POOL_CHECKOUT_DEADLINE',
+                                                 os.getenv('TASK_QUEUE_TIMEOUT', '3600')))
+# 实例启动后等待端口就绪的最长时间（秒）
+SOFFICE_POOL_START_TIMEOUT = float(os.getenv('SOFFICE_POOL_START_TIMEOUT', '30'))
+SOFFICE_POOL_WATCHDOG_INTERVAL = float(os.getenv('SOFFICE_POOL_WATCHDOG_INTERVAL', '5'))
+
+# 未借出实例时连接的默认服务（与原来的单实例部署一致）
+DEFAULT_UNO_PORT = 2002
+
+_current_worker: ContextVar[Optional['SofficeWorker']] = ContextVar('soffice_worker', default=None)
+
+
+class SofficePoolTimeout(TimeoutError):
+    """等待空闲实例超时"""
+    pass
+
+
+def uno_url(port: int) -> str:
+    """指定端口的UNO连接地址"""
+    return f"uno:socket,host=localhost,port={port};urp;StarOffice.ComponentContext"
+
+
+def current_uno_url() -> str:
+    """当前上下文借出的实例的UNO连接地址，没有借出实例时返回默认服务地址"""
+    worker = _current_worker.get()
+    return uno_url(worker.port if worker is not None else DEFAULT_UNO_PORT)
+
+
+def _port_listening(port: int, host: str = 'localhost', timeout: float = 1) -> bool:
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+class SofficeWorker:
+    """池中的一个 soffice 实例"""
+
+    def __init__(self, index: int, port: int, profile_dir: str):
+        self.index = index
+        self.port = port
+        self.profile_dir = profile_dir
+        self.process: Optional[subprocess.Popen] = None
+        self.started_at: Optional[float] = None
+        self.documents = 0
+        self.restarts = 0
+        self.busy = False
+        self.checked_out_at: Optional[float] = None
+        self.deadline: Optional[float] = None
+        # 下次借出前需要重启的原因（None 表示实例可直接使用）
+        self.restart_reason: Optional[str] = 'start'
+        self.killed_by_deadline = False
+
+    @property
+    def uno_url(self) -> str:
+        return uno_url(self.port)
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self.process.pid if self.process is not None else None
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def rss_bytes(self) -> int:
+        """实例进程及其子进程（soffice.bin）的RSS总和"""
+        if not self.is_alive():
+            return 0
+        try:
+            parent = psutil.Process(self.process.pid)
+            processes = [parent] + parent.children(recursive=True)
+        except psutil.Error:
+            return 0
+        total = 0
+        for proc in processes:
+            try:
+                total += proc.memory_info().rss
+            except psutil.Error:
+                continue
+        return total
+
+    def start(self) -> None:
+        """启动实例并等待端口就绪，失败时抛出 RuntimeError"""
+        self.stop()
+        if _port_listening(self.port):
+            # 端口被池外的进程占用（例如旧的单实例服务），换一个空闲端口
+            old_port, self.port = self.port, _free_port()
+            logger.warning(f"soffice实例 {self.index} 的端口 {old_port} 已被占用，改用端口 {self.port}")
+
+        os.makedirs(self.profile_dir, exist_ok=True)
+        cmd = [
+            SOFFICE_PATH,
+            f'-env:UserInstallation={Path(self.profile_dir).resolve().as_uri()}',
+            '--headless',
+            f'--accept=socket,host=localhost,port={self.port};urp;',
+            '--invisible',
+            '--nodefault',
+            '--nolockcheck',
+            '--nologo',
+            '--norestore',
+            '--nofirststartwizard',
+        ]
+        logger.info(f"启动soffice实例 {self.index}: 端口 {self.port}，配置目录 {self.profile_dir}")
+        self.process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                        start_new_session=True)
+
+        start = time.time()
+        while time.time() - start < SOFFICE_POOL_START_TIMEOUT:
+            if not self.is_alive():
+                raise RuntimeError(f"soffice实例 {self.index} 启动后立即退出（退出码 {self.process.returncode}）")
+            if _port_listening(self.port):
+                self.started_at = time.time()
+                self.documents = 0
+                self.restart_reason = None
+                self.killed_by_deadline = False
+                logger.info(f"soffice实例 {self.index} 就绪（PID {self.process.pid}），耗时 {time.time() - start:.1f} 秒")
+                return
+            time.sleep(0.5)
+        self.stop()
+        raise RuntimeError(f"soffice实例 {self.index} 在 {SOFFICE_POOL_START_TIMEOUT:.0f} 秒内未就绪")
+
+    def stop(self) -> None:
+        """强制结束实例进程及其子进程"""
+        process = self.process
+        if process is None:
+            return
+        try:
+            parent = psutil.Process(process.pid)
+            processes = parent.children(recursive=True) + [parent]
+        except psutil.Error:
+            processes = []
+        for proc in processes:
+            try:
+                proc.kill()
+            except psutil.Error:
+                continue
+        psutil.wait_procs(processes, timeout=5)
+        try:
+            process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"soffice实例 {self.index}（PID {process.pid}）未能及时退出")
+        if self.process is process:
+            self.process = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'index': self.index,
+            'port': self.port,
+            'pid': self.pid,
+            'alive': self.is_alive(),
+            'busy': self.busy,
+            'documents': self.documents,
+            'restarts': self.restarts,
+            'rss_mb': round(self.rss_bytes() / (1024 * 1024), 1),
+            'uptime_s': round(time.time() - self.started_at, 1) if self.started_at and self.is_alive() else None,
+            'busy_s': round(time.time() - self.checked_out_at, 1) if self.busy and self.checked_out_at else None,
+        }
+
+
+class SofficePool:
+    """soffice 实例池（线程安全，实例在首次借出时启动）"""
+
+    def __init__(self, size: int = SOFFICE_POOL_SIZE, base_port: int = SOFFICE_POOL_BASE_PORT,
+                 profile_dir: str = SOFFICE_POOL_PROFILE_DIR):
+        self.workers: List[SofficeWorker] = [
+            SofficeWorker(index, base_port + index, os.path.join(profile_dir, f'worker_{index}'))
+            for index in range(size)
+        ]
+        self._cond = threading.Condition()
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = False
+
+        # 统计
+        self._checkouts = 0
+        self._checkout_timeouts = 0
+        self._waiting = 0
+        self._wait_time = 0.0
+        self._max_wait = 0.0
+        self._restarts = 0
+        self._start_failures = 0
+        self._deadline_kills = 0
+        self._recycles: Dict[str, int] = {}
+
+    @contextmanager
+    def checkout(self, timeout: Optional[float] = None, deadline: Optional[float] = None):
+        """
+        借出一个实例，退出时归还；期间当前上下文中的UNO连接（current_uno_url）都指向该实例
+
+        用法:
+            with soffice_pool.checkout() as worker:
+                context = resolver.resolve(worker.uno_url)
+
+        Args:
+            timeout: 等待空闲实例的最长时间（秒），默认 SOFFICE_POOL_CHECKOUT_TIMEOUT
+            deadline: 最长占用时间（秒），超过后看门狗强制结束实例，默认 SOFFICE_POOL_CHECKOUT_DEADLINE
+
+        Raises:
+            SofficePoolTimeout: 等待超时
+            RuntimeError: 实例启动失败
+        """
+        worker = self._acquire(SOFFICE_POOL_CHECKOUT_TIMEOUT if timeout is None else timeout,
+                               SOFFICE_POOL_CHECKOUT_DEADLINE if deadline is None else deadline)
+        token = _current_worker.set(worker)
+        try:
+            yield worker
+        finally:
+            _current_worker.reset(token)
+            self._release(worker)
+
+    def _acquire(self, timeout: float, deadline: float) -> SofficeWorker:
+        self._ensure_watchdog()
+        wait_start = time.time()
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    worker = next((w for w in self.workers if not w.busy), None)
+                    if worker is not None:
+                        break
+                    remaining = timeout - (time.time() - wait_start)
+                    if remaining <= 0:
+                        self._checkout_timeouts += 1
+                        raise SofficePoolTimeout(f"等待空闲soffice实例超时（{timeout:g} 秒）")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            worker.busy = True
+
+        try:
+            # 新实例、被回收或意外退出的实例在借出前（重新）启动
+            if worker.restart_reason is None and not worker.is_alive():
+                worker.restart_reason = 'dead'
+            if worker.restart_reason is not None:
+                reason = worker.restart_reason
+                worker.start()
+                if reason != 'start':
+                    worker.restarts += 1
+                    with self._cond:
+                        self._restarts += 1
+                    logger.info(f"soffice实例 {worker.index} 已重启（原因: {reason}）")
+        except Exception:
+            with self._cond:
+                self._start_failures += 1
+                worker.busy = False
+                self._cond.notify()
+            raise
+
+        waited = time.time() - wait_start
+        with self._cond:
+            self._checkouts += 1
+            self._wait_time += waited
+            self._max_wait = max(self._max_wait, waited)
+            worker.checked_out_at = time.time()
+            worker.deadline = worker.checked_out_at + deadline if deadline else None
+        logger.debug(f"借出soffice实例 {worker.index}（端口 {worker.port}），等待 {waited:.2f} 秒")
+        return worker
+
+    def _release(self, worker: SofficeWorker) -> None:
+        worker.documents += 1
+        reason = None
+        if worker.killed_by_deadline:
+            reason = 'deadline'
+        elif not worker.is_alive():
+            reason = 'dead'
+        elif SOFFICE_POOL_MAX_DOCUMENTS and worker.documents >= SOFFICE_POOL_MAX_DOCUMENTS:
+            reason = 'documents'
+        elif SOFFICE_POOL_MAX_RSS_MB and worker.rss_bytes() > SOFFICE_POOL_MAX_RSS_MB * 1024 * 1024:
+            reason = 'rss'
+
+        if reason is not None:
+            logger.info(f"回收soffice实例 {worker.index}（原因: {reason}，已处理 {worker.documents} 个文档）")
+            # 先结束进程释放内存，下次借出时再启动
+            worker.stop()
+
+        with self._cond:
+            if reason is not None:
+                worker.restart_reason = reason
+                self._recycles[reason] = self._recycles.get(reason, 0) + 1
+            worker.busy = False
+            worker.checked_out_at = None
+            worker.deadline = None
+            self._cond.notify()
+
+    def _ensure_watchdog(self) -> None:
+        with self._cond:
+            if self._watchdog is not None:
+                return
+            self._watchdog = threading.Thread(target=self._watchdog_loop, name='soffice_pool_watchdog', daemon=True)
+            self._watchdog.start()
+            atexit.register(self.shutdown)
+
+    def _watchdog_loop(self) -> None:
+        """强制结束借出超过期限的实例，借出方的UNO调用随即失败并归还实例"""
+        while not self._stopped:
+            time.sleep(SOFFICE_POOL_WATCHDOG_INTERVAL)
+            now = time.time()
+            with self._cond:
+                expired = [w for w in self.workers
+                           if w.busy and w.deadline is not None and now > w.deadline and not w.killed_by_deadline]
+                for worker in expired:
+                    worker.killed_by_deadline = True
+                    self._deadline_kills += 1
+            for worker in expired:
+                logger.error(f"soffice实例 {worker.index}（PID {worker.pid}）借出 {now - worker.checked_out_at:.0f} 秒"
+                             f"超过期限，强制结束")
+                try:
+                    worker.stop()
+                except Exception as e:
+                    logger.error(f"结束soffice实例 {worker.index} 失败: {e}")
+
+    def shutdown(self) -> None:
+        """结束所有实例（进程退出时调用）"""
+        self._stopped = True
+        for worker in self.workers:
+            try:
+                worker.stop()
+            except Exception as e:
+                logger.warning(f"结束soffice实例 {worker.index} 失败: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """实例池统计：忙碌/空闲实例数、重启与回收次数、等待时间"""
+        with self._cond:
+            busy = sum(1 for w in self.workers if w.busy)
+            stats = {
+                'enabled': SOFFICE_POOL_ENABLED,
+                'size': len(self.workers),
+                'busy': busy,
+                'idle': len(self.workers) - busy,
+                'waiting': self._waiting,
+                'checkouts': self._checkouts,
+                'checkout_timeouts': self._checkout_timeouts,
+                'restarts': self._restarts,
+                'start_failures': self._start_failures,
+                'deadline_kills': self._deadline_kills,
+                'recycles': dict(self._recycles),
+                'avg_wait_ms': round(self._wait_time / self._checkouts * 1000, 1) if self._checkouts else 0.0,
+                'max_wait_ms': round(self._max_wait * 1000, 1),
+            }
+        stats['workers'] = [worker.to_dict() for worker in self.workers]
+        return stats
+
+
+# 全局实例池
+soffice_pool = SofficePool()
@@ -0,0 +1,409 @@
+"""
+翻译记忆库（Translation Memory）
+基于本地SQLite文件的持久化翻译缓存，位于所有大模型翻译调用之前。
+缓存键由规范化原文、语言对、模型和术语表指纹共同决定，支持TTL过期与LRU容量淘汰。
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+import re
+from typing import Dict, List, Optional, Iterable, Tuple, Any
+
+logger = logging.getLogger(__name__)
+
+# 项目根目录（app/utils -> app -> 根目录）
+_BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 翻译记忆库配置
+TRANSLATION_MEMORY_ENABLED = os.getenv('TRANSLATION_MEMORY_ENABLED', 'true').lower() in ('true', '1', 'yes', 'on')
+TRANSLATION_MEMORY_PATH = os.getenv(
+    'TRANSLATION_MEMORY_PATH',
+    os.path.join(_BASE_DIR, 'instance', 'translation_memory.db')
+)
+TRANSLATION_MEMORY_TTL_DAYS = int(os.getenv('TRANSLATION_MEMORY_TTL_DAYS', '90'))
+TRANSLATION_MEMORY_MAX_ENTRIES = int(os.getenv('TRANSLATION_MEMORY_MAX_ENTRIES', '500000'))
+
+# 每写入多少条检查一次容量，避免每次写入都做COUNT
+_CAPACITY_CHECK_INTERVAL = 1000
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_segment(text: str) -> str:
+    """
+    规范化原文片段，用于生成缓存键
+
+    只做不改变语义的处理：Unicode NFC、去除首尾空白、折叠连续空白。
+
+    Args:
+        text: 原文片段
+
+    Returns:
+        规范化后的文本
+    """
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFC', text)
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+def glossary_fingerprint(stop_words: Optional[Iterable[str]] = None,
+                         custom_translations: Optional[Dict[str, str]] = None,
+                         extra: str = '') -> str:
+    """
+    计算术语表指纹，术语表变化时缓存自动失效
+
+    Args:
+        stop_words: 停翻词列表
+        custom_translations: 自定义翻译字典
+        extra: 其他影响译文的上下文（如领域）
+
+    Returns:
+        16位十六进制指纹
+    """
+    payload = json.dumps({
+        'stop_words': sorted(set(stop_words or [])),
+        'custom_translations': sorted((custom_translations or {}).items()),
+        'extra': extra or ''
+    }, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def file_content_hash(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """计算文件内容的SHA-256，用作文档级缓存键"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_cache_key(source: str, source_language: str, target_language: str,
+                   model: str, glossary_fp: str = '') -> str:
+    """生成缓存键"""
+    raw = '\x1f'.join([
+        normalize_segment(source),
+        (source_language or '').lower(),
+        (target_language or '').lower(),
+        model or '',
+        glossary_fp or ''
+    ])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class TranslationMemory:
+    """基于SQLite的持久化翻译记忆库（线程安全）"""
+
+    def __init__(self, db_path: str = TRANSLATION_MEMORY_PATH,
+                 ttl_days: int = TRANSLATION_MEMORY_TTL_DAYS,
+                 max_entries: int = TRANSLATION_MEMORY_MAX_ENTRIES,
+                 enabled: bool = TRANSLATION_MEMORY_ENABLED):
+        """
+        初始化翻译记忆库，数据库连接延迟到首次使用时创建
+
+        Args:
+            db_path: SQLite数据库文件路径
+            ttl_days: 条目存活天数，<=0 表示不过期
+            max_entries: 最大条目数，超出后按最近访问时间淘汰
+            enabled: 是否启用
+        """
+        self.db_path = db_path
+        self.ttl_seconds = ttl_days * 86400 if ttl_days > 0 else 0
+        self.max_entries = max_entries
+        self.enabled = enabled
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        self._writes_since_check = 0
+
+        # 命中统计
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'writes': 0,
+            'expired': 0,
+            'evicted': 0,
+            'errors': 0
+        }
+
+    def _get_conn(self) -> sqlite3.Connection:
+        """获取（必要时创建）数据库连接"""
+        if self._conn is None:
+            db_dir = os.path.dirname(self.db_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS segments (
+                    cache_key TEXT PRIMARY KEY,
+                    source_text TEXT NOT NULL,
+                    target_text TEXT NOT NULL,
+                    source_language TEXT,
+                    target_language TEXT,
+                    model TEXT,
+                    glossary_fp TEXT,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hit_count INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_segments_last_access ON segments(last_access)')
+            # 文档级缓存：按文件内容哈希保存检测到的领域
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS document_fields (
+                    document_hash TEXT PRIMARY KEY,
+                    field TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            conn.commit()
+            self._conn = conn
+            logger.info(f"翻译记忆库已打开: {self.db_path}")
+        return self._conn
+
+    def get(self, source: str, source_language: str, target_language: str,
+            model: str, glossary_fp: str = '') -> Optional[str]:
+        """
+        查询单条译文
+
+        Returns:
+            命中时返回译文，否则返回None
+        """
+        if not source or not source.strip():
+            return None
+        return self.get_many([source], source_language, target_language, model, glossary_fp).get(source)
+
+    def get_many(self, sources: List[str], source_language: str, target_language: str,
+                 model: str, glossary_fp: str = '') -> Dict[str, str]:
+        """
+        批量查询译文
+
+        Args:
+            sources: 原文列表
+
+        Returns:
+            命中的 {原文: 译文} 字典
+        """
+        if not self.enabled or not sources:
+            return {}
+
+        key_to_sources: Dict[str, List[str]] = {}
+        for source in sources:
+            if source and source.strip():
+                key = make_cache_key(source, source_language, target_language, model, glossary_fp)
+                key_to_sources.setdefault(key, []).append(source)
+        if not key_to_sources:
+            return {}
+
+        now = time.time()
+        results: Dict[str, str] = {}
+        try:
+            with self._lock:
+                conn = self._get_conn()
+                keys = list(key_to_sources.keys())
+                rows = []
+                # SQLite 参数个数有限制，分块查询
+                for i in range(0, len(keys), 500):
+                    chunk = keys[i:i + 500]
+                    placeholders = ','.join('?' * len(chunk))
+                    rows.extend(conn.execute(
+                        f'SELECT cache_key, target_text, created_at FROM segments WHERE cache_key IN ({placeholders})',
+                        chunk
+                    ).fetchall())
+
+                hit_keys = []
+                expired_keys = []
+                for cache_key, target_text, created_at in rows:
+                    if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                        expired_keys.append(cache_key)
+                        continue
+                    hit_keys.append(cache_key)
+                    for source in key_to_sources[cache_key]:
+                        results[source] = target_text
+
+                if hit_keys:
+                    conn.executemany(
+                        'UPDATE segments SET last_access = ?, hit_count = hit_count + 1 WHERE cache_key = ?',
+                        [(now, k) for k in hit_keys]
+                    )
+                if expired_keys:
+                    conn.executemany('DELETE FROM segments WHERE cache_key = ?', [(k,) for k in expired_keys])
+                    self.stats['expired'] += len(expired_keys)
+                if hit_keys or expired_keys:
+                    conn.commit()
+
+                hit_count = sum(len(key_to_sources[k]) for k in hit_keys)
+                self.stats['hits'] += hit_count
+                self.stats['misses'] += sum(len(v) for v in key_to_sources.values()) - hit_count
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.warning(f"查询翻译记忆库失败，按未命中处理: {str(e)}")
+            return {}
+
+        return results
+
+    def put(self, source: str, target: str, source_language: str, target_language: str,
+            model: str, glossary_fp: str = '') -> None:
+        """写入单条译文"""
+        self.put_many([(source, target)], source_language, target_language, model, glossary_fp)
+
+    def put_many(self, pairs: Iterable[Tuple[str, str]], source_language: str, target_language: str,
+                 model: str, glossary_fp: str = '') -> None:
+        """
+        批量写入译文
+
+        Args:
+            pairs: (原文, 译文) 序列
+        """
+        if not self.enabled:
+            return
+
+        now = time.time()
+        rows = []
+        for source, target in pairs:
+            if not source or not source.strip() or not target:
+                continue
+            rows.append((
+                make_cache_key(source, source_language, target_language, model, glossary_fp),
+                normalize_segment(source), target,
+                source_language, target_language, model, glossary_fp,
+                now, now
+            ))
+        if not rows:
+            return
+
+        try:
+            with self._lock:
+                conn = self._get_conn()
+                conn.executemany('''
+                    INSERT INTO segments (cache_key, source_text, target_text, source_language,
+                                          target_language, model, glossary_fp, created_at, last_access)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(cache_key) DO UPDATE SET
+                        target_text = excluded.target_text,
+                        created_at = excluded.created_at,
+                        last_access = excluded.last_access
+                ''', rows)
+                conn.commit()
+                self.stats['writes'] += len(rows)
+
+                self._writes_since_check += len(rows)
+                if self._writes_since_check >= _CAPACITY_CHECK_INTERVAL:
+                    self._writes_since_check = 0
+                    self._enforce_capacity(conn)
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.warning(f"写入翻译记忆库失败: {str(e)}")
+
+    def get_document_field(self, document_hash: str) -> Optional[str]:
+        """
+        查询文档已检测过的领域
+
+        Returns:
+            命中且未过期时返回领域，否则返回None
+        """
+        if not self.enabled or not document_hash:
+            return None
+        try:
+            with self._lock:
+                row = self._get_conn().execute(
+                    'SELECT field, created_at FROM document_fields WHERE document_hash = ?', (document_hash,)
+                ).fetchone()
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.warning(f"查询文档领域缓存失败: {str(e)}")
+            return None
+        if row is None or (self.ttl_seconds and time.time() - row[1] > self.ttl_seconds):
+            return None
+        return row[0]
+
+    def put_document_field(self, document_hash: str, field: str) -> None:
+        """保存文档检测到的领域"""
+        if not self.enabled or not document_hash or not field:
+            return
+        try:
+            with self._lock:
+                conn = self._get_conn()
+                conn.execute('''
+                    INSERT INTO document_fields (document_hash, field, created_at) VALUES (?, ?, ?)
+                    ON CONFLICT(document_hash) DO UPDATE SET field = excluded.field, created_at = excluded.created_at
+                ''', (document_hash, field, time.time()))
+                conn.commit()
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.warning(f"保存文档领域缓存失败: {str(e)}")
+
+    def _enforce_capacity(self, conn: sqlite3.Connection) -> None:
+        """超出容量时按最近访问时间淘汰（LRU），淘汰到容量的90%"""
+        if self.max_entries <= 0:
+            return
+        total = conn.execute('SELECT COUNT(*) FROM segments').fetchone()[0]
+        if total <= self.max_entries:
+            return
+        to_remove = total - int(self.max_entries * 0.9)
+        conn.execute('''
+            DELETE FROM segments WHERE cache_key IN (
+                SELECT cache_key FROM segments ORDER BY last_access ASC LIMIT ?
+            )
+        ''', (to_remove,))
+        conn.commit()
+        self.stats['evicted'] += to_remove
+        logger.info(f"翻译记忆库超出容量，已淘汰 {to_remove} 条最久未使用的条目")
+
+    def purge_expired(self) -> int:
+        """
+        清理所有过期条目
+
+        Returns:
+            清理的条目数
+        """
+        if not self.enabled or not self.ttl_seconds:
+            return 0
+        try:
+            with self._lock:
+                conn = self._get_conn()
+                cutoff = time.time() - self.ttl_seconds
+                cursor = conn.execute('DELETE FROM segments WHERE created_at < ?', (cutoff,))
+                conn.execute('DELETE FROM document_fields WHERE created_at < ?', (cutoff,))
+                conn.commit()
+                removed = cursor.rowcount or 0
+                self.stats['expired'] += removed
+                self._enforce_capacity(conn)
+                return removed
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.warning(f"清理过期翻译记忆失败: {str(e)}")
+            return 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取命中统计信息"""
+        with self._lock:
+            stats = dict(self.stats)
+            lookups = stats['hits'] + stats['misses']
+            stats['hit_rate'] = stats['hits'] / lookups * 100 if lookups else 0.0
+            stats['enabled'] = self.enabled
+            stats['db_path'] = self.db_path
+            try:
+                if self.enabled:
+                    stats['entries'] = self._get_conn().execute('SELECT COUNT(*) FROM segments').fetchone()[0]
+            except Exception:
+                stats['entries'] = None
+            return stats
+
+    def close(self) -> None:
+        """关闭数据库连接"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# 创建全局翻译记忆库实例
+translation_memory = TranslationMemory()
@@ -27,6 +27,7 @@ from ..function.ppt_translate_async import process_presentation as process_prese
 from ..function.ppt_translate_async import process_presentation_add_annotations as process_presentation_add_annotations_async
 from ..utils.enhanced_task_queue import EnhancedTranslationQueue, TranslationTask, translation_queue
 from ..utils.thread_pool_executor import thread_pool, TaskType
+from ..utils.llm_rate_limiter import interactive_priority
 import logging
 import threading
 from datetime import datetime
@@ -1034,9 +1035,11 @@ def ocr_region():
         asyncio.set_event_loop(loop)
 
         try:
-            result = loop.run_until_complete(
-                ocr_image_region_async(image_data, 'auto')
-            )
+            # 交互式请求：其中的大模型调用走优先通道，不排在批量文档翻译之后
+            with interactive_priority():
+                result = loop.run_until_complete(
+                    ocr_image_region_async(image_data, 'auto')
+                )
             return jsonify(result)
         finally:
             loop.close()
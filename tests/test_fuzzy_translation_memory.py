@@ -0,0 +1,72 @@
+"""
+模糊翻译记忆的回归测试
+"""
+from app.utils.fuzzy_translation_memory import adapt_numbers, fuzzy_key
+
+
+def test_adapt_numbers_keeps_chinese_punctuation():
+    adapted = adapt_numbers('Revenue grew 5% in 2023, to 10 million.',
+                            '收入在2023年增长5%，达到10百万（含税）：',
+                            'Revenue grew 7% in 2024, to 12 million.')
+    assert adapted == '收入在2024年增长7%，达到12百万（含税）：'
+
+
+def test_adapt_numbers_replaces_fullwidth_digits_only():
+    adapted = adapt_numbers('Phase 2 of 3', '第２阶段（共3阶段）', 'Phase 1 of 3')
+    assert adapted == '第1阶段（共3阶段）'
+
+
+def test_adapt_numbers_unchanged_numbers_return_original_target():
+    target = '共3项：预算、进度、风险。'
+    assert adapt_numbers('3 items: budget, schedule, risk', target,
+                         '3 items: budget; schedule; risk') == target
+
+
+def test_adapt_numbers_rejects_numbers_missing_from_target():
+    assert adapt_numbers('Top 10 tips', '十大技巧', 'Top 12 tips') is None
+
+
+def test_fuzzy_key_ignores_number_values_and_inner_punctuation_only():
+    assert fuzzy_key('Revenue grew 5% in 2023.') == fuzzy_key('revenue grew 7%, in 2024')
+    assert fuzzy_key('The project is finished') != fuzzy_key('The project is not finished')
+
+
+def test_fuzzy_key_keeps_number_placeholders():
+    assert fuzzy_key('Revenue grew 5% in 2023') == 'revenue grew # in #'
+    assert fuzzy_key('a 5 b') != fuzzy_key('a b 5')
+    assert fuzzy_key('Top 10 risks in 2023') != fuzzy_key('Top risks in 10 2023')
+
+
+def test_fuzzy_key_keeps_sentence_final_punctuation():
+    assert fuzzy_key('Done?') != fuzzy_key('Done.')
+    assert fuzzy_key('完成？') != fuzzy_key('完成。')
+
+
+def test_question_is_not_reusable_for_statement():
+    from app.utils.fuzzy_translation_memory import NGramIndex
+    index = NGramIndex()
+    index.add('Is the review done?', '评审完成了吗？')
+    assert index.find_key(fuzzy_key('Is the review done.')) is None
+
+
+def test_ngram_index_finds_same_fuzzy_key_without_search():
+    from app.utils.fuzzy_translation_memory import NGramIndex
+    index = NGramIndex()
+    index.add('Revenue grew 5% in 2023.', '收入在2023年增长5%。')
+    doc_id = index.find_key(fuzzy_key('Revenue grew 7% in 2024'))
+    assert doc_id is not None
+    assert index.get(doc_id)[0] == 'Revenue grew 5% in 2023.'
+    assert index.find_key(fuzzy_key('Revenue fell 7% in 2024')) is None
+
+
+def test_ngram_index_search_with_capped_postings(monkeypatch):
+    from app.utils import fuzzy_translation_memory as ftm
+    index = ftm.NGramIndex()
+    index.add('The quarterly project review is finished today', '季度项目评审今天完成')
+    for word in ('alpha', 'beta', 'gamma', 'delta', 'omega', 'sigma', 'kappa', 'theta'):
+        index.add(f'The quarterly budget item {word} is pending approval', '预算待批')
+    key = fuzzy_key('The quarterly project review is not finished today')
+    exact = index.search(key, 0.7)
+    monkeypatch.setattr(ftm, 'FUZZY_TM_MAX_POSTINGS', 5)
+    assert index.search(key, 0.7) == exact
+    assert index.get(exact[0][1])[0] == 'The quarterly project review is finished today'